@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import argparse, sys
+import runpy
+from collections import OrderedDict
+
+
+# subcommand -> (module, help). The module is only imported when its subcommand is run.
+COMMANDS = OrderedDict([
+    ('render', ('PySplat.pysplat', 'calculate SPLAT maps of txsites (.qth)')),
+    ('split', ('PySplat.pysplat_split', 'split a SPLAT map into tiles')),
+    ('downsample', ('PySplat.pysplat_downsample', 'calculate lower zoom levels of tiles')),
+    ('merge', ('PySplat.pysplat_merge', 'merge the tiles of multiple sites')),
+    ('pipeline', ('PySplat.pysplat_pipeline', 'render, split and merge in a single step')),
+    ('worker', ('PySplat.pysplat_worker', 'distributed rendering using a shared directory')),
+    ('ingest', ('PySplat.pysplat_ingest', 'convert SPLAT maps into raster archives (.psr)')),
+    ('serve', ('PySplat.pysplat_server', 'render tiles on demand')),
+    ('query', ('PySplat.pysplat_query', 'query signal levels at positions')),
+    ('bestserver', ('PySplat.pysplat_bestserver', 'calculate best server and interference maps')),
+    ('stats', ('PySplat.pysplat_stats', 'calculate coverage statistics')),
+    ('contour', ('PySplat.pysplat_contour', 'export coverage as polygons')),
+])
+
+
+def list_backends(argv):
+    from PySplat.util.backends import BACKENDS, get_missing_requirements, resolve_backend
+
+    parser = argparse.ArgumentParser(prog='pysplat backends', description='show the available backends')
+    parser.add_argument('--calibrate', help='run the calibration and show the fastest backends of this machine', action='store_true')
+    args = parser.parse_args(argv)
+
+    for kind, backends in BACKENDS.items():
+        for name in backends:
+            missing = get_missing_requirements(kind, name)
+            state = 'missing: {0}'.format(', '.join(missing)) if missing else 'available'
+            print("{0:8} {1:10} {2}".format(kind, name, state))
+
+        if args.calibrate:
+            print("{0:8} {1:10} {2}".format(kind, 'auto', resolve_backend(kind, 'auto', recalibrate=True)))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    parser = argparse.ArgumentParser(prog='pysplat', description='RF calculations using SPLAT, and processing of the resulting tiles')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    for command, (_, command_help) in COMMANDS.items():
+        subparsers.add_parser(command, help=command_help, add_help=False)
+    subparsers.add_parser('backends', help='show the available backends', add_help=False)
+
+    # everything behind the subcommand is parsed by the subcommand itself
+    args = parser.parse_args(argv[:1])
+    if args.command is None:
+        parser.print_help()
+        sys.exit(1)
+
+    if args.command == 'backends':
+        list_backends(argv[1:])
+        return
+
+    sys.argv = ['pysplat {0}'.format(args.command)] + argv[1:]
+    runpy.run_module(COMMANDS[args.command][0], run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
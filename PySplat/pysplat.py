@@ -20,20 +20,25 @@ import argparse, sys, os
 import ntpath
 import logging
 import concurrent
+import shutil
 
 from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
 
 from PySplat.util.argparse_helper import check_thread_count
-from PySplat.util.splat import SplatQTH, run_splat
+from PySplat.util.instrumentation import metrics, add_instrumentation_arguments, start_instrumentation, finish_instrumentation
+from PySplat.util.job_journal import JobJournal
+from PySplat.util.scf_file import parse_scf_file, default_scf_data
+from PySplat.util.settings_file import parse_settings_file
+from PySplat.util.splat import SplatQTH, run_splat, estimate_range
 
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
-def create_qth_file_obj(file):
+def create_qth_file_obj(file, **kwargs):
     qth_name = ntpath.basename(file)[:-4]
 
     lrp_file = file[:-4] + ".lrp"  # location definition
@@ -52,10 +57,32 @@ def create_qth_file_obj(file):
     if not os.path.isfile(scf_file):
         scf_file = None
 
-    return SplatQTH(name=qth_name, qth_file=file, lrp_file=lrp_file, az_file=az_file, el_file=el_file)
+    # settings of the site override the ones we got from the command line
+    settings = {'range': kwargs.get('range', 100.), 'rx_height': kwargs.get('rx_height', 10.), 'auto_range': kwargs.get('auto_range', False)}
 
+    settings_file = file[:-4] + ".pysplat"  # pysplat settings
+    if os.path.isfile(settings_file):
+        site_settings = parse_settings_file(settings_file)
+        if 'range' in site_settings:
+            settings['auto_range'] = False
+        settings.update(site_settings)
 
-def get_qth_files(qht_file):
+    qth_obj = SplatQTH(name=qth_name, qth_file=file, lrp_file=lrp_file, az_file=az_file, el_file=el_file, scf_file=scf_file,
+                       range=settings['range'], rx_height=settings['rx_height'])
+
+    if settings['auto_range']:
+        qth_obj.range = estimate_range(qth_obj, settings['range'])
+
+    return qth_obj
+
+
+def add_range_arguments(parser):
+    parser.add_argument('-R', dest='range', type=float, default=100., help='limit range of calculation in km (default 100), upper limit for --auto-range')
+    parser.add_argument('-L', dest='rxheight', type=float, default=10., help='receiver height above ground in m (default 10)')
+    parser.add_argument('--auto-range', dest='autorange', help='estimate the range of every site from its ERP, frequency, antenna height and lowest signal level', action='store_true')
+
+
+def get_qth_files(qht_file, **kwargs):
     if not qht_file:
         return {}
 
@@ -72,7 +99,7 @@ def get_qth_files(qht_file):
             logger.error('invalid txsite file: "{single_qth_file}"'.format(single_qth_file=single_qth_file))
             continue;
 
-        new_splat_obj = create_qth_file_obj(single_qth_file)
+        new_splat_obj = create_qth_file_obj(single_qth_file, **kwargs)
 
         logger.info('Add TX-Site: {0}'.format(new_splat_obj))
 
@@ -81,6 +108,43 @@ def get_qth_files(qht_file):
     return qth_obj
 
 
+def render_site(qth, srtm_dir, output_dir, journal, resume=False, signal_levels=None):
+    output_file = os.path.join(output_dir, '{name}.ppm'.format(name=qth.name))
+    if signal_levels is not None:
+        output_file = os.path.join(output_dir, '{name}.psr'.format(name=qth.name))
+
+    if resume and journal.is_done('render', qth.name) and os.path.isfile(output_file):
+        logger.info('skip already rendered site: {0}'.format(qth.name))
+        return
+
+    journal.mark_running('render', qth.name)
+
+    try:
+        success = run_splat(qth, srtm_dir, os.path.splitext(output_file)[0] + ".ppm")
+        if success and signal_levels is not None:
+            # replace the .ppm by a compact raster archive
+            from PySplat.pysplat_ingest import ingest_ppm  # requires numpy
+            from PySplat.util.site_raster import SignalLevels
+
+            if qth.scf_file:
+                # SPLAT colored the map using the .scf file of this site, the archive stores those levels
+                signal_levels = SignalLevels(parse_scf_file(qth.scf_file))
+            ingest_ppm(os.path.splitext(output_file)[0] + ".ppm", signal_levels, remove_ppm=True)
+        elif success and qth.scf_file:
+            # the map has to be read using the colors of this site later on
+            shutil.copyfile(qth.scf_file, os.path.splitext(output_file)[0] + ".scf")
+    except Exception:
+        journal.mark_failed('render', qth.name)
+        raise
+
+    if success:
+        metrics.count('sites_rendered')
+        journal.mark_done('render', qth.name)
+    else:
+        metrics.count('sites_failed')
+        journal.mark_failed('render', qth.name)
+
+
 if __name__ == '__main__':
     try:
         parser = argparse.ArgumentParser()
@@ -88,26 +152,49 @@ if __name__ == '__main__':
         parser.add_argument('qth', nargs='+', help='txsite(s).qth', action='store')
         parser.add_argument('--out', dest='outputdir', default='./', help='output directory where we store the calculated data')
         parser.add_argument('--srtm', dest='srtmdir', default='./srtm', help='directory where srtm data is stored')
+        add_range_arguments(parser)
         parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads')
+        parser.add_argument('--resume', help='skip sites which were already rendered by a previous run', action='store_true')
+        parser.add_argument('--ingest', help='store the rendered maps as compact raster archive (.psr) instead of .ppm', action='store_true')
+        parser.add_argument('--scf', dest='scffile', help='scf file used to convert colors into signal levels when ingesting sites without their own .scf file')
         parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
         parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+        add_instrumentation_arguments(parser)
 
         args = parser.parse_args()
 
         if args.verbose:
             logger.setLevel(logging.INFO)
+            logging.getLogger('PySplat').setLevel(logging.INFO)
 
         if args.debug:
             logger.setLevel(logging.DEBUG)
+            logging.getLogger('PySplat').setLevel(logging.DEBUG)
 
-        qth_files = get_qth_files(args.qth)
+        start_instrumentation(args)
+
+        signal_levels = None
+        if args.ingest:
+            scf_data = default_scf_data
+            if args.scffile:
+                if os.path.isfile(args.scffile):
+                    scf_data = parse_scf_file(args.scffile)
+                else:
+                    print("not a existing file: {0}".format(args.scffile))
+                    sys.exit(1)
+            from PySplat.util.site_raster import SignalLevels  # requires numpy
+            signal_levels = SignalLevels(scf_data)
+
+        qth_files = get_qth_files(args.qth, range=args.range, rx_height=args.rxheight, auto_range=args.autorange)
+
+        journal = JobJournal(args.outputdir)
 
         with ThreadPoolExecutor(max_workers=args.threads) as executor:
             futures = []
             try:
                 # create threads
                 for qth in qth_files:
-                    futures += [executor.submit(run_splat, qth, args.srtmdir, os.path.join(args.outputdir, '{name}.ppm'.format(name=qth.name)))]
+                    futures += [executor.submit(render_site, qth, args.srtmdir, args.outputdir, journal, args.resume, signal_levels)]
 
                 # wait until finished
                 # TODO: http://stackoverflow.com/questions/29177490/how-do-you-kill-futures-once-they-have-started
@@ -116,5 +203,7 @@ if __name__ == '__main__':
             except Exception as e:
                 print("except: {0}".format(e))
 
+        finish_instrumentation(args)
+
     except KeyboardInterrupt:
         pass
\ No newline at end of file
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import argparse, sys, os
+import colorsys
+import json
+import logging
+import numpy
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from PySplat.pysplat_split import get_tile_range
+from PySplat.util.argparse_helper import check_thread_count, check_zoom_level
+from PySplat.util.instrumentation import metrics, add_instrumentation_arguments, start_instrumentation, finish_instrumentation
+from PySplat.util.job_journal import JobJournal
+from PySplat.util.mbtiles import MBTilesStore
+from PySplat.util.scf_file import parse_scf_file, default_scf_data
+from PySplat.util.site_raster import SignalLevels, open_site_raster, sample_tile_ranks
+from PySplat.util.tile_writer import TileWriter, JournalBatch, add_tile_writer_arguments
+
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+LAYERS = ('server', 'level', 'overlap', 'margin')
+
+_margin_steps = (0, 3, 6, 10, 20)  # upper bound of every margin class in dB (everything above is the last class)
+
+
+def get_site_colors(count):
+    # golden ratio steps of the hue, so neighbouring indices get well distinguishable colors
+    colors = []
+    for i in range(count):
+        (r, g, b) = colorsys.hsv_to_rgb((i * 0.618033988749895) % 1., 0.85, 0.95)
+        colors.append((int(r * 255), int(g * 255), int(b * 255)))
+    return colors
+
+
+def _palette_image(indices, colors):
+    '''
+    palette image, where index 0 is transparent and index i + 1 uses colors[i]
+
+    A palette only has 256 entries, so with more colors a RGBA image is created instead.
+    '''
+    if len(colors) > 255:
+        lookup = numpy.asarray([(255, 255, 255, 0)] + [color + (255,) for color in colors], dtype=numpy.uint8)
+        return Image.fromarray(lookup[indices], 'RGBA')
+
+    image = Image.fromarray(indices.astype(numpy.uint8), 'P')
+
+    palette = [255, 255, 255]
+    for color in colors:
+        palette += list(color)
+    image.putpalette(palette)
+    image.info['transparency'] = 0
+
+    return image
+
+
+class BestServerRenderer(object):
+    '''
+    computes serving site, strongest level, overlap count and margin to the second strongest site of a tile
+
+    All sites covering a tile are sampled into a single (sites, 256, 256) array of signal levels, which is then
+    reduced in one vectorized pass. Every site is read using its own signal levels (see open_site_raster),
+    signal_levels is only used for the colors of the level layer.
+    '''
+    def __init__(self, rasters, signal_levels, layers):
+        self.rasters = rasters
+        self.signal_levels = signal_levels
+        self.layers = layers
+        self.site_colors = get_site_colors(len(rasters))
+        self.overlap_colors = get_site_colors(len(rasters))[::-1]
+        self.margin_colors = [(255, 0, 0), (255, 128, 0), (255, 255, 0), (128, 255, 0), (0, 200, 0), (0, 128, 255)]
+
+    def get_sites_of_tile(self, xtile, ytile, zoom):
+        sites = []
+        for site_index, raster in enumerate(self.rasters):
+            (xtile_start, ytile_start, xtile_end, ytile_end) = get_tile_range(raster.geo_data, zoom)
+            if xtile_start <= xtile <= xtile_end and ytile_start <= ytile <= ytile_end:
+                sites.append(site_index)
+        return sites
+
+    def compute_tile(self, xtile, ytile, zoom):
+        sites = self.get_sites_of_tile(xtile, ytile, zoom)
+        if not sites:
+            return None
+
+        with metrics.timer('reproject'):
+            levels = []
+            for i in sites:
+                raster = self.rasters[i]
+                ranks = sample_tile_ranks(raster, xtile, ytile, zoom, raster.signal_levels)
+                levels.append(raster.signal_levels.ranks_to_levels(ranks))
+            levels = numpy.nan_to_num(numpy.stack(levels), nan=-numpy.inf)
+
+        with metrics.timer('best_server'):
+            overlap = numpy.isfinite(levels).sum(axis=0)
+            if not overlap.any():
+                return None
+
+            best = numpy.argmax(levels, axis=0)
+            best_level = numpy.take_along_axis(levels, best[numpy.newaxis], axis=0)[0]
+            server = numpy.where(overlap > 0, numpy.asarray(sites)[best] + 1, 0)
+
+            if len(sites) > 1:
+                second_level = -numpy.partition(-levels, 1, axis=0)[1]
+                with numpy.errstate(invalid='ignore'):
+                    margin = best_level - second_level
+            else:
+                margin = numpy.full(best_level.shape, numpy.inf, dtype=numpy.float32)
+
+        return {'server': server, 'best_level': best_level, 'overlap': overlap, 'margin': margin}
+
+    def render_layers(self, result):
+        images = {}
+
+        if 'server' in self.layers:
+            images['server'] = _palette_image(result['server'], self.site_colors)
+
+        if 'level' in self.layers:
+            best_rank = self.signal_levels.levels_to_ranks(result['best_level'])
+            images['level'] = Image.fromarray(self.signal_levels.ranks_to_rgba(best_rank), 'RGBA')
+
+        if 'overlap' in self.layers:
+            images['overlap'] = _palette_image(numpy.minimum(result['overlap'], len(self.overlap_colors)), self.overlap_colors)
+
+        if 'margin' in self.layers:
+            # margin classes are only of interest where at least two sites overlap
+            margin_class = numpy.searchsorted(numpy.asarray(_margin_steps, dtype=numpy.float32), result['margin']) + 1
+            margin_class[result['overlap'] < 2] = 0
+            images['margin'] = _palette_image(margin_class, self.margin_colors)
+
+        return images
+
+    def create_tile(self, xtile, ytile, zoom, tile_writers):
+        '''
+        compute a tile and hand over its layers to the tile writer of every layer, returns the futures of the writes
+        '''
+        result = self.compute_tile(xtile, ytile, zoom)
+        if result is None:
+            metrics.count('tiles_skipped')
+            return []
+
+        logger.debug("create tile: {0}/{1}/{2}".format(zoom, xtile, ytile))
+        return [tile_writers[layer].write(zoom, xtile, ytile, image) for layer, image in self.render_layers(result).items()]
+
+    def create_column(self, xtile, ytiles, zoom, tile_writers, batch=None):
+        with metrics.profile():
+            for ytile in ytiles:
+                for future in self.create_tile(xtile, ytile, zoom, tile_writers):
+                    if batch:
+                        batch.add(future)
+        if batch:
+            batch.close()
+
+    def get_tiles(self, zoom):
+        tiles = set()
+        for raster in self.rasters:
+            (xtile_start, ytile_start, xtile_end, ytile_end) = get_tile_range(raster.geo_data, zoom)
+            for xtile in range(xtile_start, xtile_end + 1):
+                for ytile in range(ytile_start, ytile_end + 1):
+                    tiles.add((xtile, ytile))
+        return sorted(tiles)
+
+    def write_legend(self, filename):
+        legend = {'sites': [{'index': i + 1, 'name': raster.name, 'color': color}
+                            for i, (raster, color) in enumerate(zip(self.rasters, self.site_colors))],
+                  'margin_classes_db': list(_margin_steps)}
+
+        with open(filename, "w") as file:
+            json.dump(legend, file, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('inputfiles', nargs='+', help='.ppm file(s) of the sites (.geo file is required next to it)', action='store')
+    parser.add_argument('outputdir', help='output directory where we store the calculated tiles (one subdirectory per layer)')
+    parser.add_argument('-z', dest='zoomlevel', nargs='+', type=check_zoom_level, default=[range(0, 12 + 1)], help='zoom levels to render (default 0-12)')
+    parser.add_argument('--layers', nargs='+', choices=LAYERS, default=list(LAYERS), help='layers to render (default all)')
+    parser.add_argument('--scf', dest='scffile', help='scf file used to convert colors into signal levels of sites without their own <site>.scf file, and colors of the level layer')
+    parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads')
+    parser.add_argument('--resume', help='skip tile columns which were already written by a previous run', action='store_true')
+    add_tile_writer_arguments(parser)
+    parser.add_argument('--mbtiles', help='store every layer inside <outputdir>/<layer>.mbtiles instead of a directory', action='store_true')
+    parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
+    parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+    add_instrumentation_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+        logging.getLogger('PySplat').setLevel(logging.INFO)
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger('PySplat').setLevel(logging.DEBUG)
+
+    start_instrumentation(args)
+
+    scf_data = default_scf_data
+    if args.scffile:
+        if os.path.isfile(args.scffile):
+            scf_data = parse_scf_file(args.scffile)
+        else:
+            print("not a existing file: {0}".format(args.scffile))
+            sys.exit(1)
+    signal_levels = SignalLevels(scf_data)
+
+    rasters = []
+    for filename in args.inputfiles:
+        if not os.path.isfile(filename):
+            print("file not found: \"{0}\"".format(filename))
+            sys.exit(1)
+        rasters.append(open_site_raster(filename, signal_levels))
+
+    zoom_levels_set = set()
+    for level in args.zoomlevel:
+        zoom_levels_set.update(level)
+    zoom_levels = sorted(zoom_levels_set)
+
+    if not os.path.exists(args.outputdir):
+        os.makedirs(args.outputdir)
+
+    renderer = BestServerRenderer(rasters, signal_levels, args.layers)
+    renderer.write_legend(os.path.join(args.outputdir, "legend.json"))
+
+    print("sites: {0}".format(", ".join(raster.name for raster in rasters)))
+    print("layers: {0}".format(", ".join(args.layers)))
+    print("levels: {0}".format(zoom_levels))
+
+    journal = JobJournal(args.outputdir)
+
+    tile_writers = {}
+    for layer in args.layers:
+        mbtiles = MBTilesStore(os.path.join(args.outputdir, layer + '.mbtiles'), layer) if args.mbtiles else None
+        tile_writers[layer] = TileWriter(os.path.join(args.outputdir, layer), threads=args.iothreads, dedup=args.dedup,
+                                         mbtiles=mbtiles)
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            for zoom in zoom_levels:
+                tiles = renderer.get_tiles(zoom)
+                logger.info("render {0} tiles for zoom level {1}".format(len(tiles), zoom))
+
+                columns = {}
+                for (xtile, ytile) in tiles:
+                    columns.setdefault(xtile, []).append(ytile)
+                for tile_writer in tile_writers.values():
+                    tile_writer.prepare_range(zoom, min(columns), max(columns))
+
+                futures = []
+                for xtile, ytiles in sorted(columns.items()):
+                    # every column of tiles is a batch inside the job journal, which is done when all layers are written
+                    batch_key = '{0}/{1}'.format(zoom, xtile)
+                    if args.resume and journal.is_done('bestserver', batch_key):
+                        logger.info("skip already written tiles: {0}".format(batch_key))
+                        continue
+
+                    batch = JournalBatch(journal, 'bestserver', batch_key)
+                    futures.append(executor.submit(renderer.create_column, xtile, ytiles, zoom, tile_writers, batch))
+                for future in futures:
+                    future.result()
+    finally:
+        for tile_writer in tile_writers.values():
+            tile_writer.close()
+
+    finish_instrumentation(args)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import argparse, sys, os
+import json
+import logging
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from PySplat.util.argparse_helper import check_thread_count, check_zoom_level
+from PySplat.util.atomic_file import write_file_atomic
+from PySplat.util.instrumentation import metrics, add_instrumentation_arguments, start_instrumentation, finish_instrumentation
+from PySplat.util.marching_squares import find_polygons, signed_area
+from PySplat.util.scf_file import parse_scf_file, default_scf_data
+from PySplat.util.site_raster import SignalLevels, open_site_raster, reduce_ranks
+
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def get_reduce_factor(raster, zoom):
+    # there is no reason to use a higher resolution than the pixels of the map at this zoom level
+    zoom_degree_per_pixel = 360. / (256 * 2 ** zoom)
+    bb = raster.geo_data['bb']
+    raster_degree_per_pixel = abs(bb[1][1] - bb[0][1]) / raster.width
+    return max(1, int(zoom_degree_per_pixel / raster_degree_per_pixel))
+
+
+def _to_geojson_ring(ring, transform, outer):
+    coordinates = numpy.empty(ring.shape)
+    coordinates[:, 0] = transform[0] + (ring[:, 0] + 0.5) * transform[1]
+    coordinates[:, 1] = transform[2] - (ring[:, 1] + 0.5) * transform[3]
+
+    # GeoJSON wants counterclockwise outer rings and clockwise holes
+    if (signed_area(coordinates) > 0) != outer:
+        coordinates = coordinates[::-1]
+
+    coordinates = numpy.round(coordinates, 6).tolist()
+    return coordinates + [coordinates[0]]
+
+
+def export_contours(raster, ranks, signal_levels, zoom, tolerance=1.):
+    '''
+    vectorize every SCF level of a site into (multi)polygons, simplified with tolerance pixels of the zoom level
+    '''
+    factor = get_reduce_factor(raster, zoom)
+    with metrics.timer('reproject'):
+        reduced = reduce_ranks(ranks, factor)
+
+    bb = raster.geo_data['bb']
+    transform = (bb[0][1], abs(bb[1][1] - bb[0][1]) / raster.width * factor,
+                 bb[0][0], abs(bb[1][0] - bb[0][0]) / raster.height * factor)
+
+    features = []
+    # weakest level first, so stronger levels are drawn on top
+    for rank in reversed(range(len(signal_levels))):
+        with metrics.timer('contour'):
+            polygons = find_polygons(reduced <= rank, tolerance)
+        if not polygons:
+            continue
+
+        color = '#{0:02x}{1:02x}{2:02x}'.format(*[int(c) for c in signal_levels.colors[rank]])
+        features.append({
+            'type': 'Feature',
+            'properties': {'site': raster.name, 'level': int(signal_levels.levels[rank]), 'color': color},
+            'geometry': {
+                'type': 'MultiPolygon',
+                'coordinates': [[_to_geojson_ring(ring, transform, i == 0) for (i, ring) in enumerate(polygon)]
+                                for polygon in polygons]
+            }
+        })
+
+    metrics.count('polygons_written', len(features))
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def export_site(raster, signal_levels, output_dir, zoom_levels, executor, tolerance=1.):
+    with metrics.timer('decode'):
+        ranks = numpy.asarray(raster.read_window_ranks(0, 0, raster.width, raster.height, signal_levels))
+
+    site_dir = os.path.join(output_dir, raster.name)
+    if not os.path.exists(site_dir):
+        os.makedirs(site_dir)
+
+    def export_zoom(zoom):
+        with metrics.profile():
+            feature_collection = export_contours(raster, ranks, signal_levels, zoom, tolerance)
+        filename = os.path.join(site_dir, "{0}.geojson".format(zoom))
+        write_file_atomic(filename, json.dumps(feature_collection, separators=(',', ':')).encode('utf-8'))
+        logger.info("write: {0}".format(filename))
+
+    for _ in executor.map(export_zoom, zoom_levels):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('inputfiles', nargs='+', help='.ppm file(s) of the sites (.geo file is required next to it)', action='store')
+    parser.add_argument('outputdir', help='output directory, where we store <site>/<zoom>.geojson')
+    parser.add_argument('-z', dest='zoomlevel', nargs='+', type=check_zoom_level, default=[range(0, 12 + 1)], help='zoom levels to export (default 0-12)')
+    parser.add_argument('--tolerance', type=float, default=1., help='simplification tolerance in pixels of the zoom level (default 1)')
+    parser.add_argument('--scf', dest='scffile', help='scf file used to convert colors into signal levels of sites without their own <site>.scf file')
+    parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads')
+    parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
+    parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+    add_instrumentation_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+        logging.getLogger('PySplat').setLevel(logging.INFO)
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger('PySplat').setLevel(logging.DEBUG)
+
+    start_instrumentation(args)
+
+    scf_data = default_scf_data
+    if args.scffile:
+        if os.path.isfile(args.scffile):
+            scf_data = parse_scf_file(args.scffile)
+        else:
+            logger.error("not a existing file: {0}".format(args.scffile))
+            sys.exit(1)
+
+    zoom_levels_set = set()
+    for level in args.zoomlevel:
+        zoom_levels_set.update(level)
+    zoom_levels = sorted(zoom_levels_set)
+
+    signal_levels = SignalLevels(scf_data)
+
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        for filename in args.inputfiles:
+            if not os.path.isfile(filename):
+                logger.error("file not found: \"{0}\"".format(filename))
+                sys.exit(1)
+
+            print("export contours of: {0}".format(filename))
+            raster = open_site_raster(filename, signal_levels)
+            export_site(raster, raster.signal_levels, args.outputdir, zoom_levels, executor, args.tolerance)
+
+    finish_instrumentation(args)
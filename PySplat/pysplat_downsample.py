@@ -23,7 +23,12 @@ from PIL import Image
 sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
 
 from PySplat.util.argparse_helper import check_thread_count, check_zoom_level
+from PySplat.util.atomic_file import save_image_atomic
+from PySplat.util.backends import load_backend, add_backend_arguments, get_backends
+from PySplat.util.instrumentation import metrics, add_instrumentation_arguments, start_instrumentation, finish_instrumentation
+from PySplat.util.job_journal import JobJournal
 from PySplat.util.slippy_map_math import deg2num, num2deg
+from PySplat.util.tile_writer import TileWriter, JournalBatch, add_tile_writer_arguments
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -33,17 +38,18 @@ _blank_image = Image.new('RGBA', (256, 256), color=(255, 255, 255, 0))
 
 
 def merge(image_tl, image_tr, image_bl, image_br):
-    result_image = Image.new('RGBA', (256*2, 256*2))
+    with metrics.timer('reproject'):
+        result_image = Image.new('RGBA', (256*2, 256*2))
 
-    result_image.paste(image_tl, (0, 0))
-    result_image.paste(image_tr, (256, 0))
-    result_image.paste(image_bl, (0, 256))
-    result_image.paste(image_br, (256, 256))
+        result_image.paste(image_tl, (0, 0))
+        result_image.paste(image_tr, (256, 0))
+        result_image.paste(image_bl, (0, 256))
+        result_image.paste(image_br, (256, 256))
 
-    return result_image.resize((256, 256))
+        return result_image.resize((256, 256))
 
 
-def downsample(base_dir, tile, zoom, base_zoom, zoom_levels):
+def downsample(base_dir, tile, zoom, base_zoom, zoom_levels, **kwargs):
     '''
     TODO: the algorithm is based on the idea of deep search, but we are currently searching way to much dead ends.
 
@@ -62,38 +68,102 @@ def downsample(base_dir, tile, zoom, base_zoom, zoom_levels):
         if not os.path.isfile(result_filename):
             #print("return empty: {0}".format(result_filename))
             return _blank_image
-        print("open: {0}".format(result_filename))
-        return Image.open(result_filename)
+        logger.debug("open: {0}".format(result_filename))
+        with metrics.timer('decode'):
+            image = Image.open(result_filename)
+            image.load()
+        return image
 
-    image_tl = downsample(base_dir, (tile[0] * 2, tile[1] * 2), zoom + 1, base_zoom, zoom_levels)
-    image_tr = downsample(base_dir, (tile[0] * 2 + 1, tile[1] * 2), zoom + 1, base_zoom, zoom_levels)
-    image_bl = downsample(base_dir, (tile[0] * 2, tile[1] * 2 + 1), zoom + 1, base_zoom, zoom_levels)
-    image_br = downsample(base_dir, (tile[0] * 2 + 1, tile[1] * 2 + 1), zoom + 1, base_zoom, zoom_levels)
+    image_tl = downsample(base_dir, (tile[0] * 2, tile[1] * 2), zoom + 1, base_zoom, zoom_levels, **kwargs)
+    image_tr = downsample(base_dir, (tile[0] * 2 + 1, tile[1] * 2), zoom + 1, base_zoom, zoom_levels, **kwargs)
+    image_bl = downsample(base_dir, (tile[0] * 2, tile[1] * 2 + 1), zoom + 1, base_zoom, zoom_levels, **kwargs)
+    image_br = downsample(base_dir, (tile[0] * 2 + 1, tile[1] * 2 + 1), zoom + 1, base_zoom, zoom_levels, **kwargs)
 
     if image_tl is _blank_image and\
        image_tr is _blank_image and\
        image_bl is _blank_image and \
        image_br is _blank_image:
         #print("return empty: {1}/{2}".format(base_dir, zoom, tile, base_zoom))
+        metrics.count('tiles_skipped')
         return _blank_image
 
-    print("downsample: {0}/{1}-{2} until {3}".format(base_dir, zoom, tile, base_zoom))
+    logger.info("downsample: {0}/{1}-{2} until {3}".format(base_dir, zoom, tile, base_zoom))
     new_img = merge(image_tl, image_tr, image_bl, image_br)
 
-    if not os.path.exists(result_dir):
-        logger.debug("create directory: {0}".format(result_dir))
-        os.makedirs(result_dir)
-
     if zoom in zoom_levels:
-        new_img.save(result_filename, "PNG")
+        tile_writer = kwargs.get('tile_writer')
+        if tile_writer is not None:
+            future = tile_writer.write(zoom, tile[0], tile[1], new_img)
+            if kwargs.get('batch') is not None:
+                kwargs['batch'].add(future)
+        else:
+            if not os.path.exists(result_dir):
+                logger.debug("create directory: {0}".format(result_dir))
+                os.makedirs(result_dir, exist_ok=True)
+
+            save_image_atomic(new_img, result_filename, "PNG")
+            metrics.count('tiles_written')
 
     return new_img
 
 
-def start_downsampling(base_dir, base_zoom, zoom_levels):
-    for x in range(2 ** zoom_levels[0]):
-        for y in range(2 ** zoom_levels[0]):
-            downsample(base_dir, (x, y), zoom_levels[0], base_zoom, zoom_levels)
+def downsample_tiles(tiles, base_zoom, zoom_levels):
+    '''
+    in-memory variant of downsample: takes a dict {(x, y): image} of tiles at base_zoom and yields
+    (zoom, (x, y), image) for every tile of the requested lower zoom levels. Only one zoom level is kept in RAM.
+    '''
+    current_tiles = tiles
+    for zoom in range(base_zoom - 1, min(zoom_levels) - 1, -1):
+        parent_tiles = {}
+        for (x, y) in set((x // 2, y // 2) for (x, y) in current_tiles.keys()):
+            parent_tiles[(x, y)] = merge(current_tiles.get((x * 2, y * 2), _blank_image),
+                                         current_tiles.get((x * 2 + 1, y * 2), _blank_image),
+                                         current_tiles.get((x * 2, y * 2 + 1), _blank_image),
+                                         current_tiles.get((x * 2 + 1, y * 2 + 1), _blank_image))
+
+        if zoom in zoom_levels:
+            for tile, image in parent_tiles.items():
+                yield (zoom, tile, image)
+
+        current_tiles = parent_tiles
+
+
+def prepare_columns(tile_writer, base_dir, base_zoom, zoom_levels):
+    '''
+    create the directories of all tile columns which can get tiles, these are the parents of the base columns
+    '''
+    base_level_dir = os.path.join(base_dir, str(base_zoom))
+    if not os.path.isdir(base_level_dir):
+        return
+
+    base_columns = [int(xtile) for xtile in os.listdir(base_level_dir) if xtile.isdigit()]
+    for zoom in zoom_levels:
+        if zoom < base_zoom:
+            for xtile in sorted(set(xtile >> (base_zoom - zoom) for xtile in base_columns)):
+                tile_writer.prepare_range(zoom, xtile, xtile)
+
+
+def start_downsampling(base_dir, base_zoom, zoom_levels, journal=None, resume=False, io_threads=4, dedup=False, encoder=None):
+    tile_writer = TileWriter(base_dir, threads=io_threads, dedup=dedup, encoder=encoder)
+    prepare_columns(tile_writer, base_dir, base_zoom, zoom_levels)
+
+    try:
+        for x in range(2 ** zoom_levels[0]):
+            for y in range(2 ** zoom_levels[0]):
+                # every tile of the lowest zoom level (including all its children) is a batch inside the job journal
+                batch_key = '{0}/{1}/{2}:{3}'.format(zoom_levels[0], x, y, base_zoom)
+                if resume and journal.is_done('downsample', batch_key):
+                    continue
+
+                batch = JournalBatch(journal, 'downsample', batch_key) if journal else None
+
+                with metrics.profile():
+                    downsample(base_dir, (x, y), zoom_levels[0], base_zoom, zoom_levels, tile_writer=tile_writer, batch=batch)
+
+                if batch:
+                    batch.close()
+    finally:
+        tile_writer.close()
 
 
 if __name__ == '__main__':
@@ -103,21 +173,29 @@ if __name__ == '__main__':
     parser.add_argument('basic_zoom', type=int, help='zoom level our calculations are based')
     parser.add_argument('-z', dest='zoomlevel', nargs='+', type=check_zoom_level,  default=None, help='zoom levels to render (default 0-12)')
     #parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads')
+    add_tile_writer_arguments(parser)
+    add_backend_arguments(parser, ['encode'])
+    parser.add_argument('--resume', help='skip tile batches which were already written by a previous run', action='store_true')
     parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
     parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
     # parser.add_argument('--gpu', help='run downsample algorihm using gpu', action='store_true')
+    add_instrumentation_arguments(parser)
     # TODO: delete old tiles of outputdir (if they are not going to be overwritten)
 
     args = parser.parse_args()
 
+    start_instrumentation(args)
+
     if args.zoomlevel is None:
         args.zoomlevel = [range(0, args.basic_zoom)]
 
     if args.verbose:
         logger.setLevel(logging.INFO)
+        logging.getLogger('PySplat').setLevel(logging.INFO)
 
     if args.debug:
         logger.setLevel(logging.DEBUG)
+        logging.getLogger('PySplat').setLevel(logging.DEBUG)
 
     if not os.path.exists(args.dir):
         print("directory does not exist: {0}".format(args.dir))
@@ -139,4 +217,11 @@ if __name__ == '__main__':
 
     print("parse zoomlevels: {0}".format(zoom_levels))
 
-    start_downsampling(args.dir, args.basic_zoom, zoom_levels)
+    journal = JobJournal(args.dir)
+
+    backends = get_backends(args, ['encode'])
+
+    start_downsampling(args.dir, args.basic_zoom, zoom_levels, journal, args.resume, args.iothreads, args.dedup,
+                       load_backend('encode', backends['encode']))
+
+    finish_instrumentation(args)
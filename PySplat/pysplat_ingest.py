@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+import argparse, sys, os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from PySplat.util.argparse_helper import check_thread_count
+from PySplat.util.instrumentation import metrics, add_instrumentation_arguments, start_instrumentation, finish_instrumentation
+from PySplat.util.raster_archive import write_raster_archive
+from PySplat.util.scf_file import parse_scf_file, default_scf_data
+from PySplat.util.site_raster import PPMSiteRaster, SignalLevels, get_site_signal_levels
+
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def ingest_ppm(ppm_file, signal_levels, output_dir=None, executor=None, remove_ppm=False):
+    '''
+    convert a SPLAT map (.ppm and .geo) into a compact raster archive (.psr), returns the filename of the archive
+
+    The colors are converted using the <site>.scf file next to the map, signal_levels are used when there is none.
+    '''
+    geo_file = os.path.splitext(ppm_file)[0] + ".geo"
+    archive_file = os.path.splitext(ppm_file)[0] + ".psr"
+    if output_dir:
+        archive_file = os.path.join(output_dir, os.path.basename(archive_file))
+
+    signal_levels = get_site_signal_levels(ppm_file, signal_levels)
+    with metrics.timer('ingest'):
+        write_raster_archive(archive_file, PPMSiteRaster(ppm_file, geo_file, signal_levels), signal_levels, executor=executor)
+
+    logger.info("ingest {0} into {1} ({2:.1f} MB -> {3:.1f} MB)".format(
+        ppm_file, archive_file, os.path.getsize(ppm_file) / 2**20, os.path.getsize(archive_file) / 2**20))
+
+    if remove_ppm:
+        os.remove(ppm_file)
+        os.remove(geo_file)
+
+    return archive_file
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('inputfiles', nargs='+', help='.ppm file(s) which should be converted (.geo file is required next to it)', action='store')
+    parser.add_argument('--out', dest='outputdir', help='output directory (default: next to the .ppm file)')
+    parser.add_argument('--scf', dest='scffile', help='scf file used to convert colors into signal levels of sites without their own <site>.scf file')
+    parser.add_argument('--remove-ppm', dest='removeppm', help='remove .ppm and .geo file after conversion', action='store_true')
+    parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads')
+    parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
+    parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+    add_instrumentation_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+        logging.getLogger('PySplat').setLevel(logging.INFO)
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger('PySplat').setLevel(logging.DEBUG)
+
+    start_instrumentation(args)
+
+    scf_data = default_scf_data
+    if args.scffile:
+        if os.path.isfile(args.scffile):
+            scf_data = parse_scf_file(args.scffile)
+        else:
+            logger.error("not a existing file: {0}".format(args.scffile))
+            sys.exit(1)
+
+    if args.outputdir and not os.path.exists(args.outputdir):
+        os.makedirs(args.outputdir)
+
+    signal_levels = SignalLevels(scf_data)
+
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        for ppm_file in args.inputfiles:
+            if not os.path.isfile(ppm_file) or not os.path.isfile(os.path.splitext(ppm_file)[0] + ".geo"):
+                logger.error(".ppm or .geo file not found: \"{0}\"".format(ppm_file))
+                sys.exit(1)
+
+            print("ingest: {0}".format(ppm_file))
+            ingest_ppm(ppm_file, signal_levels, args.outputdir, executor, args.removeppm)
+
+    finish_instrumentation(args)
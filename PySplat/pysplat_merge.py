@@ -22,18 +22,15 @@ from PIL import Image
 from concurrent.futures import ThreadPoolExecutor
 import time
 
-try:
-    import pyopencl as cl
-    import numpy
-    cl_support = True
-except ImportError:
-    cl_support = False
-
-
 sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
 
 from PySplat.util.argparse_helper import check_thread_count
+from PySplat.util.atomic_file import save_image_atomic
+from PySplat.util.backends import load_backend, add_backend_arguments, get_backends
+from PySplat.util.instrumentation import metrics, add_instrumentation_arguments, start_instrumentation, finish_instrumentation
+from PySplat.util.job_journal import JobJournal
 from PySplat.util.scf_file import parse_scf_file, default_scf_data, get_sorted_pixel_order
+from PySplat.util.tile_writer import TileWriter, JournalBatch, add_tile_writer_arguments
 
 
 logging.basicConfig(level=logging.WARNING)
@@ -41,8 +38,9 @@ logger = logging.getLogger(__name__)
 
 
 class TileMerger(object):
-    def __init__(self, image_order, threads):
+    def __init__(self, image_order, threads, tile_writer=None):
         self._image_order = image_order
+        self._tile_writer = tile_writer
         self._max_queue_size = threads * 4
         self._executor = ThreadPoolExecutor(max_workers=threads)
 
@@ -50,27 +48,45 @@ class TileMerger(object):
         while self._executor._work_queue.qsize() > self._max_queue_size:
             time.sleep(.01) # TODO: better apporach
 
-        print("submit tile: \"{0}\" using {1} source tiles".format(destination, len(sources)))
-        self._executor.submit(self.merge_images, sources, destination)
+        logger.debug("submit tile: \"{0}\" using {1} source tiles".format(destination, len(sources)))
+        return self._executor.submit(self.merge_images, sources, destination)
 
     def wait_until_empty(self):
         while not self._executor._work_queue.empty():
             time.sleep(.01)
 
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
     def merge_images(self, sources, destination):
-        print("calculate tile: \"{0}\" using {1}".format(destination, sources))
+        '''
+        merge the source tiles into destination, returns the future of the write when a tile writer is used
+        '''
+        with metrics.profile():
+            return self._merge_images(sources, destination)
+
+    def _merge_images(self, sources, destination):
+        logger.info("calculate tile: \"{0}\" using {1}".format(destination, sources))
         source_images = []
 
-        for single_source in sources:
-            new_image = Image.open(single_source)
-            source_images += [new_image]
+        with metrics.timer('decode'):
+            for single_source in sources:
+                new_image = Image.open(single_source)
+                new_image.load()
+                source_images += [new_image]
 
         if len(source_images) > 1:
-            destination_image = self.merge_loaded_images(source_images)
+            with metrics.timer('merge'):
+                destination_image = self.merge_loaded_images(source_images)
         else:
+            metrics.count('tiles_fastpath')
             destination_image = source_images[0].copy()
 
-        destination_image.save(destination, "PNG")
+        if self._tile_writer is not None:
+            return self._tile_writer.write_image(destination, destination_image)
+
+        save_image_atomic(destination_image, destination, "PNG")
+        metrics.count('tiles_written')
 
     def merge_loaded_images(self, source_images):
         source_image_pixdata = []
@@ -100,116 +116,21 @@ class TileMerger(object):
         return destination_image
 
 
-class OpenCLTileMerger(TileMerger):
-    def __init__(self, image_order, threads):
-        TileMerger.__init__(self, image_order, threads)
-
-        # create opencl code to compare vectors
-        # TODO: improve code in a way so we need to compare specific values only once
-        self.pix_pos_compare_code = ""
-        for i in range(len(image_order)):
-            x, y, z, w = image_order[i]
-            self.pix_pos_compare_code += "if(pix.x == (uint){x} && pix.y == (uint){y} && pix.z == (uint){z} && pix.w == (uint){w}) {{ return {i}; }}\nelse ".format(
-                x=x, y=y, z=z, w=w, i=i)
-        self.pix_pos_compare_code += "{ return -1; }\n"
-
-        # initialize OpenCL
-        self.ctx = cl.create_some_context(interactive = False)
-        self.queue = cl.CommandQueue(self.ctx)
-        self.prg = self._build_cl_program()
-
-    def _build_cl_program(self):
-        # load and build OpenCL function
-        return cl.Program(self.ctx, '''//CL//
-                bool equal_uint4(uint4 pix1, uint4 pix2) {
-                    if(pix1.x == pix2.x && pix1.y == pix2.y && pix1.z == pix2.z && pix1.w == pix2.w) {
-                        return 1;
-                    } else {
-                        return 0;
-                    }
-                }
-
-                int pix_pos(uint4 pix) {
-                ''' + self.pix_pos_compare_code + '''
-                }
-
-                __kernel void convert(
-                    read_only image2d_t src1,
-                    read_only image2d_t src2,
-                    write_only image2d_t dest
-                )
-                {
-                    const sampler_t sampler =  CLK_NORMALIZED_COORDS_FALSE | CLK_ADDRESS_CLAMP_TO_EDGE | CLK_FILTER_NEAREST;
-                    int2 pos = (int2)(get_global_id(0), get_global_id(1));
-
-                    uint4 pix1 = read_imageui(src1, sampler, pos);
-                    uint4 pix2 = read_imageui(src2, sampler, pos);
-
-                    uint4 pix;
-
-                    if(equal_uint4(pix2, (uint4)((uint)255, (uint)255, (uint)255, (uint)0))) {
-                        pix = pix1;
-                    } else {
-                        int pix1_pos = pix_pos(pix1);
-                        int pix2_pos = pix_pos(pix2);
-
-                        if(pix1_pos == -1) {
-                            pix = pix2;
-                        } else if(pix2_pos == -1) {
-                            pix = pix1;
-                        } else if(pix1_pos < pix2_pos) {
-                            pix = pix1;
-                        } else {
-                            pix = pix2;
-                        }
-                    }
-
-                    write_imageui(dest, pos, pix);
-                }
-                ''').build()
-
-    def merge_loaded_images(self, source_images):
-        converted_images = []
-        source_array = []
-        source_buffer = []
-        for single_source in source_images:
-            new_image = single_source.convert('RGBA')
-            converted_images += [new_image]
-            new_numpy_array = numpy.array(new_image)
-            source_array += [new_numpy_array]
-            source_buffer += [cl.image_from_array(self.ctx, new_numpy_array, 4)]
-
-        # get size of source image (note height is stored at index 0)
-        h = source_array[0].shape[0]
-        w = source_array[0].shape[1]
-
-        # build destination OpenCL Image
-        fmt = cl.ImageFormat(cl.channel_order.RGBA, cl.channel_type.UNSIGNED_INT8)
-        dest_buf = cl.Image(self.ctx, cl.mem_flags.READ_WRITE, fmt, shape=(w, h))
-
-        # execute OpenCL function
-        self.prg.convert(self.queue, (w, h), None, source_buffer[0], source_buffer[1], dest_buf)
-
-        if len(source_images) > 2:
-            source_buffer[0].release()
-            source_buffer[1].release()
-            for i in range(2, len(source_images)):
-                # execute OpenCL function
-                self.prg.convert(self.queue, (w, h), None, source_buffer[i], dest_buf, dest_buf)
-                source_buffer[i].release()
-
-        # copy result back to host
-        dest = numpy.empty_like(source_array[0])
-        cl.enqueue_copy(self.queue, dest, dest_buf, origin=(0, 0), region=(w, h)).wait()
-        dest_buf.release()  # memory release useful or even required?
-
-
-        # convert image and save it
-        return Image.fromarray(dest)
-
+def get_tile_columns(src_dirs):
+    '''
+    all (zoom, xtile) columns of the given tile directories
+    '''
+    columns = set()
+    for src_dir in src_dirs:
+        for zoom in filter(str.isdigit, os.listdir(src_dir)):
+            for xtile in filter(str.isdigit, os.listdir(os.path.join(src_dir, zoom))):
+                columns.add((int(zoom), int(xtile)))
+    return columns
 
 
 def merge_maps(src_dir, dest_dir, tile_merger, **kwargs):
+    journal = kwargs.get('journal')
+
     # get a list of files to merge
     files = {}
     for single_source in src_dir:
@@ -221,10 +142,19 @@ def merge_maps(src_dir, dest_dir, tile_merger, **kwargs):
             else:
                 files[file] = [file_path]
 
-    # merge files
-    for key, src_files in files.items():
-        dest_file = os.path.join(dest_dir, key)
-        tile_merger.submit_merge_images(src_files, dest_file)
+    # merge files (every directory is a batch inside the job journal)
+    if kwargs.get('resume') and journal.is_done('merge', dest_dir):
+        print("skip already merged dir: {0}".format(dest_dir))
+    else:
+        # the directory is done as soon as all of its tiles are merged and written
+        batch = JournalBatch(journal, 'merge', dest_dir) if journal else None
+        for key, src_files in files.items():
+            dest_file = os.path.join(dest_dir, key)
+            future = tile_merger.submit_merge_images(src_files, dest_file)
+            if batch:
+                batch.add(future)
+        if batch:
+            batch.close()
 
     # get all subfolders
     sub_level = set()
@@ -236,9 +166,9 @@ def merge_maps(src_dir, dest_dir, tile_merger, **kwargs):
     for level in sorted(sub_level, key=int):
         new_dest_dir = os.path.join(dest_dir, str(level))
 
-        print("enter dir: {0}".format(new_dest_dir))
+        logger.debug("enter dir: {0}".format(new_dest_dir))
         if not os.path.isdir(new_dest_dir):
-            print("create dir: {0}".format(new_dest_dir))
+            logger.debug("create dir: {0}".format(new_dest_dir))
             os.mkdir(new_dest_dir)
 
         new_src_dir = set()
@@ -247,7 +177,7 @@ def merge_maps(src_dir, dest_dir, tile_merger, **kwargs):
             if os.path.exists(single_src_child):
                 new_src_dir.add(single_src_child)
 
-        merge_maps(new_src_dir, new_dest_dir, tile_merger)
+        merge_maps(new_src_dir, new_dest_dir, tile_merger, **kwargs)
 
 
 if __name__ == '__main__':
@@ -259,10 +189,24 @@ if __name__ == '__main__':
     parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads')
     parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
     parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
-    parser.add_argument('--gpu', help='run merge algorihm using gpu', action='store_true')
+    parser.add_argument('--gpu', help='run merge algorihm using gpu (same as --merge-backend opencl)', action='store_true')
+    parser.add_argument('--resume', help='skip directories which were already merged by a previous run', action='store_true')
+    add_tile_writer_arguments(parser)
+    add_backend_arguments(parser, ['merge', 'encode'])
+    add_instrumentation_arguments(parser)
 
     args = parser.parse_args()
 
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+        logging.getLogger('PySplat').setLevel(logging.INFO)
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger('PySplat').setLevel(logging.DEBUG)
+
+    start_instrumentation(args)
+
     for input_dir in args.inputdirs:
         if not os.path.exists(input_dir):
             print("{0} is not a existing directory".format(input_dir))
@@ -284,20 +228,25 @@ if __name__ == '__main__':
 
     image_order = get_sorted_pixel_order(scf_data)
 
-    if args.gpu:
-        if not cl_support:
-            print("This system doesn't support GPU Acceleration yet! Please install the required packages")
-            sys.exit(1)
-        tile_merger = OpenCLTileMerger(image_order, args.threads)
-    else:
-        tile_merger = TileMerger(image_order, args.threads)
-
+    backends = get_backends(args, ['merge', 'encode'])
 
+    tile_writer = TileWriter(output_dir, threads=args.iothreads, dedup=args.dedup, encoder=load_backend('encode', backends['encode']))
+    tile_merger = load_backend('merge', backends['merge'])(image_order, args.threads, tile_writer)
 
     print("input dirs: {0}".format(args.inputdirs))
     print("output dir: {0}".format(output_dir))
     print("scf data: {0}".format(scf_data))
 
-    merge_maps(args.inputdirs, output_dir, tile_merger)
+    journal = JobJournal(output_dir)
+
+    # directories are created here, and not by the threads which write the tiles
+    for (zoom, xtile) in sorted(get_tile_columns(args.inputdirs)):
+        tile_writer.prepare_range(zoom, xtile, xtile)
+
+    merge_maps(args.inputdirs, output_dir, tile_merger, journal=journal, resume=args.resume)
+
+    tile_merger.wait_until_empty()
+    tile_merger.shutdown()
+    tile_writer.close()
 
-    tile_merger.wait_until_empty()
\ No newline at end of file
+    finish_instrumentation(args)
\ No newline at end of file
@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+import argparse, sys, os
+import logging
+import queue
+import shutil
+import tempfile
+import threading
+from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from PySplat.pysplat import get_qth_files, add_range_arguments
+from PySplat.pysplat_split import render_tile, get_tile_range, mask_blank_pixels
+from PySplat.pysplat_downsample import downsample_tiles
+from PySplat.util.argparse_helper import check_thread_count, check_positive_int, check_zoom_level
+from PySplat.util.backends import load_backend, add_backend_arguments, get_backends
+from PySplat.util.geo_file import parse_geo_file
+from PySplat.util.instrumentation import metrics, add_instrumentation_arguments, start_instrumentation, finish_instrumentation
+from PySplat.util.job_journal import JobJournal
+from PySplat.util.mbtiles import MBTilesStore
+from PySplat.util.scf_file import parse_scf_file, default_scf_data, get_sorted_pixel_order
+from PySplat.util.splat import run_splat
+from PySplat.util.tile_writer import TileWriter, JournalBatch, add_tile_writer_arguments
+
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+_end_of_stream = object()
+_end_of_site = object()
+
+
+class RenderPipeline(object):
+    '''
+    render -> split -> downsample -> merge, without writing intermediate files (except the .ppm SPLAT has to write)
+
+    Every stage runs in its own thread(s) and the stages are connected using bounded queues. This means splitting
+    of the first site starts as soon as its rendering is finished, while SPLAT is still working on the next sites.
+    Tiles are handed over to the merge stage as soon as they are produced. The merge stage keeps at most max_tiles
+    merged tiles in memory, the least recently used ones are written into the output directory. When another site
+    contributes to a tile which was already written, the written tile is loaded and merged again.
+
+    A site is marked as merged inside the job journal as soon as all tiles it contributed to are written. On resume,
+    those sites are skipped, and the tiles of all other sites are merged into the tiles already in the output.
+    '''
+    def __init__(self, output_dir, tile_merger, zoom_levels, downsample_levels, threads, **kwargs):
+        self._output_dir = output_dir
+        self._tile_merger = tile_merger
+        self._zoom_levels = zoom_levels
+        self._downsample_levels = downsample_levels
+        self._threads = threads
+        self._keep_ppm_dir = kwargs.get('keep_ppm_dir')
+        self._journal = kwargs.get('journal')
+        self._resume = kwargs.get('resume', False)
+        self._io_threads = kwargs.get('io_threads', threads)
+        self._dedup = kwargs.get('dedup', False)
+        self._mbtiles_file = kwargs.get('mbtiles_file')
+        self._mask = kwargs.get('mask', mask_blank_pixels)
+        self._encoder = kwargs.get('encoder')
+        self._max_tiles = kwargs.get('max_tiles', 2048)
+
+        queue_size = kwargs.get('queue_size', threads * 4)
+        self._split_queue = queue.Queue(maxsize=threads)  # a rendered site is big, so do not buffer many of them
+        self._merge_queue = queue.Queue(maxsize=queue_size)
+
+        self._merged_tiles = OrderedDict()  # least recently used tiles first
+        self._written_tiles = set()
+        self._tile_writer = None
+
+        # only used by the merge stage: journal batches of the sites which contributed to the tiles in memory
+        self._tile_sites = {}
+        self._site_tiles = {}  # journal batch -> number of tiles in memory
+        self._finished_sites = set()
+
+        self._failed_sites = []
+        self._failed_sites_lock = threading.Lock()
+
+        # set when the merge stage failed, all stages stop working and only drain their queues afterwards
+        self._merge_error = None
+        self._stopped = threading.Event()
+
+    def render_site(self, qth, srtm_dir, tmp_dir):
+        if self._stopped.is_set():
+            return
+
+        if self._resume and self._journal.is_done('merge', qth.name):
+            logger.info('skip already merged site: {0}'.format(qth.name))
+            metrics.count('sites_skipped')
+            return
+
+        if self._resume and self._keep_ppm_dir and self._journal.is_done('render', qth.name):
+            kept_ppm_file = os.path.join(self._keep_ppm_dir, '{name}.ppm'.format(name=qth.name))
+            if os.path.isfile(kept_ppm_file):
+                logger.info('use already rendered site: {0}'.format(kept_ppm_file))
+                self._split_queue.put((qth, kept_ppm_file))
+                return
+
+        ppm_file = os.path.join(tmp_dir, '{name}.ppm'.format(name=qth.name))
+
+        if not run_splat(qth, srtm_dir, ppm_file) or not os.path.isfile(ppm_file):
+            raise RuntimeError('rendering of site failed: {0}'.format(qth))
+
+        # blocks in case the split stage is too slow, so we do not fill up the tmp dir
+        self._split_queue.put((qth, ppm_file))
+
+    def _site_failed(self, qth):
+        metrics.count('sites_failed')
+        with self._failed_sites_lock:
+            self._failed_sites.append(qth.name)
+
+    def _load_site(self, ppm_file):
+        geo_file = os.path.splitext(ppm_file)[0] + ".geo"
+
+        with metrics.timer('decode'):
+            ppm_image = Image.open(ppm_file)
+            ppm_image.load()  # we want to remove the file as soon as possible
+        geo_data = parse_geo_file(geo_file)
+
+        if self._keep_ppm_dir and os.path.dirname(os.path.abspath(ppm_file)) == os.path.abspath(self._keep_ppm_dir):
+            pass  # already kept by a previous run
+        elif self._keep_ppm_dir:
+            shutil.move(ppm_file, os.path.join(self._keep_ppm_dir, os.path.basename(ppm_file)))
+            shutil.move(geo_file, os.path.join(self._keep_ppm_dir, os.path.basename(geo_file)))
+        else:
+            os.remove(ppm_file)
+            os.remove(geo_file)
+
+        return (ppm_image, geo_data)
+
+    def split_site(self, qth, ppm_file):
+        (ppm_image, geo_data) = self._load_site(ppm_file)
+
+        if self._keep_ppm_dir and self._journal:
+            # we only can skip rendering on resume, when the rendered map is still around
+            self._journal.mark_done('render', qth.name)
+
+        if self._journal:
+            self._journal.mark_running('split', qth.name)
+        batch = JournalBatch(self._journal, 'merge', qth.name) if self._journal else None
+
+        base_zoom = self._zoom_levels[0]
+        base_tiles = {}
+
+        # directories are created here, and not by the threads which write the tiles
+        for zoom in self._downsample_levels:
+            (xtile_start, _, xtile_end, _) = get_tile_range(geo_data, zoom)
+            self._tile_writer.prepare_range(zoom, xtile_start, xtile_end)
+
+        for zoom in self._zoom_levels:
+            (xtile_start, ytile_start, xtile_end, ytile_end) = get_tile_range(geo_data, zoom)
+            self._tile_writer.prepare_range(zoom, xtile_start, xtile_end)
+
+            logger.info('split {0} from {1}/{2} to {3}/{4} for zoom level {5}'.format(
+                qth.name, xtile_start, ytile_start, xtile_end, ytile_end, zoom))
+
+            for xtile in range(xtile_start, xtile_end + 1):
+                if self._stopped.is_set():
+                    raise RuntimeError('pipeline was stopped')
+
+                for ytile in range(ytile_start, ytile_end + 1):
+                    tile_image = render_tile(xtile, ytile, zoom, ppm_image, geo_data, mask=self._mask)
+                    if tile_image is None:
+                        continue
+
+                    if zoom == base_zoom and self._downsample_levels:
+                        base_tiles[(xtile, ytile)] = tile_image
+
+                    self._merge_queue.put((zoom, xtile, ytile, tile_image, batch))
+
+        if self._downsample_levels:
+            for (zoom, (xtile, ytile), tile_image) in downsample_tiles(base_tiles, base_zoom, self._downsample_levels):
+                self._merge_queue.put((zoom, xtile, ytile, tile_image, batch))
+
+        if self._journal:
+            self._journal.mark_done('split', qth.name)
+        if batch is not None:
+            # the site is merged, as soon as all tiles handed over until now are written
+            self._merge_queue.put((_end_of_site, batch))
+
+        logger.info('site finished: {0}'.format(qth.name))
+
+    def split_worker(self):
+        while True:
+            item = self._split_queue.get()
+            if item is _end_of_stream:
+                return
+
+            (qth, ppm_file) = item
+            if self._stopped.is_set():
+                self._site_failed(qth)
+                continue
+
+            try:
+                with metrics.profile():
+                    self.split_site(qth, ppm_file)
+            except Exception as e:
+                logger.error('splitting of site {0} failed: {1}'.format(qth.name, e))
+                self._site_failed(qth)
+
+    def merge_worker(self):
+        while True:
+            item = self._merge_queue.get()
+            if item is _end_of_stream:
+                return
+
+            if self._stopped.is_set():
+                continue  # keep on draining the queue, otherwise the split stage would block forever
+
+            try:
+                self._merge_item(item)
+            except Exception as e:
+                # we cannot tell which tiles are still correct, so the whole pipeline stops
+                logger.error('merge stage failed: {0}'.format(e))
+                self._merge_error = e
+                self._stopped.set()
+
+    def _merge_item(self, item):
+        if item[0] is _end_of_site:
+            self._site_finished(item[1])
+            return
+
+        (zoom, xtile, ytile, tile_image, batch) = item
+        try:
+            self.merge_tile((zoom, xtile, ytile), tile_image, batch)
+        except Exception as e:
+            # keep on merging, a failed tile only fails the sites which contributed to it
+            logger.error('merging of tile {0}/{1}/{2} failed: {3}'.format(zoom, xtile, ytile, e))
+            metrics.count('tiles_failed')
+            if batch is not None:
+                failed = Future()
+                failed.set_exception(e)
+                batch.add(failed)
+
+        while len(self._merged_tiles) > self._max_tiles:
+            self.write_tile(*self._merged_tiles.popitem(last=False))
+
+    def _close_site(self, batch):
+        self._finished_sites.discard(batch)
+        self._site_tiles.pop(batch, None)
+        batch.close()
+
+    def _site_finished(self, batch):
+        if self._site_tiles.get(batch):
+            self._finished_sites.add(batch)
+        else:
+            self._close_site(batch)
+
+    def merge_tile(self, key, tile_image, batch=None):
+        existing_image = self._merged_tiles.pop(key, None)
+        if existing_image is None and key in self._written_tiles:
+            # the tile was already written, because it was not used for some time
+            metrics.count('tiles_reloaded')
+            existing_image = self._tile_writer.read(*key)
+        elif existing_image is None and self._resume:
+            # merge into the tiles of the sites which were finished by a previous run
+            existing_image = self._tile_writer.read(*key, flush=False)
+            if existing_image is not None:
+                metrics.count('tiles_reloaded')
+
+        if existing_image is None:
+            metrics.count('tiles_fastpath')
+            self._merged_tiles[key] = tile_image
+        else:
+            with metrics.timer('merge'), metrics.profile():
+                self._merged_tiles[key] = self._tile_merger.merge_loaded_images([existing_image, tile_image])
+
+        sites = self._tile_sites.setdefault(key, set())
+        if batch is not None and batch not in sites:
+            sites.add(batch)
+            self._site_tiles[batch] = self._site_tiles.get(batch, 0) + 1
+
+    def write_tile(self, key, tile_image):
+        self._written_tiles.add(key)
+        future = self._tile_writer.write(key[0], key[1], key[2], tile_image)
+
+        for batch in self._tile_sites.pop(key, ()):
+            batch.add(future)
+            self._site_tiles[batch] -= 1
+            if self._site_tiles[batch] == 0 and batch in self._finished_sites:
+                self._close_site(batch)
+
+        return future
+
+    def write_tiles(self):
+        '''
+        write all tiles which are still in memory
+        '''
+        logger.info("write {0} remaining tiles".format(len(self._merged_tiles)))
+
+        while self._merged_tiles:
+            self.write_tile(*self._merged_tiles.popitem(last=False))
+
+    def run(self, qth_files, srtm_dir):
+        '''
+        returns the names of all sites which failed, raises a RuntimeError when the merge stage failed
+        '''
+        tmp_dir = tempfile.mkdtemp("_pysplat_pipeline")
+        logger.info('use tmp dir: {0}'.format(tmp_dir))
+
+        print("write tiles into: {0}".format(self._mbtiles_file or self._output_dir))
+        mbtiles = MBTilesStore(self._mbtiles_file) if self._mbtiles_file else None
+        self._tile_writer = TileWriter(self._output_dir, threads=self._io_threads, dedup=self._dedup, mbtiles=mbtiles,
+                                       encoder=self._encoder)
+
+        split_threads = [threading.Thread(target=self.split_worker) for _ in range(self._threads)]
+        merge_thread = threading.Thread(target=self.merge_worker)
+
+        try:
+            for thread in split_threads:
+                thread.start()
+            merge_thread.start()
+
+            with ThreadPoolExecutor(max_workers=self._threads) as executor:
+                futures = [(qth, executor.submit(self.render_site, qth, srtm_dir, tmp_dir)) for qth in qth_files]
+
+            for (qth, future) in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error('rendering of site {0} failed: {1}'.format(qth.name, e))
+                    self._site_failed(qth)
+
+            for _ in split_threads:
+                self._split_queue.put(_end_of_stream)
+            for thread in split_threads:
+                thread.join()
+
+            self._merge_queue.put(_end_of_stream)
+            merge_thread.join()
+
+            if self._merge_error is not None:
+                raise RuntimeError('merge stage failed: {0}'.format(self._merge_error)) from self._merge_error
+
+            self.write_tiles()
+        finally:
+            # we want to delete the tmp folder in all cases
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            self._tile_writer.close()
+
+        return self._failed_sites
+
+
+if __name__ == '__main__':
+    try:
+        parser = argparse.ArgumentParser()
+
+        parser.add_argument('qth', nargs='+', help='txsite(s).qth', action='store')
+        parser.add_argument('outputdir', help='output directory where we store the merged tiles')
+        parser.add_argument('--srtm', dest='srtmdir', default='./srtm', help='directory where srtm data is stored')
+        parser.add_argument('--scf', dest='scffile', help='scf file required used for merging')
+        parser.add_argument('-z', dest='zoomlevel', nargs='+', type=check_zoom_level, default=[range(6, 12 + 1)], help='zoom levels to split (default 6-12)')
+        parser.add_argument('--downsample', dest='downsamplelevel', nargs='+', type=check_zoom_level, default=[range(0, 5 + 1)], help='zoom levels to calculate by downsampling the lowest split level (default 0-5)')
+        parser.add_argument('--keep-ppm', dest='keepppmdir', help='directory where the rendered .ppm/.geo files should be kept')
+        parser.add_argument('--resume', help='skip sites which were already merged by a previous run, and reuse the kept .ppm files of sites which were already rendered', action='store_true')
+        add_range_arguments(parser)
+        parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads')
+        add_tile_writer_arguments(parser, mbtiles=True)
+        parser.add_argument('--max-tiles', dest='maxtiles', type=check_positive_int, default=2048, help='number of merged tiles kept in memory, before the least recently used ones are written (default 2048)')
+        parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
+        parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+        parser.add_argument('--gpu', help='run merge algorihm using gpu (same as --merge-backend opencl)', action='store_true')
+        add_backend_arguments(parser, ['merge', 'split', 'encode'])
+        add_instrumentation_arguments(parser)
+
+        args = parser.parse_args()
+
+        if args.verbose:
+            logger.setLevel(logging.INFO)
+            logging.getLogger('PySplat').setLevel(logging.INFO)
+
+        if args.debug:
+            logger.setLevel(logging.DEBUG)
+            logging.getLogger('PySplat').setLevel(logging.DEBUG)
+
+        start_instrumentation(args)
+
+        # parse list of zoom levels we want to render
+        zoom_levels_set = set()
+        for level in args.zoomlevel:
+            zoom_levels_set.update(level)
+        zoom_levels = sorted(zoom_levels_set)
+
+        downsample_levels_set = set()
+        for level in args.downsamplelevel:
+            downsample_levels_set.update(level)
+        downsample_levels = sorted(downsample_levels_set)
+
+        if downsample_levels and downsample_levels[-1] >= zoom_levels[0]:
+            print("we can only downsample below the lowest split zoom level ({0})".format(zoom_levels[0]))
+            sys.exit(1)
+
+        scf_data = default_scf_data
+        if args.scffile:
+            if os.path.isfile(args.scffile):
+                scf_data = parse_scf_file(args.scffile)
+            else:
+                print("not a existing file: {0}".format(args.scffile))
+                sys.exit(1)
+
+        image_order = get_sorted_pixel_order(scf_data)
+
+        backends = get_backends(args, ['merge', 'split', 'encode'])
+
+        tile_merger = load_backend('merge', backends['merge'])(image_order, args.threads)
+
+        if args.keepppmdir and not os.path.exists(args.keepppmdir):
+            os.makedirs(args.keepppmdir)
+
+        qth_files = get_qth_files(args.qth, range=args.range, rx_height=args.rxheight, auto_range=args.autorange)
+
+        print("Store tiles into: {0}".format(args.outputdir))
+        print("levels: {0}, downsampled levels: {1}".format(zoom_levels, downsample_levels))
+
+        journal = JobJournal(args.outputdir)
+
+        pipeline = RenderPipeline(args.outputdir, tile_merger, zoom_levels, downsample_levels, args.threads,
+                                  keep_ppm_dir=args.keepppmdir, journal=journal, resume=args.resume, io_threads=args.iothreads,
+                                  dedup=args.dedup, mbtiles_file=args.mbtilesfile, mask=load_backend('split', backends['split']),
+                                  encoder=load_backend('encode', backends['encode']), max_tiles=args.maxtiles)
+        try:
+            failed_sites = pipeline.run(qth_files, args.srtmdir)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+        finally:
+            tile_merger.shutdown()
+
+        finish_instrumentation(args)
+
+        if failed_sites:
+            print("{0} of {1} sites failed: {2}".format(len(failed_sites), len(qth_files), ', '.join(sorted(failed_sites))))
+            sys.exit(1)
+
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import argparse, sys, os
+import csv
+import logging
+import numpy
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from PySplat.util.argparse_helper import check_positive_int
+from PySplat.util.point_query import PointQuery
+from PySplat.util.scf_file import parse_scf_file, default_scf_data
+from PySplat.util.site_raster import SignalLevels, open_site_raster
+
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def _format_level(level):
+    return '' if numpy.isnan(level) else '{0:g}'.format(level)
+
+
+def read_batches(reader, batch_size):
+    batch = []
+    for row in reader:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def query_csv(point_query, input_file, output_file, **kwargs):
+    lat_column = kwargs.get('lat_column', 'lat')
+    lon_column = kwargs.get('lon_column', 'lon')
+    all_sites = kwargs.get('all_sites', False)
+    site_names = [raster.name for raster in point_query.rasters]
+
+    reader = csv.DictReader(input_file)
+    if reader.fieldnames is None or lat_column not in reader.fieldnames or lon_column not in reader.fieldnames:
+        raise ValueError("input requires the columns \"{0}\" and \"{1}\"".format(lat_column, lon_column))
+
+    fieldnames = list(reader.fieldnames) + ['best_site', 'best_level']
+    if all_sites:
+        fieldnames += ['level_{0}'.format(name) for name in site_names]
+
+    writer = csv.DictWriter(output_file, fieldnames=fieldnames, lineterminator='\n')
+    writer.writeheader()
+
+    for batch in read_batches(reader, kwargs.get('batch_size', 10000)):
+        lat = numpy.full(len(batch), numpy.nan)
+        lon = numpy.full(len(batch), numpy.nan)
+        for i, row in enumerate(batch):
+            try:
+                lat[i] = float(row[lat_column])
+                lon[i] = float(row[lon_column])
+            except (TypeError, ValueError):
+                logger.warning("invalid position: {0}".format(row))
+
+        valid = ~(numpy.isnan(lat) | numpy.isnan(lon))
+        result = point_query.query(lat[valid], lon[valid])
+
+        valid_rows = [row for (row, is_valid) in zip(batch, valid) if is_valid]
+        for (i, row) in enumerate(valid_rows):
+            best_site = result['best_site'][i]
+            row['best_site'] = site_names[best_site] if best_site >= 0 else ''
+            row['best_level'] = _format_level(result['best_level'][i])
+            if all_sites:
+                for name, level in zip(site_names, result['levels'][i]):
+                    row['level_{0}'.format(name)] = _format_level(level)
+
+        writer.writerows(batch)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('inputfiles', nargs='+', help='.ppm file(s) of the sites (.geo file is required next to it)', action='store')
+    parser.add_argument('--input', dest='csvinput', help='csv file with the positions to query (default stdin)')
+    parser.add_argument('--output', dest='csvoutput', help='csv file where the results are written to (default stdout)')
+    parser.add_argument('--lat-column', dest='latcolumn', default='lat', help='name of the latitude column (default lat)')
+    parser.add_argument('--lon-column', dest='loncolumn', default='lon', help='name of the longitude column (default lon)')
+    parser.add_argument('--all-sites', dest='allsites', help='also output the signal level of every single site', action='store_true')
+    parser.add_argument('--batch-size', dest='batchsize', type=check_positive_int, default=10000, help='number of positions queried at once (default 10000)')
+    parser.add_argument('--scf', dest='scffile', help='scf file used to convert colors into signal levels of sites without their own <site>.scf file')
+    parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
+    parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+        logging.getLogger('PySplat').setLevel(logging.INFO)
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger('PySplat').setLevel(logging.DEBUG)
+
+    scf_data = default_scf_data
+    if args.scffile:
+        if os.path.isfile(args.scffile):
+            scf_data = parse_scf_file(args.scffile)
+        else:
+            logger.error("not a existing file: {0}".format(args.scffile))
+            sys.exit(1)
+    signal_levels = SignalLevels(scf_data)
+
+    rasters = []
+    for filename in args.inputfiles:
+        if not os.path.isfile(filename):
+            logger.error("file not found: \"{0}\"".format(filename))
+            sys.exit(1)
+        logger.info("load site: {0}".format(filename))
+        rasters.append(open_site_raster(filename, signal_levels))
+
+    point_query = PointQuery(rasters)
+
+    input_file = open(args.csvinput, "r", newline='') if args.csvinput else sys.stdin
+    output_file = open(args.csvoutput, "w", newline='') if args.csvoutput else sys.stdout
+
+    try:
+        query_csv(point_query, input_file, output_file, lat_column=args.latcolumn, lon_column=args.loncolumn,
+                  all_sites=args.allsites, batch_size=args.batchsize)
+    except ValueError as e:
+        logger.error(e)
+        sys.exit(1)
+    finally:
+        if args.csvinput:
+            input_file.close()
+        if args.csvoutput:
+            output_file.close()
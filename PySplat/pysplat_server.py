@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import argparse, sys, os
+import json
+import logging
+import re
+import threading
+from PIL import Image
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from PySplat.pysplat_split import render_tile, get_tile_range, mask_blank_pixels
+from PySplat.util.argparse_helper import check_thread_count
+from PySplat.util.atomic_file import encode_image, write_file_atomic
+from PySplat.util.backends import load_backend, add_backend_arguments, get_backends
+from PySplat.util.geo_file import parse_geo_file
+from PySplat.util.instrumentation import metrics
+from PySplat.util.lru_cache import LRUCache
+from PySplat.util.scf_file import parse_scf_file, default_scf_data, get_sorted_pixel_order
+
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+_tile_path_regex = re.compile(r"^/([0-9]+)/([0-9]+)/([0-9]+)\.png$")
+
+# the server runs for a long time, so calibrating the backends once pays off
+SERVER_BACKENDS = {'merge': 'auto', 'split': 'auto', 'encode': 'auto'}
+
+
+class TileRenderer(object):
+    '''
+    renders (and merges) a single tile of all loaded sites on request
+    '''
+    def __init__(self, tile_merger, mask=mask_blank_pixels):
+        self._tile_merger = tile_merger
+        self._mask = mask
+        self._sites = []
+
+    def add_site(self, ppm_file):
+        if ppm_file.endswith('.psr'):
+            from PySplat.util.site_raster import open_site_raster  # requires numpy
+            raster = open_site_raster(ppm_file)
+            self._sites.append((ppm_file, raster, raster.geo_data))
+            return
+
+        geo_file = os.path.splitext(ppm_file)[0] + ".geo"
+
+        with metrics.timer('decode'):
+            rf_img = Image.open(ppm_file)
+            rf_img.load()
+
+        self._sites.append((ppm_file, rf_img, parse_geo_file(geo_file)))
+
+    def render(self, zoom, xtile, ytile):
+        images = []
+        for (_, rf_img, rf_geo_data) in self._sites:
+            (xtile_start, ytile_start, xtile_end, ytile_end) = get_tile_range(rf_geo_data, zoom)
+            if not (xtile_start <= xtile <= xtile_end and ytile_start <= ytile <= ytile_end):
+                continue
+
+            tile_image = render_tile(xtile, ytile, zoom, rf_img, rf_geo_data, mask=self._mask)
+            if tile_image is not None:
+                images.append(tile_image)
+
+        if not images:
+            return None
+
+        if len(images) == 1:
+            return images[0]
+
+        with metrics.timer('merge'):
+            return self._tile_merger.merge_loaded_images(images)
+
+
+class TileServer(object):
+    '''
+    returns encoded tiles, using a in-memory LRU cache and a optional disk cache in front of the renderer.
+
+    Concurrent requests of the same tile are coalesced, which means the tile is only rendered once.
+    '''
+    def __init__(self, renderer, cache_size, threads, cache_dir=None, encoder=encode_image):
+        self._renderer = renderer
+        self._encoder = encoder
+        self._cache = LRUCache(cache_size)
+        self._cache_dir = cache_dir
+        self._render_slots = threading.BoundedSemaphore(threads)
+
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+        self._blank_tile = encode_image(Image.new('RGBA', (256, 256), color=(255, 255, 255, 0)), "PNG")
+
+    def _get_cache_filename(self, key):
+        return os.path.join(self._cache_dir, str(key[0]), str(key[1]), "{0}.png".format(key[2]))
+
+    def _load_or_render(self, key):
+        if self._cache_dir:
+            cache_filename = self._get_cache_filename(key)
+            if os.path.isfile(cache_filename):
+                metrics.count('disk_cache_hits')
+                with open(cache_filename, "rb") as file:
+                    return file.read()
+
+        with self._render_slots:
+            tile_image = self._renderer.render(*key)
+
+        if tile_image is None:
+            metrics.count('tiles_skipped')
+            data = self._blank_tile
+        else:
+            metrics.count('tiles_rendered')
+            data = self._encoder(tile_image, "PNG")
+
+        if self._cache_dir:
+            os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+            write_file_atomic(cache_filename, data)
+
+        return data
+
+    def get_tile(self, zoom, xtile, ytile):
+        key = (zoom, xtile, ytile)
+
+        with self._in_flight_lock:
+            # the owner of a tile puts it into the cache before it is removed from _in_flight, so checking both
+            # while holding the lock ensures the tile is not rendered twice
+            data = self._cache.get(key)
+            if data is not None:
+                return data
+
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not owner:
+            metrics.count('requests_coalesced')
+            return future.result()
+
+        try:
+            with metrics.timer('request'):
+                data = self._load_or_render(key)
+            self._cache.put(key, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+
+    def get_stats(self):
+        report = metrics.get_report()
+        report['cache'] = {'entries': len(self._cache), 'size': self._cache.size,
+                           'hits': self._cache.hits, 'misses': self._cache.misses}
+        return report
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    tile_server = None
+    max_zoom = 12
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send(200, 'application/json', json.dumps(self.tile_server.get_stats(), indent=2).encode('utf-8'))
+            return
+
+        match = _tile_path_regex.match(self.path.split('?')[0])
+        if not match:
+            self.send_error(404)
+            return
+
+        (zoom, xtile, ytile) = (int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if zoom > self.max_zoom or xtile >= 2 ** zoom or ytile >= 2 ** zoom:
+            self.send_error(404)
+            return
+
+        try:
+            data = self.tile_server.get_tile(zoom, xtile, ytile)
+        except Exception as e:
+            logger.error("rendering of tile {0}/{1}/{2} failed: {3}".format(zoom, xtile, ytile, e))
+            self.send_error(500)
+            return
+
+        self._send(200, 'image/png', data)
+
+    def _send(self, code, content_type, data):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("{0} - {1}".format(self.address_string(), format % args))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('inputfiles', nargs='+', help='.ppm file(s) which should be served (.geo file is required next to it), or raster archive(s) (.psr)', action='store')
+    parser.add_argument('--host', default='localhost', help='address to listen on (default localhost)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default 8080)')
+    parser.add_argument('--scf', dest='scffile', help='scf file required used for merging')
+    parser.add_argument('--max-zoom', dest='maxzoom', type=int, default=12, help='highest zoom level we serve (default 12)')
+    parser.add_argument('--cache-size', dest='cachesize', type=int, default=256, help='size of the in-memory tile cache in MB (default 256)')
+    parser.add_argument('--cache-dir', dest='cachedir', help='directory used as disk cache behind the in-memory cache')
+    parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of tiles rendered at the same time')
+    parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
+    parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+    parser.add_argument('--gpu', help='run merge algorihm using gpu (same as --merge-backend opencl)', action='store_true')
+    add_backend_arguments(parser, ['merge', 'split', 'encode'], SERVER_BACKENDS)
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+        logging.getLogger('PySplat').setLevel(logging.INFO)
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger('PySplat').setLevel(logging.DEBUG)
+
+    scf_data = default_scf_data
+    if args.scffile:
+        if os.path.isfile(args.scffile):
+            scf_data = parse_scf_file(args.scffile)
+        else:
+            print("not a existing file: {0}".format(args.scffile))
+            sys.exit(1)
+
+    image_order = get_sorted_pixel_order(scf_data)
+
+    backends = get_backends(args, ['merge', 'split', 'encode'], SERVER_BACKENDS)
+
+    tile_merger = load_backend('merge', backends['merge'])(image_order, 1)
+
+    renderer = TileRenderer(tile_merger, load_backend('split', backends['split']))
+    for ppm_file in args.inputfiles:
+        if not os.path.isfile(ppm_file) or not (ppm_file.endswith('.psr') or os.path.isfile(os.path.splitext(ppm_file)[0] + ".geo")):
+            print(".ppm or .geo file not found: {0}".format(ppm_file))
+            sys.exit(1)
+
+        print("load site: {0}".format(ppm_file))
+        renderer.add_site(ppm_file)
+
+    TileRequestHandler.tile_server = TileServer(renderer, args.cachesize * 2**20, args.threads, args.cachedir,
+                                                load_backend('encode', backends['encode']))
+    TileRequestHandler.max_zoom = args.maxzoom
+
+    httpd = ThreadingHTTPServer((args.host, args.port), TileRequestHandler)
+    print("serve tiles at: http://{0}:{1}/{{z}}/{{x}}/{{y}}.png".format(args.host, args.port))
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
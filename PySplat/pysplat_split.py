@@ -24,8 +24,15 @@ import math
 sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
 
 from PySplat.util.argparse_helper import check_thread_count, check_zoom_level
+from PySplat.util.atomic_file import save_image_atomic
+from PySplat.util.backends import load_backend, add_backend_arguments, get_backends
 from PySplat.util.geo_file import parse_geo_file
+from PySplat.util.instrumentation import metrics, add_instrumentation_arguments, start_instrumentation, finish_instrumentation
+from PySplat.util.job_journal import JobJournal
+from PySplat.util.mbtiles import MBTilesStore
+from PySplat.util.scf_file import parse_scf_file, default_scf_data
 from PySplat.util.slippy_map_math import deg2num, num2deg
+from PySplat.util.tile_writer import TileWriter, JournalBatch, add_tile_writer_arguments
 
 
 # use xrange on python2 (for speed reasons)
@@ -49,70 +56,191 @@ def get_pixel_from_pos(rf_geo_data, lat, lon):
     return (pixel_x, pixel_y)
 
 
-def create_tile(xtile, ytile, base_path, zoom, rf_img, rf_geo_data, **kwargs):
+def get_tile_range(rf_geo_data, zoom):
+    (xtile_start, ytile_start) = deg2num(rf_geo_data['bb'][0][0], rf_geo_data['bb'][0][1], zoom)
+    (xtile_end, ytile_end) = deg2num(rf_geo_data['bb'][1][0], rf_geo_data['bb'][1][1], zoom)
+
+    return (xtile_start, ytile_start, xtile_end, ytile_end)
+
+
+def mask_blank_pixels(source_img):
+    '''
+    white and black pixels become transparent (in place), returns the image
+    '''
+    #https://stackoverflow.com/questions/765736/using-pil-to-make-all-white-pixels-transparent
+    pixdata = source_img.load()
+    for y in xrange(source_img.size[1]):
+        for x in xrange(source_img.size[0]):
+            if pixdata[x, y] == (255, 255, 255, 255):
+                pixdata[x, y] = (255, 255, 255, 0) # white to transparent
+            elif pixdata[x, y] == (0, 0, 0, 255):
+                pixdata[x, y] = (255, 255, 255, 0) # black to transparent
+
+    return source_img
+
+
+def render_raster_tile(xtile, ytile, zoom, raster, **kwargs):
+    '''
+    render a single tile of a raster archive (.psr) into memory, returns None if the tile is blank
+    '''
+    from PySplat.util.site_raster import NO_SIGNAL, sample_tile_ranks  # requires numpy
+
+    with metrics.timer('reproject'):
+        ranks = sample_tile_ranks(raster, xtile, ytile, zoom, raster.signal_levels)
+
+    if kwargs.get('blank_tiles') is not True and (ranks == NO_SIGNAL).all():
+        metrics.count('tiles_skipped')
+        return None
+
+    with metrics.timer('mask'):
+        return Image.fromarray(raster.signal_levels.ranks_to_rgba(ranks), 'RGBA')
+
+
+def render_tile(xtile, ytile, zoom, rf_img, rf_geo_data, **kwargs):
+    '''
+    render a single tile into memory, returns None if the tile is blank (and blank tiles are not requested)
+    '''
+    if not isinstance(rf_img, Image.Image):  # raster archive
+        return render_raster_tile(xtile, ytile, zoom, rf_img, **kwargs)
+
     (lat_deg_start, lon_deg_start) = num2deg(xtile, ytile, zoom)
     (lat_deg_end, lon_deg_end) = num2deg(xtile+1, ytile+1, zoom)
 
-    result_dir = os.path.join(base_path, str(zoom), str(xtile))
-    result_filename = os.path.join(result_dir, "{0}.png".format(ytile))
-
     lat_per_pixel = math.fabs((rf_geo_data['bb'][1][0]-rf_geo_data['bb'][0][0])/rf_geo_data['imagesize'][0])
     lon_per_pixel = math.fabs((rf_geo_data['bb'][1][1]-rf_geo_data['bb'][0][1])/rf_geo_data['imagesize'][1])
 
     (start_pixel_x, start_pixel_y) = get_pixel_from_pos(rf_geo_data, lat_deg_start, lon_deg_start)
     (end_pixel_x, end_pixel_y) = get_pixel_from_pos(rf_geo_data, lat_deg_end, lon_deg_end)
 
-    print("use pixel: {0}|{1} to {2}|{3}".format(start_pixel_x, start_pixel_y, end_pixel_x, end_pixel_y))
+    logger.debug("use pixel: {0}|{1} to {2}|{3}".format(start_pixel_x, start_pixel_y, end_pixel_x, end_pixel_y))
 
-    # TODO: refactor to use OpenCL
-    #source_img = ImageChops.offset(rf_img,start_pixel_x, start_pixel_y)
-    source_img = rf_img.transform((256,256),Image.EXTENT, (start_pixel_x, start_pixel_y, end_pixel_x, end_pixel_y))
-    source_img = source_img.resize((256,256))
+    with metrics.timer('reproject'):
+        # TODO: refactor to use OpenCL
+        #source_img = ImageChops.offset(rf_img,start_pixel_x, start_pixel_y)
+        source_img = rf_img.transform((256,256),Image.EXTENT, (start_pixel_x, start_pixel_y, end_pixel_x, end_pixel_y))
+        source_img = source_img.resize((256,256))
 
-    source_img = source_img.convert('RGBA')
+        source_img = source_img.convert('RGBA')
 
-    #https://stackoverflow.com/questions/765736/using-pil-to-make-all-white-pixels-transparent
-    pixdata = source_img.load()
-    for y in xrange(source_img.size[1]):
-        for x in xrange(source_img.size[0]):
-            if pixdata[x, y] == (255, 255, 255, 255):
-                pixdata[x, y] = (255, 255, 255, 0) # white to transparent
-            elif pixdata[x, y] == (0, 0, 0, 255):
-                pixdata[x, y] = (255, 255, 255, 0) # black to transparent
+    with metrics.timer('mask'):
+        source_img = kwargs.get('mask', mask_blank_pixels)(source_img)
 
     if kwargs.get('blank_tiles') is not True and source_img.convert("L").getextrema() == (255, 255):
-        print("skip tile: {0}".format(result_filename))
-        return
+        metrics.count('tiles_skipped')
+        return None
+
+    return source_img
+
+
+def create_tile(xtile, ytile, base_path, zoom, rf_img, rf_geo_data, **kwargs):
+    '''
+    render a single tile and write it. Using a tile_writer, the tile is written asynchronously and the future of
+    the write is returned.
+    '''
+    result_dir = os.path.join(base_path, str(zoom), str(xtile))
+    result_filename = os.path.join(result_dir, "{0}.png".format(ytile))
+
+    source_img = render_tile(xtile, ytile, zoom, rf_img, rf_geo_data, **kwargs)
+
+    if source_img is None:
+        logger.debug("skip tile: {0}".format(result_filename))
+        return None
+
+    logger.info("create tile: {0}".format(result_filename))
+
+    tile_writer = kwargs.get('tile_writer')
+    if tile_writer is not None:
+        return tile_writer.write(zoom, xtile, ytile, source_img)
 
     if not os.path.exists(result_dir):
         logger.debug("create directory: {0}".format(result_dir))
-        os.makedirs(result_dir)
-
-    print("create tile: {0}".format(result_filename))
+        os.makedirs(result_dir, exist_ok=True)
 
     # save tile
-    source_img.save(result_filename, "PNG")
+    save_image_atomic(source_img, result_filename, "PNG")
+    metrics.count('tiles_written')
+
+
+def split_map(rf_img, rf_geo_data, output_dir, zoom_levels, **kwargs):
+    '''
+    split a whole map into tiles, every column of tiles is a batch inside the job journal (if given)
+    '''
+    journal = kwargs.get('journal')
+    batch_prefix = kwargs.get('batch_prefix', '')
+
+    tile_writer = kwargs.get('tile_writer')
+    own_tile_writer = tile_writer is None
+    if own_tile_writer:
+        tile_writer = TileWriter(output_dir, threads=kwargs.get('io_threads', 4), dedup=kwargs.get('dedup', False),
+                                 encoder=kwargs.get('encoder'))
+
+    try:
+        for zoom in zoom_levels:
+            (xtile_start, ytile_start, xtile_end, ytile_end) = get_tile_range(rf_geo_data, zoom)
+
+            print("generate tiles from {xtile_start}/{ytile_start} to {xtile_end}/{ytile_end} for zoom level {zoom}".format(
+                xtile_start=xtile_start
+                , ytile_start=ytile_start
+                , xtile_end=xtile_end
+                , ytile_end=ytile_end
+                , zoom=zoom))
+
+            tile_writer.prepare_range(zoom, xtile_start, xtile_end)
+
+            # TODO: -180 +180 overflow
+            for xtile in range(xtile_start, xtile_end + 1):
+                batch_key = '{0}:{1}/{2}'.format(batch_prefix, zoom, xtile)
+                if journal and kwargs.get('resume') and journal.is_done('split', batch_key):
+                    logger.info("skip already written tiles: {0}".format(batch_key))
+                    continue
+
+                # the batch is done as soon as all of its tiles are written
+                batch = JournalBatch(journal, 'split', batch_key) if journal else None
+                with metrics.profile():
+                    for ytile in range(ytile_start, ytile_end + 1):
+                        future = create_tile(xtile, ytile, output_dir, zoom, rf_img, rf_geo_data,
+                                             tile_writer=tile_writer, blank_tiles=kwargs.get('blank_tiles'),
+                                             mask=kwargs.get('mask', mask_blank_pixels))
+                        if batch and future is not None:
+                            batch.add(future)
+                if batch:
+                    batch.close()
+    finally:
+        if own_tile_writer:
+            tile_writer.close()
+        else:
+            tile_writer.flush()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
-    parser.add_argument('inputfile', help='image file which should be converted', action='store')
+    parser.add_argument('inputfile', help='image file (.ppm) or raster archive (.psr) which should be converted', action='store')
     parser.add_argument('outputdir', help='output directory where we store the calculated tiles')
     parser.add_argument('-z', dest='zoomlevel', nargs='+', type=check_zoom_level,  default=[range(0, 12 + 1)], help='zoom levels to render (default 0-12)')
     parser.add_argument('--including-blank-tiles', help='also write blank tiles', action='store_true')
+    parser.add_argument('--ingest', help='convert the .ppm into a raster archive with overviews (stored next to it) and split this one, which makes low zoom levels much faster', action='store_true')
+    parser.add_argument('--scf', dest='scffile', help='scf file used to convert colors into signal levels when ingesting')
     parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads')
+    add_tile_writer_arguments(parser, mbtiles=True)
+    add_backend_arguments(parser, ['split', 'encode'])
+    parser.add_argument('--resume', help='skip tile batches which were already written by a previous run', action='store_true')
     parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
     parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+    add_instrumentation_arguments(parser)
     # TODO: delete old tiles of outputdir (if they are not going to be overwritten)
 
     args = parser.parse_args()
 
+    start_instrumentation(args)
+
     if args.verbose:
         logger.setLevel(logging.INFO)
+        logging.getLogger('PySplat').setLevel(logging.INFO)
 
     if args.debug:
         logger.setLevel(logging.DEBUG)
+        logging.getLogger('PySplat').setLevel(logging.DEBUG)
 
     ppm_file = args.inputfile
     geo_file = os.path.splitext(ppm_file)[0] + ".geo"
@@ -121,13 +249,41 @@ if __name__ == '__main__':
         logger.error(".ppm file not found: \"{file}\"".format(file=ppm_file))
         sys.exit(1)
 
-    ppm_file_parsed = Image.open(ppm_file)
+    if args.ingest and not ppm_file.endswith('.psr'):
+        if not os.path.isfile(geo_file):
+            logger.error(".geo file not found: \"{file}\" (required for geo referencing)".format(file=geo_file))
+            sys.exit(1)
 
-    if not os.path.isfile(geo_file):
-        logger.error(".geo file not found: \"{file}\" (required for geo referencing)".format(file=geo_file))
-        sys.exit(1)
+        scf_data = default_scf_data
+        if args.scffile:
+            if os.path.isfile(args.scffile):
+                scf_data = parse_scf_file(args.scffile)
+            else:
+                logger.error("not a existing file: {0}".format(args.scffile))
+                sys.exit(1)
+
+        from PySplat.pysplat_ingest import ingest_ppm  # requires numpy
+        from PySplat.util.site_raster import SignalLevels
+
+        print("ingest: {0}".format(ppm_file))
+        ppm_file = ingest_ppm(ppm_file, SignalLevels(scf_data))
+
+    if ppm_file.endswith('.psr'):
+        # raster archives are already geo referenced, and only the required tiles are decompressed
+        from PySplat.util.site_raster import open_site_raster  # requires numpy
 
-    geo_file_parsed = parse_geo_file(geo_file)
+        ppm_file_parsed = open_site_raster(ppm_file)
+        geo_file_parsed = ppm_file_parsed.geo_data
+    else:
+        with metrics.timer('decode'):
+            ppm_file_parsed = Image.open(ppm_file)
+            ppm_file_parsed.load()
+
+        if not os.path.isfile(geo_file):
+            logger.error(".geo file not found: \"{file}\" (required for geo referencing)".format(file=geo_file))
+            sys.exit(1)
+
+        geo_file_parsed = parse_geo_file(geo_file)
 
     output_dir = args.outputdir
 
@@ -147,18 +303,19 @@ if __name__ == '__main__':
     print("Store tiles into: {0}".format(args.outputdir))
     print("levels: {0}".format(zoom_levels))
 
-    for zoom in zoom_levels:
-        (xtile_start, ytile_start) = deg2num(geo_file_parsed['bb'][0][0], geo_file_parsed['bb'][0][1], zoom)
-        (xtile_end, ytile_end) = deg2num(geo_file_parsed['bb'][1][0], geo_file_parsed['bb'][1][1], zoom)
-
-        print("generate tiles from {xtile_start}/{ytile_start} to {xtile_end}/{ytile_end} for zoom level {zoom}".format(
-            xtile_start=xtile_start
-            , ytile_start=ytile_start
-            , xtile_end=xtile_end
-            , ytile_end=ytile_end
-            , zoom=zoom))
-
-        # TODO: -180 +180 overflow
-        for xtile in range(xtile_start, xtile_end + 1):
-            for ytile in range(ytile_start, ytile_end + 1):
-                create_tile(xtile, ytile, output_dir, zoom, ppm_file_parsed, geo_file_parsed, blank_tiles=args.including_blank_tiles)
+    journal = JobJournal(output_dir)
+
+    backends = get_backends(args, ['split', 'encode'])
+
+    mbtiles = MBTilesStore(args.mbtilesfile, os.path.splitext(os.path.basename(ppm_file))[0]) if args.mbtilesfile else None
+    tile_writer = TileWriter(output_dir, threads=args.iothreads, dedup=args.dedup, mbtiles=mbtiles,
+                             encoder=load_backend('encode', backends['encode']))
+
+    try:
+        split_map(ppm_file_parsed, geo_file_parsed, output_dir, zoom_levels, journal=journal, resume=args.resume,
+                  batch_prefix=os.path.basename(ppm_file), blank_tiles=args.including_blank_tiles, tile_writer=tile_writer,
+                  mask=load_backend('split', backends['split']))
+    finally:
+        tile_writer.close()
+
+    finish_instrumentation(args)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import argparse, sys, os
+import csv
+import json
+import logging
+import math
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from PySplat.util.argparse_helper import check_thread_count
+from PySplat.util.instrumentation import metrics, add_instrumentation_arguments, start_instrumentation, finish_instrumentation
+from PySplat.util.scf_file import parse_scf_file, default_scf_data
+from PySplat.util.site_raster import NO_SIGNAL, SignalLevels, open_site_raster
+
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+EARTH_RADIUS = 6371.0088  # mean earth radius in km
+KM_PER_DEGREE = math.pi * EARTH_RADIUS / 180.
+
+
+def get_row_areas(lat_start, lat_per_pixel, lon_per_pixel, rows):
+    '''
+    area in km^2 of a single pixel for every row, starting at lat_start (north) going south
+    '''
+    lat = lat_start - (numpy.arange(rows, dtype=numpy.float64) + 0.5) * lat_per_pixel
+    return (lat_per_pixel * KM_PER_DEGREE) * (lon_per_pixel * KM_PER_DEGREE) * numpy.cos(numpy.radians(lat))
+
+
+def rank_histogram(ranks, row_areas):
+    '''
+    covered area per rank of a band of rows
+    '''
+    weights = numpy.broadcast_to(row_areas[:, numpy.newaxis], ranks.shape)
+    return numpy.bincount(ranks.ravel(), weights=weights.ravel(), minlength=NO_SIGNAL + 1)
+
+
+def get_site_histogram(raster, band_size=256):
+    '''
+    histogram of the ranks of a site, using the signal levels of this site
+    '''
+    bb = raster.geo_data['bb']
+    lat_per_pixel = abs(bb[1][0] - bb[0][0]) / raster.height
+    lon_per_pixel = abs(bb[1][1] - bb[0][1]) / raster.width
+    row_areas = get_row_areas(max(bb[0][0], bb[1][0]), lat_per_pixel, lon_per_pixel, raster.height)
+
+    histogram = numpy.zeros(NO_SIGNAL + 1, dtype=numpy.float64)
+    for y_start in range(0, raster.height, band_size):
+        y_end = min(y_start + band_size, raster.height)
+        with metrics.timer('decode'):
+            ranks = raster.read_window_ranks(0, y_start, raster.width, y_end, raster.signal_levels)
+        with metrics.timer('histogram'):
+            histogram += rank_histogram(ranks, row_areas[y_start:y_end])
+
+    logger.info("site finished: {0}".format(raster.name))
+    return histogram
+
+
+def get_network_histogram(rasters, signal_levels, executor, band_size=256):
+    '''
+    histogram of the strongest signal of all sites, which means overlapping areas are only counted once.
+
+    All sites are sampled into a common grid which covers all sites, using the finest resolution of the sites. Sites
+    are compared by their signal levels, the strongest level is then counted at the threshold of signal_levels it
+    reaches.
+    '''
+    bounding_boxes = [raster.get_bounding_box() for raster in rasters]
+    lat_max = max(bb[2] for bb in bounding_boxes)
+    lat_min = min(bb[0] for bb in bounding_boxes)
+    lon_min = min(bb[1] for bb in bounding_boxes)
+    lon_max = max(bb[3] for bb in bounding_boxes)
+
+    lat_per_pixel = min(abs(r.geo_data['bb'][1][0] - r.geo_data['bb'][0][0]) / r.height for r in rasters)
+    lon_per_pixel = min(abs(r.geo_data['bb'][1][1] - r.geo_data['bb'][0][1]) / r.width for r in rasters)
+
+    height = int(math.ceil((lat_max - lat_min) / lat_per_pixel))
+    width = int(math.ceil((lon_max - lon_min) / lon_per_pixel))
+    row_areas = get_row_areas(lat_max, lat_per_pixel, lon_per_pixel, height)
+    lon = lon_min + (numpy.arange(width, dtype=numpy.float64) + 0.5) * lon_per_pixel
+
+    def process_band(y_start):
+        y_end = min(y_start + band_size, height)
+        lat = lat_max - (numpy.arange(y_start, y_end, dtype=numpy.float64) + 0.5) * lat_per_pixel
+
+        levels = numpy.full((y_end - y_start, width), -numpy.inf, dtype=numpy.float32)
+        for raster, bb in zip(rasters, bounding_boxes):
+            if bb[0] > lat[0] or bb[2] < lat[-1]:
+                continue  # band does not overlap with this site
+
+            columns = numpy.nonzero((lon >= bb[1]) & (lon <= bb[3]))[0]
+            (band_lat, band_lon) = numpy.meshgrid(lat, lon[columns], indexing='ij')
+            (pixel_x, pixel_y, inside) = raster.get_pixels_from_pos(band_lat, band_lon)
+
+            site_levels = numpy.full(band_lat.shape, -numpy.inf, dtype=numpy.float32)
+            with metrics.timer('decode'):
+                site_ranks = raster.read_ranks(pixel_x[inside], pixel_y[inside], raster.signal_levels)
+            site_levels[inside] = numpy.nan_to_num(raster.signal_levels.ranks_to_levels(site_ranks), nan=-numpy.inf)
+            levels[:, columns] = numpy.maximum(levels[:, columns], site_levels)
+
+        with metrics.timer('histogram'):
+            ranks = signal_levels.levels_to_ranks(levels)
+            return rank_histogram(ranks, row_areas[y_start:y_end])
+
+    return sum(executor.map(process_band, range(0, height, band_size)))
+
+
+def histogram_to_stats(histogram, signal_levels):
+    '''
+    area per level (only this level) and covered area (this level or stronger) in km^2
+    '''
+    levels = histogram[:len(signal_levels)]
+    covered = numpy.cumsum(levels)
+    return [{'threshold': int(level), 'area_km2': float(area), 'covered_km2': float(total)}
+            for (level, area, total) in zip(signal_levels.levels, levels, covered)]
+
+
+def calculate_stats(rasters, signal_levels, threads=1, network=True):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        histograms = list(executor.map(get_site_histogram, rasters))
+
+        stats = {'sites': {raster.name: histogram_to_stats(histogram, raster.signal_levels)
+                           for (raster, histogram) in zip(rasters, histograms)}}
+
+        if network and rasters:
+            stats['network'] = histogram_to_stats(get_network_histogram(rasters, signal_levels, executor), signal_levels)
+
+    return stats
+
+
+def write_csv(stats, output_file):
+    writer = csv.writer(output_file, lineterminator='\n')
+    writer.writerow(['site', 'threshold', 'area_km2', 'covered_km2'])
+
+    rows = [(name, entries) for (name, entries) in sorted(stats['sites'].items())]
+    if 'network' in stats:
+        rows.append(('network', stats['network']))
+
+    for (name, entries) in rows:
+        for entry in entries:
+            writer.writerow([name, entry['threshold'], '{0:.3f}'.format(entry['area_km2']), '{0:.3f}'.format(entry['covered_km2'])])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('inputfiles', nargs='+', help='.ppm file(s) of the sites (.geo file is required next to it)', action='store')
+    parser.add_argument('--output', dest='outputfile', help='file where the statistics are written to (default stdout)')
+    parser.add_argument('--format', choices=('json', 'csv'), default='json', help='output format (default json)')
+    parser.add_argument('--no-network', dest='nonetwork', help='do not calculate the network wide totals', action='store_true')
+    parser.add_argument('--scf', dest='scffile', help='scf file used to convert colors into signal levels of sites without their own <site>.scf file, and thresholds of the network totals')
+    parser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads')
+    parser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
+    parser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+    add_instrumentation_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+        logging.getLogger('PySplat').setLevel(logging.INFO)
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger('PySplat').setLevel(logging.DEBUG)
+
+    start_instrumentation(args)
+
+    scf_data = default_scf_data
+    if args.scffile:
+        if os.path.isfile(args.scffile):
+            scf_data = parse_scf_file(args.scffile)
+        else:
+            logger.error("not a existing file: {0}".format(args.scffile))
+            sys.exit(1)
+    signal_levels = SignalLevels(scf_data)
+
+    rasters = []
+    for filename in args.inputfiles:
+        if not os.path.isfile(filename):
+            logger.error("file not found: \"{0}\"".format(filename))
+            sys.exit(1)
+        rasters.append(open_site_raster(filename, signal_levels))
+
+    stats = calculate_stats(rasters, signal_levels, args.threads, not args.nonetwork)
+
+    output_file = open(args.outputfile, "w", newline='') if args.outputfile else sys.stdout
+    try:
+        if args.format == 'csv':
+            write_csv(stats, output_file)
+        else:
+            json.dump(stats, output_file, indent=2)
+            output_file.write("\n")
+    finally:
+        if args.outputfile:
+            output_file.close()
+
+    finish_instrumentation(args)
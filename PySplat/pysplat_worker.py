@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import argparse, sys, os
+import json
+import logging
+import shutil
+import subprocess
+import threading
+import time
+from PIL import Image
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from PySplat.pysplat import get_qth_files, create_qth_file_obj, add_range_arguments
+from PySplat.pysplat_split import split_map
+from PySplat.pysplat_downsample import start_downsampling
+from PySplat.pysplat_merge import merge_maps
+from PySplat.util.argparse_helper import check_thread_count, check_positive_int, check_zoom_level
+from PySplat.util.atomic_file import write_file_atomic
+from PySplat.util.backends import DEFAULT_BACKENDS, load_backend, add_backend_arguments, get_backends
+from PySplat.util.geo_file import parse_geo_file
+from PySplat.util.scf_file import parse_scf_file, default_scf_data, get_sorted_pixel_order
+from PySplat.util.splat import run_splat
+from PySplat.util.tile_writer import TileWriter
+from PySplat.util.work_queue import WorkQueue, get_worker_id
+
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+JOB_FILE = 'job.json'
+FINISHED_FILE = 'finished'  # written by the coordinator when it stops, contains whether it succeeded
+
+
+class LeaseLostError(Exception):
+    pass
+
+
+def _check_lease(lease_lost):
+    if lease_lost is not None and lease_lost.is_set():
+        raise LeaseLostError('lease was lost')
+
+
+def _get_sites(tiles_dir):
+    # directories starting with a dot are still written by a worker
+    if not os.path.isdir(tiles_dir):
+        return []  # no site was rendered successfully
+    return sorted(site for site in os.listdir(tiles_dir) if not site.startswith('.'))
+
+
+def render_item(job, item, backends=DEFAULT_BACKENDS, lease_lost=None):
+    '''
+    render a single site, and split it into the tile directory of this site.
+
+    When lease_lost is set (another worker may work on the same site now), the rendering is aborted. Until then, all
+    files are written into directories of this worker, so the other worker does not see or remove them.
+    '''
+    qth = create_qth_file_obj(item['qth_file'], range=item['range'], rx_height=item['rx_height'])
+    worker_id = get_worker_id()
+
+    ppm_dir = os.path.join(job['work_dir'], 'ppm', worker_id)
+    ppm_file = os.path.join(ppm_dir, '{name}.ppm'.format(name=qth.name))
+    tile_dir = os.path.join(job['work_dir'], 'tiles', qth.name)
+    tmp_tile_dir = os.path.join(job['work_dir'], 'tiles', '.{0}@{1}'.format(qth.name, worker_id))
+
+    try:
+        if not run_splat(qth, job['srtm_dir'], ppm_file) or not os.path.isfile(ppm_file):
+            raise RuntimeError('rendering of site failed: {0}'.format(qth))
+        _check_lease(lease_lost)
+
+        ppm_image = Image.open(ppm_file)
+        ppm_image.load()
+        geo_data = parse_geo_file(os.path.splitext(ppm_file)[0] + ".geo")
+
+        # the shared directory does not have to keep the big .ppm files
+        shutil.rmtree(ppm_dir, ignore_errors=True)
+
+        encoder = load_backend('encode', backends['encode'])
+        split_map(ppm_image, geo_data, tmp_tile_dir, job['zoom_levels'], dedup=job.get('dedup', False),
+                  mask=load_backend('split', backends['split']), encoder=encoder)
+        _check_lease(lease_lost)
+
+        if job['downsample_levels']:
+            start_downsampling(tmp_tile_dir, job['zoom_levels'][0], job['downsample_levels'],
+                               dedup=job.get('dedup', False), encoder=encoder)
+        _check_lease(lease_lost)
+
+        # tiles of a previous attempt which failed later on are replaced
+        shutil.rmtree(tile_dir, ignore_errors=True)
+        os.rename(tmp_tile_dir, tile_dir)
+    finally:
+        shutil.rmtree(ppm_dir, ignore_errors=True)
+        shutil.rmtree(tmp_tile_dir, ignore_errors=True)
+
+
+def merge_item(job, item, threads, backends=DEFAULT_BACKENDS, lease_lost=None):
+    '''
+    merge a range of tile columns of all sites into the output directory. Merging is idempotent, so a worker which
+    lost its lease only stops after the current column.
+    '''
+    scf_data = parse_scf_file(job['scf_file']) if job['scf_file'] else default_scf_data
+    image_order = get_sorted_pixel_order(scf_data)
+
+    tile_writer = TileWriter(job['output_dir'], threads=threads, dedup=job.get('dedup', False),
+                             encoder=load_backend('encode', backends['encode']))
+    tile_merger = load_backend('merge', backends['merge'])(image_order, threads, tile_writer)
+
+    tiles_dir = os.path.join(job['work_dir'], 'tiles')
+    sites = _get_sites(tiles_dir)
+
+    try:
+        for xtile in item['xtiles']:
+            _check_lease(lease_lost)
+
+            column = os.path.join(str(item['zoom']), str(xtile))
+            src_dirs = [os.path.join(tiles_dir, site, column) for site in sites if os.path.isdir(os.path.join(tiles_dir, site, column))]
+
+            tile_writer.prepare_range(item['zoom'], xtile, xtile)
+            merge_maps(src_dirs, os.path.join(job['output_dir'], column), tile_merger)
+    finally:
+        # waits until all tiles are written
+        tile_merger.shutdown()
+        tile_writer.close()
+
+
+def get_merge_items(job, merge_batch):
+    '''
+    all tile columns of the rendered sites, split into ranges of merge_batch columns per zoom level
+    '''
+    tiles_dir = os.path.join(job['work_dir'], 'tiles')
+
+    columns = set()
+    for site in _get_sites(tiles_dir):
+        for zoom in os.listdir(os.path.join(tiles_dir, site)):
+            for xtile in os.listdir(os.path.join(tiles_dir, site, zoom)):
+                columns.add((int(zoom), int(xtile)))
+
+    items = []
+    for zoom in sorted(set(zoom for (zoom, _) in columns)):
+        xtiles = sorted(xtile for (z, xtile) in columns if z == zoom)
+        for i in range(0, len(xtiles), merge_batch):
+            batch = xtiles[i:i + merge_batch]
+            item_id = 'merge-{0}-{1}-{2}'.format(zoom, batch[0], batch[-1])
+            items.append((item_id, {'kind': 'merge', 'zoom': zoom, 'xtiles': batch}))
+
+    return items
+
+
+def wait_for_queue(queue, poll_interval, workers=()):
+    while not queue.is_empty():
+        queue.requeue_expired()
+
+        if workers and all(worker.poll() is not None for worker in workers):
+            logger.error('all local workers exited, but the queue is not empty')
+            return False
+
+        time.sleep(poll_interval)
+
+    return True
+
+
+def run_coordinator(queue_dir, job, qth_files, **kwargs):
+    poll_interval = kwargs.get('poll_interval', 1.)
+    workers = kwargs.get('workers', ())
+
+    queue = WorkQueue(queue_dir, job['lease_timeout'], job['max_attempts'])
+
+    if os.path.exists(os.path.join(queue_dir, FINISHED_FILE)):
+        os.remove(os.path.join(queue_dir, FINISHED_FILE))
+
+    success = False
+    try:
+        write_file_atomic(os.path.join(queue_dir, JOB_FILE), json.dumps(job, indent=2).encode('utf-8'))
+
+        # render all sites first, we can only merge when all tiles are there
+        render_items = [('render-{0}'.format(qth.name), {'kind': 'render', 'qth_file': os.path.abspath(qth.qth_file),
+                                                         'range': qth.range, 'rx_height': qth.rx_height})
+                        for qth in qth_files]
+        print("publish {0} of {1} sites for rendering".format(queue.put_all(render_items), len(render_items)))
+        if not wait_for_queue(queue, poll_interval, workers):
+            return False
+
+        merge_items = get_merge_items(job, kwargs.get('merge_batch', 16))
+        print("publish {0} of {1} tile ranges for merging".format(queue.put_all(merge_items), len(merge_items)))
+        if not wait_for_queue(queue, poll_interval, workers):
+            return False
+
+        failed = queue.get_failed()
+        if failed:
+            print("failed work items: {0}".format(', '.join(failed)))
+
+        print("finished: {0}".format(queue.get_counts()))
+        success = not failed
+        return success
+    finally:
+        # also when we failed or got interrupted, otherwise the workers would wait for work forever
+        write_file_atomic(os.path.join(queue_dir, FINISHED_FILE), json.dumps({'success': success}).encode('utf-8'))
+
+
+def get_finished_state(queue_dir):
+    '''
+    None while the coordinator is running, otherwise whether it succeeded
+    '''
+    try:
+        with open(os.path.join(queue_dir, FINISHED_FILE), "r") as file:
+            return bool(json.load(file).get('success'))
+    except FileNotFoundError:
+        return None
+
+
+def _keep_alive(queue, lease, stop_event, lease_lost):
+    while not stop_event.wait(queue.lease_timeout / 4.):
+        if not queue.heartbeat(lease):
+            logger.warning('lost lease of {0}'.format(lease.item_id))
+            lease_lost.set()
+            return
+
+
+def run_worker(queue_dir, threads, **kwargs):
+    poll_interval = kwargs.get('poll_interval', 1.)
+
+    job_file = os.path.join(queue_dir, JOB_FILE)
+    while not os.path.isfile(job_file):
+        time.sleep(poll_interval)  # coordinator did not start yet
+
+    with open(job_file, "r") as file:
+        job = json.load(file)
+
+    queue = WorkQueue(queue_dir, job['lease_timeout'], job['max_attempts'])
+    worker_id = get_worker_id()
+    logger.info('worker {0} started'.format(worker_id))
+
+    while get_finished_state(queue_dir) is None:
+        lease = queue.lease(worker_id)
+        if lease is None:
+            time.sleep(poll_interval)
+            continue
+
+        logger.info('{0} works on {1}'.format(worker_id, lease.item_id))
+
+        stop_event = threading.Event()
+        lease_lost = threading.Event()
+        heartbeat = threading.Thread(target=_keep_alive, args=(queue, lease, stop_event, lease_lost))
+        heartbeat.start()
+
+        try:
+            if lease.item['kind'] == 'render':
+                render_item(job, lease.item, kwargs.get('backends', DEFAULT_BACKENDS), lease_lost)
+            else:
+                merge_item(job, lease.item, threads, kwargs.get('backends', DEFAULT_BACKENDS), lease_lost)
+            queue.complete(lease)
+        except LeaseLostError as e:
+            # the item is already back in the queue, and maybe leased by another worker
+            logger.warning('{0} aborted: {1}'.format(lease.item_id, e))
+        except Exception as e:
+            logger.error('{0} failed: {1}'.format(lease.item_id, e))
+            queue.fail(lease)
+        finally:
+            stop_event.set()
+            heartbeat.join()
+
+    success = get_finished_state(queue_dir)
+    logger.info('worker {0} finished, coordinator {1}'.format(worker_id, 'succeeded' if success else 'failed'))
+    return success
+
+
+if __name__ == '__main__':
+    try:
+        parser = argparse.ArgumentParser(description='distributed rendering, using a work queue inside a directory which is shared between all hosts (e.g. NFS)')
+        subparsers = parser.add_subparsers(dest='mode')
+        subparsers.required = True
+
+        coordinator_parser = subparsers.add_parser('coordinator', help='publish the work and wait until it is done')
+        coordinator_parser.add_argument('queuedir', help='shared directory used for the work queue and intermediate tiles')
+        coordinator_parser.add_argument('qth', nargs='+', help='txsite(s).qth', action='store')
+        coordinator_parser.add_argument('outputdir', help='output directory where we store the merged tiles')
+        coordinator_parser.add_argument('--srtm', dest='srtmdir', default='./srtm', help='directory where srtm data is stored')
+        coordinator_parser.add_argument('--scf', dest='scffile', help='scf file required used for merging')
+        coordinator_parser.add_argument('-z', dest='zoomlevel', nargs='+', type=check_zoom_level, default=[range(6, 12 + 1)], help='zoom levels to split (default 6-12)')
+        coordinator_parser.add_argument('--downsample', dest='downsamplelevel', nargs='+', type=check_zoom_level, default=[range(0, 5 + 1)], help='zoom levels to calculate by downsampling the lowest split level (default 0-5)')
+        add_range_arguments(coordinator_parser)
+        coordinator_parser.add_argument('--lease-timeout', dest='leasetimeout', type=float, default=120., help='seconds without heartbeat until work of a worker is given to another one (default 120)')
+        coordinator_parser.add_argument('--max-attempts', dest='maxattempts', type=check_positive_int, default=3, help='how often a work item is tried before it is marked as failed (default 3)')
+        coordinator_parser.add_argument('--merge-batch', dest='mergebatch', type=check_positive_int, default=16, help='number of tile columns merged by a single work item (default 16)')
+        coordinator_parser.add_argument('--dedup', help='store identical tiles only once (as hardlinks)', action='store_true')
+        coordinator_parser.add_argument('--local-workers', dest='localworkers', type=int, default=0, help='start this number of workers on the local host')
+
+        worker_parser = subparsers.add_parser('worker', help='work on the published work until the coordinator is finished')
+        worker_parser.add_argument('queuedir', help='shared directory used for the work queue and intermediate tiles')
+        worker_parser.add_argument('--gpu', help='run merge algorihm using gpu (same as --merge-backend opencl)', action='store_true')
+
+        for subparser in (coordinator_parser, worker_parser):
+            add_backend_arguments(subparser, ['merge', 'split', 'encode'])
+            subparser.add_argument('-y', dest='threads', type=check_thread_count, default=1, help='number of threads (of every worker)')
+            subparser.add_argument('--poll-interval', dest='pollinterval', type=float, default=1., help='seconds to wait when there is nothing to do (default 1)')
+            subparser.add_argument('-v', '--verbose', help='show extra information', action='store_true')
+            subparser.add_argument('-d', '--debug', help='show debug informations', action='store_true')
+
+        args = parser.parse_args()
+
+        if args.verbose:
+            logger.setLevel(logging.INFO)
+            logging.getLogger('PySplat').setLevel(logging.INFO)
+
+        if args.debug:
+            logger.setLevel(logging.DEBUG)
+            logging.getLogger('PySplat').setLevel(logging.DEBUG)
+
+        # every host selects its own backends
+        backends = get_backends(args, ['merge', 'split', 'encode'])
+
+        if args.mode == 'worker':
+            success = run_worker(args.queuedir, args.threads, poll_interval=args.pollinterval, backends=backends)
+            sys.exit(0 if success else 1)
+
+        # parse list of zoom levels we want to render
+        zoom_levels_set = set()
+        for level in args.zoomlevel:
+            zoom_levels_set.update(level)
+        zoom_levels = sorted(zoom_levels_set)
+
+        downsample_levels_set = set()
+        for level in args.downsamplelevel:
+            downsample_levels_set.update(level)
+        downsample_levels = sorted(downsample_levels_set)
+
+        if downsample_levels and downsample_levels[-1] >= zoom_levels[0]:
+            print("we can only downsample below the lowest split zoom level ({0})".format(zoom_levels[0]))
+            sys.exit(1)
+
+        if args.scffile and not os.path.isfile(args.scffile):
+            print("not a existing file: {0}".format(args.scffile))
+            sys.exit(1)
+
+        qth_files = get_qth_files(args.qth, range=args.range, rx_height=args.rxheight, auto_range=args.autorange)
+
+        # all paths have to be absolute, and the same on every host
+        job = {
+            'work_dir': os.path.abspath(os.path.join(args.queuedir, 'work')),
+            'output_dir': os.path.abspath(args.outputdir),
+            'srtm_dir': os.path.abspath(args.srtmdir),
+            'scf_file': os.path.abspath(args.scffile) if args.scffile else None,
+            'zoom_levels': zoom_levels,
+            'downsample_levels': downsample_levels,
+            'lease_timeout': args.leasetimeout,
+            'max_attempts': args.maxattempts,
+            'dedup': args.dedup
+        }
+
+        os.makedirs(job['work_dir'], exist_ok=True)
+        os.makedirs(job['output_dir'], exist_ok=True)
+
+        workers = []
+        for _ in range(args.localworkers):
+            worker_call = [sys.executable, os.path.abspath(__file__), 'worker', args.queuedir, '-y', str(args.threads),
+                           '--poll-interval', str(args.pollinterval)]
+            for kind, name in sorted(backends.items()):
+                worker_call += ['--{0}-backend'.format(kind), name]
+            if args.verbose:
+                worker_call.append('-v')
+            workers.append(subprocess.Popen(worker_call))
+
+        success = False
+        try:
+            success = run_coordinator(args.queuedir, job, qth_files, poll_interval=args.pollinterval,
+                                      merge_batch=args.mergebatch, workers=workers)
+        finally:
+            for worker in workers:
+                if not success:
+                    worker.terminate()
+                worker.wait()
+
+        sys.exit(0 if success else 1)
+
+    except KeyboardInterrupt:
+        pass
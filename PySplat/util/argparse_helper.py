@@ -29,6 +29,13 @@ def check_thread_count(value):
     return ivalue
 
 
+def check_positive_int(value):
+    ivalue = int(value)
+    if ivalue < 1:
+         raise argparse.ArgumentTypeError("value has to be >= 1")
+    return ivalue
+
+
 def check_zoom_level(value):
     levels = []
     if value.isdigit():
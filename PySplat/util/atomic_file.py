@@ -0,0 +1,83 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import io
+import os
+import socket
+import threading
+
+from PySplat.util.instrumentation import metrics
+
+
+def get_temp_filename(filename):
+    # the temporary file has to be in the same directory, otherwise os.replace is not atomic. The directory may be
+    # shared between hosts (e.g. distributed rendering), so the hostname is part of the name as well
+    return "{0}.{1}-{2}-{3}.tmp".format(filename, socket.gethostname(), os.getpid(), threading.get_ident())
+
+
+def sync_directory(directory):
+    '''
+    make the creation or rename of files inside directory durable (not supported on all platforms)
+    '''
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+
+    fd = os.open(directory or '.', os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file_atomic(filename, data):
+    '''
+    write data without leaving a truncated file behind in case we get interrupted or the system crashes.
+
+    The data is written into a temporary file first, which is synced to disk and then renamed to the final filename.
+    Afterwards the directory is synced as well, so the rename is not lost either.
+    '''
+    tmp_filename = get_temp_filename(filename)
+
+    try:
+        with metrics.timer('write'):
+            with open(tmp_filename, "wb") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_filename, filename)
+            sync_directory(os.path.dirname(filename))
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+def encode_image(image, format="PNG", **kwargs):
+    with metrics.timer('encode'):
+        data = io.BytesIO()
+        image.save(data, format, **kwargs)
+        return data.getvalue()
+
+
+def encode_image_fast(image, format="PNG", **kwargs):
+    # faster, but bigger files
+    return encode_image(image, format, compress_level=1, **kwargs)
+
+
+def save_image_atomic(image, filename, format="PNG", **kwargs):
+    write_file_atomic(filename, encode_image(image, format, **kwargs))
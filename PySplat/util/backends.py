@@ -0,0 +1,251 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from PySplat.util.atomic_file import write_file_atomic
+
+
+logger = logging.getLogger(__name__)
+
+
+# kind -> name -> (module, attribute, required packages). Modules are only imported when the backend is used,
+# so slow imports like pyopencl do not slow down the startup of every command.
+BACKENDS = OrderedDict([
+    ('merge', OrderedDict([
+        ('python', ('PySplat.pysplat_merge', 'TileMerger', ())),
+        ('numpy', ('PySplat.util.numpy_merge', 'NumpyTileMerger', ('numpy',))),
+        ('opencl', ('PySplat.util.opencl_merge', 'OpenCLTileMerger', ('numpy', 'pyopencl'))),
+    ])),
+    ('split', OrderedDict([
+        ('python', ('PySplat.pysplat_split', 'mask_blank_pixels', ())),
+        ('numpy', ('PySplat.util.numpy_split', 'mask_blank_pixels', ('numpy',))),
+    ])),
+    ('encode', OrderedDict([
+        ('pil', ('PySplat.util.atomic_file', 'encode_image', ())),
+        ('pil-fast', ('PySplat.util.atomic_file', 'encode_image_fast', ())),
+    ])),
+])
+
+DEFAULT_BACKENDS = {'merge': 'python', 'split': 'python', 'encode': 'pil'}
+
+# those backends create different (but valid) output, so auto never selects them
+_NOT_AUTO = {('encode', 'pil-fast')}
+
+
+def get_backend_requirements(kind, name):
+    return BACKENDS[kind][name][2]
+
+
+def get_missing_requirements(kind, name):
+    return [package for package in get_backend_requirements(kind, name) if importlib.util.find_spec(package) is None]
+
+
+def is_backend_available(kind, name):
+    return not get_missing_requirements(kind, name)
+
+
+def get_available_backends(kind):
+    return [name for name in BACKENDS[kind] if is_backend_available(kind, name)]
+
+
+def load_backend(kind, name):
+    '''
+    import the backend and return its implementation (a TileMerger class, a mask or an encode function)
+    '''
+    if name not in BACKENDS[kind]:
+        raise ValueError('unknown {0} backend: "{1}"'.format(kind, name))
+
+    if not is_backend_available(kind, name):
+        raise ValueError('{0} backend "{1}" requires the missing packages: {2}'.format(
+            kind, name, ', '.join(get_missing_requirements(kind, name))))
+
+    (module, attribute, _) = BACKENDS[kind][name]
+    return getattr(importlib.import_module(module), attribute)
+
+
+def _get_cache_file():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'pysplat', 'backends.json')
+
+
+def _load_cache():
+    try:
+        with open(_get_cache_file(), 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _store_cache(cache):
+    try:
+        os.makedirs(os.path.dirname(_get_cache_file()), exist_ok=True)
+        write_file_atomic(_get_cache_file(), json.dumps(cache, indent=2, sort_keys=True).encode('utf-8'))
+    except (IOError, OSError) as e:
+        logger.warning('cannot store calibration results: {0}'.format(e))
+
+
+def _get_test_tile(color_order, offset=0):
+    '''
+    deterministic tile which contains every color, white and black pixels and some transparent areas
+    '''
+    colors = list(color_order) + [(255, 255, 255, 255), (0, 0, 0, 255)]
+    pixels = []
+    for y in range(256):
+        for x in range(256):
+            if (x + offset) % 64 < 16:
+                pixels += [(255, 255, 255, 0)]
+            else:
+                pixels += [colors[(x // 8 + y // 8 + offset) % len(colors)]]
+
+    image = Image.new('RGBA', (256, 256))
+    image.putdata(pixels)
+    return image
+
+
+def _get_calibration_task(kind, implementation):
+    '''
+    returns a function which runs a typical workload of the backend once, and a function to clean up
+    '''
+    from PySplat.util.scf_file import default_scf_data, get_sorted_pixel_order
+
+    image_order = get_sorted_pixel_order(default_scf_data)
+    tiles = [_get_test_tile(image_order, offset) for offset in (0, 21, 42, 5)]
+
+    if kind == 'merge':
+        merger = implementation(image_order, 1)
+        return (lambda: merger.merge_loaded_images(tiles)), merger.shutdown
+    elif kind == 'split':
+        return (lambda: implementation(tiles[0].copy())), (lambda: None)
+    else:
+        return (lambda: implementation(tiles[0], "PNG")), (lambda: None)
+
+
+def _measure(task, min_time=0.5, max_runs=5):
+    task()  # warmup, e.g. to compile OpenCL kernels
+
+    best = None
+    start = time.perf_counter()
+    for _ in range(max_runs):
+        run_start = time.perf_counter()
+        task()
+        run_time = time.perf_counter() - run_start
+        best = run_time if best is None else min(best, run_time)
+        if time.perf_counter() - start > min_time:
+            break
+    return best
+
+
+def calibrate_backends(kind, candidates):
+    '''
+    run a short workload using every candidate, returns the name of the fastest one and the time of every candidate
+    '''
+    results = OrderedDict()
+    for name in candidates:
+        try:
+            (task, cleanup) = _get_calibration_task(kind, load_backend(kind, name))
+            try:
+                results[name] = _measure(task)
+            finally:
+                cleanup()
+        except Exception as e:
+            # e.g. OpenCL is installed, but there is no OpenCL device
+            logger.warning('{0} backend "{1}" failed during calibration: {2}'.format(kind, name, e))
+
+    if not results:
+        return DEFAULT_BACKENDS[kind], results
+
+    return min(results, key=results.get), results
+
+
+def resolve_backend(kind, name='auto', recalibrate=False):
+    '''
+    returns the name of the backend, "auto" is resolved to the fastest available backend of this machine.
+
+    The result of the calibration is cached per host, python version and installed backends.
+    '''
+    if name != 'auto':
+        load_backend(kind, name)  # fail early if the backend is not usable
+        return name
+
+    candidates = [candidate for candidate in get_available_backends(kind) if (kind, candidate) not in _NOT_AUTO]
+    if len(candidates) == 1:
+        return candidates[0]
+
+    cache_key = '{0}|{1}|{2}|{3}'.format(kind, platform.node(), platform.python_version(), ','.join(candidates))
+    cache = _load_cache()
+    if not recalibrate and cache.get(cache_key) in candidates:
+        logger.info('use cached {0} backend: {1}'.format(kind, cache[cache_key]))
+        return cache[cache_key]
+
+    (name, results) = calibrate_backends(kind, candidates)
+    print("calibrate {0} backends: {1} -> {2}".format(
+        kind, ', '.join('{0} {1:.1f}ms'.format(candidate, seconds * 1000) for (candidate, seconds) in results.items()), name))
+
+    cache[cache_key] = name
+    _store_cache(cache)
+    return name
+
+
+def add_backend_arguments(parser, kinds, defaults=None):
+    '''
+    defaults (kind -> name) overrides DEFAULT_BACKENDS, get_backends has to be called with the same defaults
+    '''
+    defaults = dict(DEFAULT_BACKENDS, **(defaults or {}))
+    names = sorted(set(name for kind in kinds for name in BACKENDS[kind]))
+    parser.add_argument('--backend', choices=names + ['auto'], help='backend used for {0} where available, '
+                        '"auto" selects the fastest one of this machine'.format(', '.join(kinds)))
+    for kind in kinds:
+        parser.add_argument('--{0}-backend'.format(kind), dest='{0}backend'.format(kind), choices=list(BACKENDS[kind]) + ['auto'],
+                            help='{0} backend (default {1})'.format(kind, defaults[kind]))
+    parser.add_argument('--recalibrate', help='ignore the cached results of "auto"', action='store_true')
+
+
+def get_backends(args, kinds, defaults=None):
+    '''
+    resolve the backends selected on the command line, returns kind -> name. Exits if a backend is not usable.
+    '''
+    defaults = dict(DEFAULT_BACKENDS, **(defaults or {}))
+    backends = {}
+    for kind in kinds:
+        name = getattr(args, '{0}backend'.format(kind), None)
+        if name is None and (args.backend == 'auto' or args.backend in BACKENDS[kind]):
+            name = args.backend
+        if name is None and kind == 'merge' and getattr(args, 'gpu', False):
+            name = 'opencl'
+
+        try:
+            backends[kind] = resolve_backend(kind, name or defaults[kind], args.recalibrate)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+        logger.info('use {0} backend: {1}'.format(kind, backends[kind]))
+
+    return backends
@@ -0,0 +1,185 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None  # not available on windows
+
+
+class Metrics(object):
+    '''
+    collects timings of every processing stage and some counters, which can be written as JSON run report.
+
+    All methods are thread safe, so a single instance can be used by all worker threads.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start_time = time.time()
+        self._timers = {}
+        self._counters = {}
+        self._gauges = {}
+        self._profile_stats = None
+        self._profile_lock = threading.Lock()  # held by the thread which is profiled right now
+        self.profiling = False
+
+    def reset(self):
+        with self._lock:
+            self._start_time = time.time()
+            self._timers = {}
+            self._counters = {}
+            self._gauges = {}
+            self._profile_stats = None
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            timer = self._timers.setdefault(name, {'count': 0, 'total': 0., 'max': 0.})
+            timer['count'] += 1
+            timer['total'] += seconds
+            timer['max'] = max(timer['max'], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        '''
+        current value of something like a queue size, the report contains the last and the maximum value
+        '''
+        with self._lock:
+            gauge = self._gauges.setdefault(name, {'last': value, 'max': value})
+            gauge['last'] = value
+            gauge['max'] = max(gauge['max'], value)
+
+    def get_counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    @contextlib.contextmanager
+    def profile(self):
+        '''
+        profile the enclosed code using cProfile (only when profiling is enabled).
+
+        cProfile only sees the thread it is enabled in, and only one profiler can be active at the same time (Python
+        3.12 raises otherwise). So only one hot path is profiled at a time, hot paths which run on other threads
+        meanwhile (or nested ones) are not profiled. The results of all profiled hot paths are summed up afterwards.
+        '''
+        if not self.profiling or not self._profile_lock.acquire(blocking=False):
+            yield
+            return
+
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                with self._lock:
+                    if self._profile_stats is None:
+                        self._profile_stats = pstats.Stats(profiler)
+                    else:
+                        self._profile_stats.add(profiler)
+        finally:
+            self._profile_lock.release()
+
+    def get_report(self):
+        with self._lock:
+            timers = {}
+            for name, timer in sorted(self._timers.items()):
+                timers[name] = dict(timer)
+                timers[name]['mean'] = timer['total'] / timer['count'] if timer['count'] else 0.
+
+            return {'wall_time': time.time() - self._start_time,
+                    'peak_rss': get_peak_rss(),
+                    'timers': timers,
+                    'counters': dict(sorted(self._counters.items())),
+                    'gauges': {name: dict(gauge) for name, gauge in sorted(self._gauges.items())}}
+
+    def write_report(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.get_report(), file, indent=2, sort_keys=True)
+
+    def write_profile(self, filename, limit=30):
+        with self._lock:
+            if self._profile_stats is None:
+                return None
+
+            self._profile_stats.dump_stats(filename)
+
+            summary = io.StringIO()
+            self._profile_stats.stream = summary
+            self._profile_stats.sort_stats('cumulative').print_stats(limit)
+            return summary.getvalue()
+
+
+def get_peak_rss():
+    '''
+    peak resident set size of this process in bytes (or None if we do not know it)
+    '''
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak_rss  # already in bytes
+    return peak_rss * 1024  # linux reports kilobytes
+
+
+# metrics of the current run, shared by all modules
+metrics = Metrics()
+
+
+def add_instrumentation_arguments(parser):
+    parser.add_argument('--report', dest='reportfile', help='write timings, counters and peak memory usage as JSON run report into this file')
+    parser.add_argument('--profile', help='profile the hot paths using cProfile (stored next to the run report, or as pysplat.prof)', action='store_true')
+
+
+def start_instrumentation(args):
+    metrics.reset()
+    metrics.profiling = args.profile
+
+
+def finish_instrumentation(args):
+    if args.reportfile:
+        metrics.write_report(args.reportfile)
+        print("run report written to: {0}".format(args.reportfile))
+
+    if args.profile:
+        profile_file = args.reportfile + ".prof" if args.reportfile else "pysplat.prof"
+        summary = metrics.write_profile(profile_file)
+        if summary is not None:
+            print(summary)
+            print("profile written to: {0}".format(profile_file))
@@ -0,0 +1,82 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import os
+import sqlite3
+import threading
+import time
+
+
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+
+class JobJournal(object):
+    '''
+    crash-safe journal which stores the state of every site and tile batch of a job.
+
+    The journal is a SQLite database inside the output directory. Every state change is committed immediately,
+    so after an interruption we know exactly which work was finished and which has to be done again.
+    '''
+    def __init__(self, output_dir, filename='.pysplat_journal.sqlite'):
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        self.filename = os.path.join(output_dir, filename)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.filename, check_same_thread=False)
+
+        with self._lock, self._db:
+            self._db.execute('''CREATE TABLE IF NOT EXISTS journal (
+                                    kind TEXT NOT NULL,
+                                    key TEXT NOT NULL,
+                                    state TEXT NOT NULL,
+                                    updated REAL NOT NULL,
+                                    PRIMARY KEY (kind, key))''')
+
+    def _set_state(self, kind, key, state):
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO journal (kind, key, state, updated) VALUES (?, ?, ?, ?)',
+                             (kind, str(key), state, time.time()))
+
+    def get_state(self, kind, key):
+        with self._lock:
+            row = self._db.execute('SELECT state FROM journal WHERE kind = ? AND key = ?', (kind, str(key))).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, kind, key):
+        return self.get_state(kind, key) == STATE_DONE
+
+    def mark_running(self, kind, key):
+        self._set_state(kind, key, STATE_RUNNING)
+
+    def mark_done(self, kind, key):
+        self._set_state(kind, key, STATE_DONE)
+
+    def mark_failed(self, kind, key):
+        self._set_state(kind, key, STATE_FAILED)
+
+    def get_summary(self):
+        with self._lock:
+            rows = self._db.execute('SELECT kind, state, COUNT(*) FROM journal GROUP BY kind, state').fetchall()
+        return {(kind, state): count for (kind, state, count) in rows}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
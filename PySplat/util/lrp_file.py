@@ -0,0 +1,56 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import re
+
+
+_lrp_value_match = re.compile("^\s*([-+0-9.eE]+)")
+
+# order of the values inside a .lrp file
+_lrp_keys = ['earth_dielectric_constant', 'earth_conductivity', 'atmospheric_bending_constant', 'frequency',
+             'radio_climate', 'polarization', 'fraction_of_situations', 'fraction_of_time', 'erp']
+
+
+def parse_lrp_file(lrp_file):
+    '''
+    15.000 ; Earth Dielectric Constant (Relative permittivity)
+    0.005 ; Earth Conductivity (Siemens per meter)
+    301.000 ; Atmospheric Bending Constant (N-units)
+    145.750 ; Frequency in MHz (20 MHz to 20 GHz)
+    5 ; Radio Climate (5 = Continental Temperate)
+    0 ; Polarization (0 = Horizontal, 1 = Vertical)
+    0.50 ; Fraction of situations (50% of locations)
+    0.90 ; Fraction of time (90% of the time)
+    10.0 ; Effective Radiated Power (ERP) in Watts (optional)
+    '''
+
+    lrp_data = {'erp': 0.}  # without ERP, SPLAT calculates path loss instead of field strength
+
+    values = []
+    with open(lrp_file, "r") as file:
+        for line in file.readlines():
+            match = _lrp_value_match.match(line)
+            if match:
+                values.append(float(match.group(1)))
+
+    if len(values) < len(_lrp_keys) - 1:
+        raise ValueError("incomplete .lrp file: {0}".format(lrp_file))
+
+    lrp_data.update(zip(_lrp_keys, values))
+
+    return lrp_data
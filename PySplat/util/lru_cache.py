@@ -0,0 +1,70 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''
+    thread safe least recently used cache, which is limited by the summed up size of its entries
+    '''
+    def __init__(self, max_size, get_size=len):
+        self._max_size = max_size
+        self._get_size = get_size
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        size = self._get_size(value)
+        if size > self._max_size:
+            return  # would evict everything else
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._get_size(self._entries.pop(key))
+
+            self._entries[key] = value
+            self._size += size
+
+            while self._size > self._max_size:
+                (_, evicted) = self._entries.popitem(last=False)
+                self._size -= self._get_size(evicted)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def size(self):
+        with self._lock:
+            return self._size
@@ -0,0 +1,253 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import numpy
+
+
+# corners of a cell: top left, top right, bottom right, bottom left as (x, y) offsets
+_corners = ((0., 0.), (1., 0.), (1., 1.), (0., 1.))
+
+# edges of a cell (top, right, bottom, left) with the (x, y) offset of their midpoints, and the corners they connect
+_edges = (((0.5, 0.), (0, 1)), ((1., 0.5), (1, 2)), ((0.5, 1.), (2, 3)), ((0., 0.5), (3, 0)))
+
+
+def _build_segment_table():
+    '''
+    segments of every one of the 16 cell configurations, oriented so the inside is always on the same side.
+
+    The saddle configurations (diagonal corners inside) are resolved by separating the two corners.
+    '''
+    table = []
+    for case in range(16):
+        inside = [bool(case & (8 >> corner)) for corner in range(4)]
+        crossing = [edge for edge in range(4) if inside[_edges[edge][1][0]] != inside[_edges[edge][1][1]]]
+
+        if len(crossing) == 4:
+            # saddle: cut off every inside corner on its own
+            pairs = [(edge, (edge + 1) % 4) for edge in range(4) if inside[(edge + 1) % 4]]
+        elif len(crossing) == 2:
+            pairs = [tuple(crossing)]
+        else:
+            pairs = []
+
+        segments = []
+        for (edge_a, edge_b) in pairs:
+            (ax, ay) = _edges[edge_a][0]
+            (bx, by) = _edges[edge_b][0]
+            # any inside corner next to the segment decides about the orientation
+            corner = [c for c in _edges[edge_a][1] + _edges[edge_b][1] if inside[c]][0]
+            (cx, cy) = _corners[corner]
+            if (bx - ax) * (cy - ay) - (by - ay) * (cx - ax) < 0:
+                (edge_a, edge_b) = (edge_b, edge_a)
+            segments.append((_edges[edge_a][0], _edges[edge_b][0]))
+        table.append(segments)
+    return table
+
+
+_segment_table = _build_segment_table()
+
+
+def find_segments(mask):
+    '''
+    vectorized marching squares of a boolean mask, returns (start, end) arrays of shape (n, 2) in pixel coordinates.
+
+    The mask is padded with False, which means all contours are closed.
+    '''
+    padded = numpy.pad(numpy.asarray(mask, dtype=numpy.uint8), 1)
+    case = (padded[:-1, :-1] << 3) | (padded[:-1, 1:] << 2) | (padded[1:, 1:] << 1) | padded[1:, :-1]
+
+    # only cells on the border of an area contain segments, so we do not need to look at the whole array again
+    (border_y, border_x) = numpy.nonzero((case != 0) & (case != 15))
+    border_case = case[border_y, border_x]
+
+    starts = []
+    ends = []
+    for case_index in numpy.unique(border_case):
+        selected = border_case == case_index
+
+        # the padding shifts everything by one pixel
+        cells = numpy.stack([border_x[selected] - 1, border_y[selected] - 1], axis=1).astype(numpy.float64)
+        for (start, end) in _segment_table[case_index]:
+            starts.append(cells + start)
+            ends.append(cells + end)
+
+    if not starts:
+        return (numpy.zeros((0, 2)), numpy.zeros((0, 2)))
+    return (numpy.concatenate(starts), numpy.concatenate(ends))
+
+
+def link_segments(starts, ends):
+    '''
+    links oriented segments into closed rings, returns a list of (n, 2) arrays
+    '''
+    if len(starts) == 0:
+        return []
+
+    # all coordinates are multiples of 0.5, so they can be used as exact integer keys
+    def keys(points):
+        doubled = numpy.round(points * 2).astype(numpy.int64)
+        return doubled[:, 0] * (1 << 32) + doubled[:, 1]
+
+    start_keys = keys(starts)
+    order = numpy.argsort(start_keys, kind='stable')
+    position = numpy.searchsorted(start_keys[order], keys(ends))
+    following = order[position.clip(0, len(order) - 1)]
+
+    # every segment has exactly one follower, so the rings are the cycles of this permutation. Walking the segments
+    # one by one in python is slow, so pointer jumping is used: first every ring is labeled with its smallest index
+    index = numpy.arange(len(starts))
+    steps = int(numpy.ceil(numpy.log2(len(starts)))) + 1
+
+    label = index.copy()
+    jump = following
+    for _ in range(steps):
+        label = numpy.minimum(label, label[jump])
+        jump = jump[jump]
+
+    # then the ring is cut in front of this first segment, and the distance of every segment to the cut is calculated
+    is_first = label == index
+    jump = numpy.where(is_first, index, following)
+    distance = (~is_first).astype(numpy.int64)
+    for _ in range(steps):
+        distance = distance + distance[jump]
+        jump = jump[jump]
+
+    order = numpy.lexsort((-numpy.where(is_first, len(starts), distance), label))
+    boundaries = numpy.nonzero(numpy.diff(label[order]))[0] + 1
+
+    return numpy.split(starts[order], boundaries)
+
+
+def remove_collinear(ring):
+    '''
+    removes all points which are located on a straight line between their neighbours
+    '''
+    if len(ring) < 4:
+        return ring
+
+    previous = numpy.concatenate([ring[-1:], ring[:-1]])
+    following = numpy.concatenate([ring[1:], ring[:1]])
+    cross = (ring[:, 0] - previous[:, 0]) * (following[:, 1] - ring[:, 1]) - \
+            (ring[:, 1] - previous[:, 1]) * (following[:, 0] - ring[:, 0])
+    return ring[cross != 0]
+
+
+def _simplify_line(points, tolerance):
+    keep = numpy.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        (first, last) = stack.pop()
+        if last - first < 2:
+            continue
+
+        (ax, ay) = points[first]
+        (bx, by) = points[last]
+        inner = points[first + 1:last]
+        length = numpy.hypot(bx - ax, by - ay)
+        if length == 0:
+            distance = numpy.hypot(inner[:, 0] - ax, inner[:, 1] - ay)
+        else:
+            distance = numpy.abs((bx - ax) * (ay - inner[:, 1]) - (ax - inner[:, 0]) * (by - ay)) / length
+
+        farthest = int(numpy.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return points[keep]
+
+
+def simplify_ring(ring, tolerance):
+    '''
+    Douglas-Peucker simplification of a closed ring, returns None if the ring collapses
+    '''
+    if tolerance > 0 and len(ring) > 4:
+        # split the ring at the point farthest away from the first one, so both halves are simple lines
+        farthest = int(numpy.argmax(numpy.hypot(ring[:, 0] - ring[0, 0], ring[:, 1] - ring[0, 1])))
+        first_half = _simplify_line(ring[:farthest + 1], tolerance)
+        second_half = _simplify_line(numpy.concatenate([ring[farthest:], ring[:1]]), tolerance)
+        ring = numpy.concatenate([first_half, second_half[1:-1]])
+
+    if len(ring) < 3:
+        return None
+    return ring
+
+
+def signed_area(ring):
+    x = ring[:, 0]
+    y = ring[:, 1]
+    return 0.5 * float(numpy.dot(x[:-1], y[1:]) - numpy.dot(x[1:], y[:-1]) + x[-1] * y[0] - x[0] * y[-1])
+
+
+def point_in_ring(point, ring):
+    (px, py) = point
+    x = ring[:, 0]
+    y = ring[:, 1]
+    next_x = numpy.concatenate([x[1:], x[:1]])
+    next_y = numpy.concatenate([y[1:], y[:1]])
+
+    crossing = (y > py) != (next_y > py)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        intersect_x = x + (py - y) * (next_x - x) / (next_y - y)
+    return bool(numpy.count_nonzero(crossing & (px < intersect_x)) % 2)
+
+
+def find_polygons(mask, tolerance=0.):
+    '''
+    returns the polygons of all True areas of the mask as list of [outer ring, hole, hole, ...] in pixel coordinates
+    '''
+    (starts, ends) = find_segments(mask)
+
+    outer_rings = []
+    outer_areas = []
+    holes = []
+    for ring in link_segments(starts, ends):
+        ring = simplify_ring(remove_collinear(ring), tolerance)
+        if ring is None:
+            continue
+
+        # the segments are oriented, so outer rings and holes have a different orientation
+        area = signed_area(ring)
+        if area > 0:
+            outer_rings.append(ring)
+            outer_areas.append(area)
+        else:
+            holes.append(ring)
+
+    polygons = [[ring] for ring in outer_rings]
+    if not holes:
+        return polygons
+
+    lows = numpy.array([ring.min(axis=0) for ring in outer_rings]).reshape(-1, 2)
+    highs = numpy.array([ring.max(axis=0) for ring in outer_rings]).reshape(-1, 2)
+    outer_areas = numpy.asarray(outer_areas)
+
+    for hole in holes:
+        point = hole[0]
+        candidates = numpy.nonzero((lows <= point).all(axis=1) & (point <= highs).all(axis=1))[0]
+        # holes are inside the smallest outer ring which contains them
+        for i in candidates[numpy.argsort(outer_areas[candidates])]:
+            if point_in_ring(point, outer_rings[i]):
+                polygons[i].append(hole)
+                break
+
+    return polygons
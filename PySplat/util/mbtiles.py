@@ -0,0 +1,97 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import sqlite3
+import threading
+
+
+class MBTilesStore(object):
+    '''
+    stores tiles inside a MBTiles file (SQLite), identical tiles are stored only once.
+
+    This uses the deduplicating layout of MBTiles: the map table references the images table by tile_id, and the
+    tiles view joins both of them, which is what MBTiles readers use. Rows are counted in TMS order (y flipped).
+    '''
+    def __init__(self, filename, name=None):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._known_images = set()
+
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT NOT NULL, value TEXT, PRIMARY KEY (name))')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS map (
+                                    zoom_level INTEGER NOT NULL,
+                                    tile_column INTEGER NOT NULL,
+                                    tile_row INTEGER NOT NULL,
+                                    tile_id TEXT NOT NULL,
+                                    PRIMARY KEY (zoom_level, tile_column, tile_row))''')
+            self._db.execute('CREATE TABLE IF NOT EXISTS images (tile_id TEXT NOT NULL, tile_data BLOB, PRIMARY KEY (tile_id))')
+            self._db.execute('''CREATE VIEW IF NOT EXISTS tiles AS
+                                    SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column,
+                                           map.tile_row AS tile_row, images.tile_data AS tile_data
+                                    FROM map JOIN images ON images.tile_id = map.tile_id''')
+
+            metadata = {'name': name or 'pysplat', 'format': 'png', 'type': 'overlay'}
+            self._db.executemany('INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)', metadata.items())
+
+            self._known_images.update(row[0] for row in self._db.execute('SELECT tile_id FROM images'))
+
+    def has_image(self, tile_id):
+        with self._lock:
+            return tile_id in self._known_images
+
+    def put(self, zoom, xtile, ytile, tile_id, data=None):
+        '''
+        store a tile, data is only required if there is no image with this tile_id yet
+        '''
+        tile_row = 2 ** zoom - 1 - ytile
+
+        with self._lock, self._db:
+            if tile_id not in self._known_images:
+                self._db.execute('INSERT OR REPLACE INTO images (tile_id, tile_data) VALUES (?, ?)', (tile_id, sqlite3.Binary(data)))
+                self._known_images.add(tile_id)
+            self._db.execute('INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)',
+                             (zoom, xtile, tile_row, tile_id))
+
+    def get(self, zoom, xtile, ytile):
+        with self._lock:
+            row = self._db.execute('SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+                                   (zoom, xtile, 2 ** zoom - 1 - ytile)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def get_counts(self):
+        '''
+        (number of tiles, number of stored images)
+        '''
+        with self._lock:
+            tiles = self._db.execute('SELECT COUNT(*) FROM map').fetchone()[0]
+            images = self._db.execute('SELECT COUNT(*) FROM images').fetchone()[0]
+        return (tiles, images)
+
+    def close(self):
+        with self._lock, self._db:
+            (minzoom, maxzoom) = self._db.execute('SELECT MIN(zoom_level), MAX(zoom_level) FROM map').fetchone()
+            if minzoom is not None:
+                self._db.executemany('INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)',
+                                     [('minzoom', str(minzoom)), ('maxzoom', str(maxzoom))])
+
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,34 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import numpy
+from PIL import Image
+
+
+def mask_blank_pixels(source_img):
+    '''
+    vectorized variant of pysplat_split.mask_blank_pixels: white and black pixels become transparent
+    '''
+    pixels = numpy.array(source_img)
+
+    opaque = pixels[..., 3] == 255
+    white = opaque & (pixels[..., :3] == 255).all(axis=-1)
+    black = opaque & (pixels[..., :3] == 0).all(axis=-1)
+    pixels[white | black] = (255, 255, 255, 0)
+
+    return Image.fromarray(pixels, 'RGBA')
@@ -0,0 +1,363 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy
+import pyopencl as cl
+from PIL import Image
+
+from PySplat.pysplat_merge import TileMerger
+from PySplat.util.instrumentation import metrics
+from PySplat.util.tile_writer import TileWriter
+
+
+logger = logging.getLogger(__name__)
+
+
+_end_of_stream = object()
+
+# pixels are handled as uint32, using the byte order of the host (which has to be the one of the device)
+_TRANSPARENT = int(numpy.array([255, 255, 255, 0], dtype=numpy.uint8).view(numpy.uint32)[0])
+
+_MERGE_PROGRAM = '''//CL//
+__constant uint colors[COLOR_COUNT] = { COLORS };
+__constant int ranks[COLOR_COUNT] = { RANKS };
+
+// position of the color inside the image order, -1 for unknown colors (binary search over the sorted colors)
+int get_rank(uint pix) {
+    int low = 0;
+    int high = COLOR_COUNT;
+    while(low < high) {
+        int mid = (low + high) / 2;
+        if(colors[mid] < pix) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+    return (low < COLOR_COUNT && colors[low] == pix) ? ranks[low] : -1;
+}
+
+// merges all sources of every tile of the batch. sources contains the pixels of all source tiles, tiles the
+// index of the first source tile and the number of sources of every tile.
+__kernel void merge(
+    __global const uint *sources,
+    __global const int2 *tiles,
+    __global uint *dest,
+    const uint pixels
+)
+{
+    const size_t pixel = get_global_id(0);
+    const size_t tile = get_global_id(1);
+    const int2 tile_sources = tiles[tile];
+
+    __global const uint *src = sources + (size_t)tile_sources.x * pixels + pixel;
+
+    uint pix = src[0];
+    int rank = get_rank(pix);
+
+    for(int i = 1; i < tile_sources.y; i++) {
+        uint src_pix = src[(size_t)i * pixels];
+
+        if(pix == TRANSPARENT) {
+            pix = src_pix;
+            rank = get_rank(pix);
+            continue;
+        }
+
+        int src_rank = get_rank(src_pix);
+        if(src_rank != -1 && rank != -1 && src_rank < rank) {
+            pix = src_pix;
+            rank = src_rank;
+        }
+    }
+
+    dest[tile * pixels + pixel] = pix;
+}
+'''
+
+
+class _BufferSet(object):
+    '''
+    buffers of a single batch: pinned host buffers which are mapped once, and the device buffers they are copied
+    to. Buffers are reused for all batches, and only grow when a batch needs more space.
+    '''
+    def __init__(self, ctx):
+        self._ctx = ctx
+        self._buffers = {}  # name -> (host array, host buffer, device buffer)
+        self.queue = cl.CommandQueue(ctx)
+        self.lock = threading.Lock()
+        self.event = None
+        self.result = None
+
+    def get_host_array(self, name, count, dtype, device_flags):
+        (host_array, host_buffer, device_buffer) = self._buffers.get(name, (None, None, None))
+
+        if host_array is None or host_array.size < count:
+            capacity = count
+            if host_array is not None:
+                capacity = max(count, host_array.size * 2)
+                host_array.base.release(self.queue)
+                host_buffer.release()
+                device_buffer.release()
+
+            nbytes = capacity * numpy.dtype(dtype).itemsize
+            host_buffer = cl.Buffer(self._ctx, cl.mem_flags.READ_WRITE | cl.mem_flags.ALLOC_HOST_PTR, nbytes)
+            (host_array, _) = cl.enqueue_map_buffer(self.queue, host_buffer, cl.map_flags.READ | cl.map_flags.WRITE,
+                                                    0, (capacity,), dtype)
+            device_buffer = cl.Buffer(self._ctx, device_flags, nbytes)
+            self._buffers[name] = (host_array, host_buffer, device_buffer)
+
+        return host_array[:count]
+
+    def get_device_buffer(self, name):
+        return self._buffers[name][2]
+
+
+class OpenCLTileMerger(TileMerger):
+    '''
+    merges tiles using OpenCL, and creates exactly the same tiles as TileMerger.
+
+    Submitted tiles are decoded by the thread pool, and collected into batches of up to batch_size tiles which are
+    merged by a single kernel launch. The ranks of the colors are looked up in a constant table. Two sets of buffers
+    are used in turns, so the next batch is uploaded while the previous one is merged and downloaded.
+    '''
+    def __init__(self, image_order, threads, tile_writer=None, batch_size=64):
+        # merged tiles are encoded on other threads, so encoding does not stall the dispatching of batches
+        self._own_tile_writer = tile_writer is None
+        if self._own_tile_writer:
+            tile_writer = TileWriter(threads=threads)
+
+        TileMerger.__init__(self, image_order, threads, tile_writer)
+        self._batch_size = batch_size
+
+        # initialize OpenCL
+        self.ctx = cl.create_some_context(interactive = False)
+        self.prg = self._build_cl_program()
+        self._kernel = cl.Kernel(self.prg, 'merge')
+        self._kernel_lock = threading.Lock()  # kernel arguments are shared
+
+        self._buffer_sets = [_BufferSet(self.ctx), _BufferSet(self.ctx)]
+        self._next_buffer_set = itertools.count()
+
+        # submitted tiles which are not merged yet (still decoded, queued or inside a batch)
+        self._outstanding = 0
+        self._outstanding_lock = threading.Condition()
+
+        self._batch_queue = queue.Queue(maxsize=batch_size * 2)
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def _build_cl_program(self):
+        # the first occurrence of a color defines its rank
+        color_ranks = {}
+        for rank, color in enumerate(self._image_order):
+            packed = int(numpy.array(color, dtype=numpy.uint8).view(numpy.uint32)[0])
+            color_ranks.setdefault(packed, rank)
+        colors = sorted(color_ranks)
+
+        # load and build OpenCL function
+        source = _MERGE_PROGRAM \
+            .replace('COLOR_COUNT', str(len(colors))) \
+            .replace('COLORS', ', '.join('{0}u'.format(color) for color in colors)) \
+            .replace('RANKS', ', '.join(str(color_ranks[color]) for color in colors)) \
+            .replace('TRANSPARENT', '{0}u'.format(_TRANSPARENT))
+        return cl.Program(self.ctx, source).build()
+
+    def _enqueue_batch(self, buffers, batch):
+        '''
+        upload a batch (a list of source image lists, all of the same size) and start merging it
+        '''
+        (w, h) = batch[0][0].size
+        pixels = w * h
+
+        source_count = sum(len(source_images) for source_images in batch)
+        sources = buffers.get_host_array('sources', source_count * pixels, numpy.uint32, cl.mem_flags.READ_ONLY)
+        tiles = buffers.get_host_array('tiles', len(batch) * 2, numpy.int32, cl.mem_flags.READ_ONLY)
+        dest = buffers.get_host_array('dest', len(batch) * pixels, numpy.uint32, cl.mem_flags.WRITE_ONLY)
+
+        position = 0
+        for tile, source_images in enumerate(batch):
+            tiles[tile * 2:tile * 2 + 2] = (position, len(source_images))
+            for single_source in source_images:
+                if single_source.mode != 'RGBA':
+                    single_source = single_source.convert('RGBA')
+                sources[position * pixels:(position + 1) * pixels] = numpy.asarray(single_source).view(numpy.uint32).reshape(-1)
+                position += 1
+
+        cl.enqueue_copy(buffers.queue, buffers.get_device_buffer('sources'), sources, is_blocking=False)
+        cl.enqueue_copy(buffers.queue, buffers.get_device_buffer('tiles'), tiles, is_blocking=False)
+
+        with self._kernel_lock:
+            self._kernel.set_args(buffers.get_device_buffer('sources'), buffers.get_device_buffer('tiles'),
+                                  buffers.get_device_buffer('dest'), numpy.uint32(pixels))
+            cl.enqueue_nd_range_kernel(buffers.queue, self._kernel, (pixels, len(batch)), None)
+
+        buffers.event = cl.enqueue_copy(buffers.queue, dest, buffers.get_device_buffer('dest'), is_blocking=False)
+        buffers.result = (dest, (w, h), len(batch))
+
+    def _finish_batch(self, buffers):
+        '''
+        wait until the batch is merged, and return the merged images
+        '''
+        buffers.event.wait()
+        (dest, (w, h), count) = buffers.result
+        buffers.event = None
+        buffers.result = None
+
+        pixels = w * h
+        return [Image.frombytes('RGBA', (w, h), dest[tile * pixels:(tile + 1) * pixels].tobytes()) for tile in range(count)]
+
+    def merge_loaded_images(self, source_images):
+        buffers = self._buffer_sets[next(self._next_buffer_set) % len(self._buffer_sets)]
+        with buffers.lock:
+            self._enqueue_batch(buffers, [source_images])
+            return self._finish_batch(buffers)[0]
+
+    def submit_merge_images(self, sources, destination):
+        while self._executor._work_queue.qsize() > self._max_queue_size:
+            time.sleep(.01) # TODO: better apporach
+
+        logger.debug("submit tile: \"{0}\" using {1} source tiles".format(destination, len(sources)))
+        with self._outstanding_lock:
+            self._outstanding += 1
+        future = Future()
+        future.add_done_callback(self._tile_done)
+        self._executor.submit(self._load_images, sources, destination, future)
+        return future
+
+    def _tile_done(self, future):
+        with self._outstanding_lock:
+            self._outstanding -= 1
+            self._outstanding_lock.notify_all()
+
+    def _load_images(self, sources, destination, future):
+        try:
+            logger.info("calculate tile: \"{0}\" using {1}".format(destination, sources))
+            source_images = []
+
+            with metrics.timer('decode'):
+                for single_source in sources:
+                    new_image = Image.open(single_source)
+                    new_image.load()
+                    source_images += [new_image]
+
+            if len(source_images) > 1:
+                self._batch_queue.put((source_images, destination, future))
+            else:
+                metrics.count('tiles_fastpath')
+                future.set_result(self._tile_writer.write_image(destination, source_images[0].copy()))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _get_batches(self, first_item):
+        '''
+        collect the queued tiles into batches of tiles with the same size
+        '''
+        items = [first_item]
+        while len(items) < self._batch_size:
+            try:
+                item = self._batch_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _end_of_stream:
+                self._batch_queue.put(item)  # handled by the next call
+                self._batch_queue.task_done()
+                break
+            items.append(item)
+
+        return [list(batch) for (_, batch) in itertools.groupby(items, key=lambda item: item[0][0].size)]
+
+    def _dispatch(self):
+        pending = None  # (buffers, items) of the batch which is currently merged
+
+        while True:
+            try:
+                # do not wait for new tiles while a merged batch is ready
+                item = self._batch_queue.get(timeout=.01 if pending else None)
+            except queue.Empty:
+                self._complete_batch(*pending)
+                pending = None
+                continue
+
+            if item is _end_of_stream:
+                if pending:
+                    self._complete_batch(*pending)
+                self._batch_queue.task_done()
+                return
+
+            for batch in self._get_batches(item):
+                # use the buffer set which is not used by the pending batch
+                buffers = self._buffer_sets[1 if pending and pending[0] is self._buffer_sets[0] else 0]
+                buffers.lock.acquire()
+                try:
+                    with metrics.timer('upload'):
+                        self._enqueue_batch(buffers, [source_images for (source_images, _, _) in batch])
+                except Exception as e:
+                    buffers.lock.release()
+                    for (_, _, future) in batch:
+                        future.set_exception(e)
+                        self._batch_queue.task_done()
+                    continue
+
+                # the previous batch was merged while we uploaded this one
+                if pending:
+                    self._complete_batch(*pending)
+                pending = (buffers, batch)
+
+    def _complete_batch(self, buffers, batch):
+        try:
+            with metrics.timer('merge'):
+                merged_images = self._finish_batch(buffers)
+            metrics.count('merge_batches')
+        except Exception as e:
+            merged_images = [e] * len(batch)
+        finally:
+            buffers.lock.release()
+
+        for ((_, destination, future), merged_image) in zip(batch, merged_images):
+            try:
+                if isinstance(merged_image, Exception):
+                    raise merged_image
+                future.set_result(self._tile_writer.write_image(destination, merged_image))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._batch_queue.task_done()
+
+    def wait_until_empty(self):
+        # the queues are not enough, tiles which are decoded right now are not queued for merging yet
+        with self._outstanding_lock:
+            while self._outstanding > 0:
+                self._outstanding_lock.wait()
+        if self._own_tile_writer:
+            self._tile_writer.flush()
+
+    def shutdown(self):
+        TileMerger.shutdown(self)
+        self._batch_queue.put(_end_of_stream)
+        self._dispatcher.join()
+
+        if self._own_tile_writer:
+            self._tile_writer.close()
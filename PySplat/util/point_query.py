@@ -0,0 +1,109 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import math
+import numpy
+
+
+class SiteIndex(object):
+    '''
+    spatial index of the site extents, using a grid of cell_size x cell_size degree cells
+    '''
+    def __init__(self, rasters, cell_size=1.):
+        self._cell_size = cell_size
+        self._cells = {}
+
+        for site_index, raster in enumerate(rasters):
+            (lat_min, lon_min, lat_max, lon_max) = raster.get_bounding_box()
+            for lat_cell in range(int(math.floor(lat_min / cell_size)), int(math.floor(lat_max / cell_size)) + 1):
+                for lon_cell in range(int(math.floor(lon_min / cell_size)), int(math.floor(lon_max / cell_size)) + 1):
+                    self._cells.setdefault((lat_cell, lon_cell), []).append(site_index)
+
+    def get_candidates(self, lat, lon):
+        '''
+        returns a dict {site_index: indices of all positions which could be covered by this site}
+        '''
+        lat_cells = numpy.floor(numpy.asarray(lat) / self._cell_size).astype(numpy.int64)
+        lon_cells = numpy.floor(numpy.asarray(lon) / self._cell_size).astype(numpy.int64)
+
+        (cells, inverse) = numpy.unique(numpy.stack([lat_cells, lon_cells], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = numpy.argsort(inverse, kind='stable')
+        bounds = numpy.searchsorted(inverse[order], numpy.arange(len(cells) + 1))
+
+        candidates = {}
+        for i, (lat_cell, lon_cell) in enumerate(cells):
+            for site_index in self._cells.get((int(lat_cell), int(lon_cell)), []):
+                candidates.setdefault(site_index, []).append(order[bounds[i]:bounds[i + 1]])
+
+        return {site_index: numpy.concatenate(indices) for site_index, indices in candidates.items()}
+
+
+class PointQuery(object):
+    '''
+    answers batches of (lat, lon) queries with the signal level of every site, and the best site at this position.
+
+    Every site is read using its own signal levels (see open_site_raster), so sites are compared by their levels.
+    '''
+    def __init__(self, rasters):
+        self.rasters = rasters
+        self._index = SiteIndex(rasters)
+
+    def query_levels(self, lat, lon):
+        '''
+        signal level (dBuV/m) of every position and site, NaN when not covered
+        '''
+        lat = numpy.asarray(lat, dtype=numpy.float64)
+        lon = numpy.asarray(lon, dtype=numpy.float64)
+
+        levels = numpy.full((len(lat), len(self.rasters)), numpy.nan, dtype=numpy.float32)
+        if len(lat) == 0:
+            return levels
+
+        for site_index, query_indices in self._index.get_candidates(lat, lon).items():
+            raster = self.rasters[site_index]
+            (pixel_x, pixel_y, inside) = raster.get_pixels_from_pos(lat[query_indices], lon[query_indices])
+
+            # read in row order, which is way friendlier to the memory mapped raster
+            read_order = numpy.argsort(pixel_y[inside] * raster.width + pixel_x[inside])
+            query_indices = query_indices[inside][read_order]
+            ranks = raster.read_ranks(pixel_x[inside][read_order], pixel_y[inside][read_order], raster.signal_levels)
+            levels[query_indices, site_index] = raster.signal_levels.ranks_to_levels(ranks)
+
+        return levels
+
+    def query(self, lat, lon):
+        '''
+        returns a dict with
+            levels: signal level (dBuV/m) of every position and site (NaN when not covered)
+            best_site: index of the strongest site of every position (-1 when not covered)
+            best_level: signal level of the strongest site (NaN when not covered)
+        '''
+        levels = self.query_levels(lat, lon)
+
+        if len(self.rasters):
+            best_site = numpy.argmax(numpy.nan_to_num(levels, nan=-numpy.inf), axis=1)
+            best_level = levels[numpy.arange(len(levels)), best_site]
+        else:
+            best_site = numpy.zeros(len(levels), dtype=numpy.int64)
+            best_level = numpy.full(len(levels), numpy.nan, dtype=numpy.float32)
+        best_site[numpy.isnan(best_level)] = -1
+
+        return {'levels': levels,
+                'best_site': best_site,
+                'best_level': best_level}
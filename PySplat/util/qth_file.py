@@ -0,0 +1,43 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+
+def parse_qth_file(qth_file):
+    '''
+    OE5XGL
+    47.898366
+    -13.820238
+    965m
+
+    returns name, position (longitude is east positive, while SPLAT uses west positive) and antenna height above
+    ground in meters (SPLAT uses feet, when the height is not followed by "m")
+    '''
+
+    with open(qth_file, "r") as file:
+        lines = [line.strip() for line in file.readlines() if line.strip()]
+
+    if len(lines) < 4:
+        raise ValueError("incomplete .qth file: {0}".format(qth_file))
+
+    height = lines[3].lower()
+    if height.endswith('m'):
+        height = float(height[:-1].strip())
+    else:
+        height = float(height) * 0.3048
+
+    return {'name': lines[0], 'lat': float(lines[1]), 'lon': -float(lines[2]), 'height': height}
@@ -0,0 +1,271 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import json
+import mmap
+import os
+import struct
+import zlib
+import numpy
+
+from PySplat.util.atomic_file import get_temp_filename
+from PySplat.util.lru_cache import LRUCache
+from PySplat.util.site_raster import NO_SIGNAL, SignalLevels, SiteRaster, reduce_ranks
+
+
+# PySplat raster archive (.psr): single band rank raster, split into compressed tiles which can be read on their own
+#
+#   tile data       zlib compressed uint8 ranks (tile_size x tile_size, edge tiles are padded with NO_SIGNAL)
+#   tile index      one entry per tile (row major) for every level: offset, length, fill value (length 0 = uniform)
+#   header          JSON with georeference, scf colors, tile size and the levels
+#   footer          offset and length of the header, magic
+#
+# level 0 is the full resolution, every following level is a 2x overview of the previous one. Overviews keep the
+# strongest signal (lowest rank) of every 2x2 block, so coverage does not vanish when zooming out.
+
+MAGIC = b'PSR1'
+VERSION = 1
+
+_footer = struct.Struct('<QI4s')
+_index_dtype = numpy.dtype([('offset', '<u8'), ('length', '<u4'), ('fill', 'u1'), ('padding', 'V3')])
+
+
+def compress_tile(ranks):
+    low = ranks.min()
+    if low == ranks.max():
+        return (b'', int(low))  # uniform tiles are stored inside the index only
+    return (zlib.compress(numpy.ascontiguousarray(ranks).tobytes(), 6), 0)
+
+
+def _write_level(file, ranks_of_band, width, height, tile_size, executor=None):
+    '''
+    write all tiles of a level, ranks_of_band(y_start, y_end) has to return the ranks of those rows
+    '''
+    tiles_x = -(-width // tile_size)
+    tiles_y = -(-height // tile_size)
+    index = numpy.zeros(tiles_x * tiles_y, dtype=_index_dtype)
+
+    for tile_y in range(tiles_y):
+        y_start = tile_y * tile_size
+        y_end = min(y_start + tile_size, height)
+
+        band = numpy.full((tile_size, tiles_x * tile_size), NO_SIGNAL, dtype=numpy.uint8)
+        band[:y_end - y_start, :width] = ranks_of_band(y_start, y_end)
+
+        tiles = [band[:, x * tile_size:(x + 1) * tile_size] for x in range(tiles_x)]
+        compressed = executor.map(compress_tile, tiles) if executor else map(compress_tile, tiles)
+
+        for tile_x, (data, fill) in enumerate(compressed):
+            entry = index[tile_y * tiles_x + tile_x]
+            entry['offset'] = file.tell()
+            entry['length'] = len(data)
+            entry['fill'] = fill
+            file.write(data)
+
+    index_offset = file.tell()
+    file.write(index.tobytes())
+
+    return {'width': width, 'height': height, 'index_offset': index_offset}
+
+
+def _reducing(ranks_of_band, overview_bands):
+    '''
+    wraps ranks_of_band, so the 2x overview of every band is collected while the level is written
+    '''
+    def reducing_ranks_of_band(y_start, y_end):
+        ranks = ranks_of_band(y_start, y_end)
+        overview_bands.append(reduce_ranks(ranks, 2))
+        return ranks
+    return reducing_ranks_of_band
+
+
+def write_raster_archive(filename, raster, signal_levels, tile_size=256, executor=None, overviews=True):
+    '''
+    convert a site raster (e.g. a SPLAT .ppm) into a raster archive, including overviews down to a single tile
+    '''
+    tmp_filename = get_temp_filename(filename)
+
+    try:
+        with open(tmp_filename, "wb") as file:
+            def ranks_of_band(y_start, y_end):
+                return raster.read_window_ranks(0, y_start, raster.width, y_end, signal_levels)
+
+            (width, height) = (raster.width, raster.height)
+            overview_bands = []
+
+            if overviews and max(width, height) > tile_size:
+                ranks_of_band = _reducing(ranks_of_band, overview_bands)
+            levels = [_write_level(file, ranks_of_band, width, height, tile_size, executor)]
+
+            # bands are tile_size rows high, so all bands except the last one are reduced without any padding
+            while overview_bands:
+                overview = numpy.concatenate(overview_bands)
+                (height, width) = overview.shape
+                overview_bands = []
+
+                ranks_of_band = lambda y_start, y_end, overview=overview: overview[y_start:y_end]
+                if max(width, height) > tile_size:
+                    ranks_of_band = _reducing(ranks_of_band, overview_bands)
+                levels.append(_write_level(file, ranks_of_band, width, height, tile_size, executor))
+
+            header = json.dumps({
+                'version': VERSION,
+                'name': raster.name,
+                'geo': raster.geo_data,
+                'tile_size': tile_size,
+                'scf': [[int(level), [int(c) for c in color]] for (level, color) in zip(signal_levels.levels, signal_levels.colors)],
+                'levels': levels
+            }).encode('utf-8')
+
+            header_offset = file.tell()
+            file.write(header)
+            file.write(_footer.pack(header_offset, len(header), MAGIC))
+
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+class ArchiveSiteRaster(SiteRaster):
+    '''
+    site raster stored inside a raster archive, only the tiles we access are decompressed (and cached)
+    '''
+    def __init__(self, filename, cache_size=64 * 2**20):
+        self.filename = filename
+
+        self._file = open(filename, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (header_offset, header_length, magic) = _footer.unpack(self._data[-_footer.size:])
+        if magic != MAGIC:
+            raise ValueError("not a PySplat raster archive: {0}".format(filename))
+
+        header = json.loads(self._data[header_offset:header_offset + header_length].decode('utf-8'))
+        if header['version'] > VERSION:
+            raise ValueError("unsupported raster archive version: {0}".format(header['version']))
+
+        self.name = header['name']
+        self.geo_data = header['geo']
+        self.tile_size = header['tile_size']
+        self.signal_levels = SignalLevels({level: color for (level, color) in header['scf']})
+
+        self.levels = []
+        for level in header['levels']:
+            tiles_x = -(-level['width'] // self.tile_size)
+            tiles_y = -(-level['height'] // self.tile_size)
+            index = numpy.frombuffer(self._data, dtype=_index_dtype, count=tiles_x * tiles_y, offset=level['index_offset'])
+            self.levels.append({'width': level['width'], 'height': level['height'], 'tiles_x': tiles_x, 'index': index})
+
+        self.width = self.levels[0]['width']
+        self.height = self.levels[0]['height']
+
+        self._cache = LRUCache(cache_size, get_size=lambda tile: tile.nbytes)
+        self._rank_luts = {}
+
+    def get_overview_level(self, scale):
+        level = 0
+        while level + 1 < len(self.levels) and 2 ** (level + 1) <= scale:
+            level += 1
+        return level
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def get_tile(self, tile_x, tile_y, level=0):
+        key = (level, tile_x, tile_y)
+        tile = self._cache.get(key)
+        if tile is not None:
+            return tile
+
+        entry = self.levels[level]['index'][tile_y * self.levels[level]['tiles_x'] + tile_x]
+        if entry['length'] == 0:
+            # uniform tile, a broadcasted view does not require any memory
+            return numpy.broadcast_to(numpy.uint8(entry['fill']), (self.tile_size, self.tile_size))
+
+        offset = int(entry['offset'])
+        data = zlib.decompress(self._data[offset:offset + int(entry['length'])])
+        tile = numpy.frombuffer(data, dtype=numpy.uint8).reshape(self.tile_size, self.tile_size)
+
+        self._cache.put(key, tile)
+        return tile
+
+    def _get_rank_lut(self, signal_levels):
+        '''
+        lookup table which converts our ranks into the ranks of signal_levels (None if they are the same)
+        '''
+        if signal_levels is None or signal_levels is self.signal_levels:
+            return None
+
+        cached = self._rank_luts.get(id(signal_levels))
+        if cached is not None and cached[0] is signal_levels:
+            return cached[1]
+
+        if numpy.array_equal(signal_levels.colors, self.signal_levels.colors):
+            lut = None
+        else:
+            lut = numpy.full(NO_SIGNAL + 1, NO_SIGNAL, dtype=numpy.uint8)
+            lut[:len(self.signal_levels)] = signal_levels.colors_to_ranks(self.signal_levels.colors)
+
+        self._rank_luts[id(signal_levels)] = (signal_levels, lut)
+        return lut
+
+    def read_window_ranks(self, x_start, y_start, x_end, y_end, signal_levels=None, level=0):
+        width = self.levels[level]['width']
+        height = self.levels[level]['height']
+        ranks = numpy.full((y_end - y_start, x_end - x_start), NO_SIGNAL, dtype=numpy.uint8)
+
+        tile_size = self.tile_size
+        for tile_y in range(max(y_start, 0) // tile_size, (min(y_end, height) - 1) // tile_size + 1):
+            for tile_x in range(max(x_start, 0) // tile_size, (min(x_end, width) - 1) // tile_size + 1):
+                tile = self.get_tile(tile_x, tile_y, level)
+
+                # intersection of window and tile in raster coordinates
+                left = max(x_start, tile_x * tile_size)
+                right = min(x_end, (tile_x + 1) * tile_size, width)
+                top = max(y_start, tile_y * tile_size)
+                bottom = min(y_end, (tile_y + 1) * tile_size, height)
+
+                ranks[top - y_start:bottom - y_start, left - x_start:right - x_start] = \
+                    tile[top - tile_y * tile_size:bottom - tile_y * tile_size, left - tile_x * tile_size:right - tile_x * tile_size]
+
+        lut = self._get_rank_lut(signal_levels)
+        return ranks if lut is None else lut[ranks]
+
+    def read_ranks(self, pixel_x, pixel_y, signal_levels=None, level=0):
+        shape = numpy.shape(pixel_x)
+        pixel_x = numpy.asarray(pixel_x).ravel()
+        pixel_y = numpy.asarray(pixel_y).ravel()
+        ranks = numpy.full(pixel_x.shape, NO_SIGNAL, dtype=numpy.uint8)
+        if ranks.size == 0:
+            return ranks.reshape(shape)
+
+        tile_ids = (pixel_y // self.tile_size) * self.levels[level]['tiles_x'] + pixel_x // self.tile_size
+        order = numpy.argsort(tile_ids, kind='stable')
+        sorted_ids = tile_ids[order]
+        bounds = numpy.nonzero(numpy.diff(sorted_ids))[0] + 1
+
+        for selected in numpy.split(order, bounds):
+            tile_id = int(tile_ids[selected[0]])
+            tile = self.get_tile(tile_id % self.levels[level]['tiles_x'], tile_id // self.levels[level]['tiles_x'], level)
+            ranks[selected] = tile[pixel_y[selected] % self.tile_size, pixel_x[selected] % self.tile_size]
+
+        lut = self._get_rank_lut(signal_levels)
+        return (ranks if lut is None else lut[ranks]).reshape(shape)
@@ -54,7 +54,7 @@ def parse_scf_file(scf_file):
                 print("unexpeced line: \"{0}\"".format(line))
                 continue
 
-            signal_colors[match.group(1)] = (match.group(2), match.group(3), match.group(4))
+            signal_colors[int(match.group(1))] = (int(match.group(2)), int(match.group(3)), int(match.group(4)))
 
     return signal_colors
 
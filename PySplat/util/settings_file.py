@@ -0,0 +1,59 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import re
+
+
+_settings_entry_match = re.compile("^\s*([a-z_]+)\s*[:=]\s*([^;]*?)\s*(;.*)?$")
+
+
+def parse_settings_file(settings_file):
+    '''
+    per site settings of pysplat, which are not part of the SPLAT input files
+
+    ; Calculation range in km, or "auto" to estimate it from the .lrp and .scf file
+    range: 30
+    ; Receiver height above ground in meters
+    rx_height: 2.0
+    '''
+
+    settings = {}
+
+    with open(settings_file, "r") as file:
+        for line in file.readlines():
+            line = line.rstrip('\n')
+
+            if not line.strip() or line.lstrip().startswith(';'):
+                continue  # comment
+
+            match = _settings_entry_match.match(line)
+
+            if not match:
+                print("unexpeced line: \"{0}\"".format(line))
+                continue
+
+            (key, value) = (match.group(1), match.group(2))
+
+            if key == 'range' and value.lower() == 'auto':
+                settings['auto_range'] = True
+            elif key in ('range', 'rx_height'):
+                settings[key] = float(value)
+            else:
+                print("unknown setting: \"{0}\"".format(key))
+
+    return settings
@@ -0,0 +1,255 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import os
+import numpy
+
+from PySplat.util.geo_file import parse_geo_file
+from PySplat.util.scf_file import parse_scf_file, default_scf_data
+
+
+NO_SIGNAL = 255  # rank of pixels without any coverage (white, black or unknown colors)
+
+
+def _pack_colors(rgb):
+    rgb = numpy.asarray(rgb, dtype=numpy.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+class SignalLevels(object):
+    '''
+    converts between the colors of a SPLAT map, ranks and signal levels (dBuV/m) of a scf definition.
+
+    The rank is the index of the color inside get_sorted_pixel_order, which means 0 is the strongest signal and
+    NO_SIGNAL is used for pixels without coverage.
+    '''
+    def __init__(self, scf_data):
+        entries = sorted(((int(level), tuple(int(c) for c in color)) for level, color in scf_data.items()), reverse=True)
+
+        self.levels = numpy.array([level for (level, _) in entries], dtype=numpy.float32)
+        self.colors = numpy.array([color for (_, color) in entries], dtype=numpy.uint8).reshape(-1, 3)
+
+        packed = _pack_colors(self.colors)
+        self._sorted_ranks = numpy.argsort(packed).astype(numpy.uint8)
+        self._sorted_colors = packed[self._sorted_ranks]
+
+    def __len__(self):
+        return len(self.levels)
+
+    def colors_to_ranks(self, rgb):
+        packed = _pack_colors(rgb)
+        position = numpy.searchsorted(self._sorted_colors, packed).clip(0, len(self._sorted_colors) - 1)
+        found = self._sorted_colors[position] == packed
+        return numpy.where(found, self._sorted_ranks[position], NO_SIGNAL).astype(numpy.uint8)
+
+    def ranks_to_levels(self, ranks):
+        ranks = numpy.asarray(ranks)
+        levels = numpy.full(ranks.shape, numpy.nan, dtype=numpy.float32)
+        valid = ranks < len(self.levels)
+        levels[valid] = self.levels[ranks[valid]]
+        return levels
+
+    def levels_to_ranks(self, levels):
+        '''
+        rank of the strongest scf level which is reached by every signal level, NO_SIGNAL below the lowest one or NaN
+        '''
+        levels = numpy.asarray(levels, dtype=numpy.float32)
+        ranks = numpy.searchsorted(-self.levels, -numpy.nan_to_num(levels, nan=-numpy.inf), side='left')
+        return numpy.where(ranks < len(self.levels), ranks, NO_SIGNAL).astype(numpy.uint8)
+
+    def ranks_to_rgba(self, ranks):
+        palette = numpy.zeros((256, 4), dtype=numpy.uint8)
+        palette[:] = (255, 255, 255, 0)  # transparent
+        palette[:len(self.colors), :3] = self.colors
+        palette[:len(self.colors), 3] = 255
+        return palette[numpy.asarray(ranks)]
+
+
+def get_site_signal_levels(filename, signal_levels=None):
+    '''
+    signal levels of the map of a site: SPLAT colors it using <site>.scf when this file exists (next to the map),
+    otherwise signal_levels (default scf data when None) are used.
+    '''
+    scf_file = os.path.splitext(filename)[0] + ".scf"
+    if os.path.isfile(scf_file):
+        return SignalLevels(parse_scf_file(scf_file))
+
+    return signal_levels if signal_levels is not None else SignalLevels(default_scf_data)
+
+
+def read_ppm_header(file):
+    '''
+    returns (width, height, offset of the pixel data) of a binary (P6) .ppm file
+    '''
+    header = file.read(512)
+    if not header.startswith(b'P6'):
+        raise ValueError("only binary .ppm files (P6) are supported")
+
+    values = []
+    position = 2
+    while len(values) < 3:
+        if position >= len(header):
+            raise ValueError("invalid .ppm header")
+        while header[position:position + 1].isspace():
+            position += 1
+        if header[position:position + 1] == b'#':
+            position = header.index(b'\n', position)  # comment
+            continue
+        start = position
+        while position < len(header) and not header[position:position + 1].isspace():
+            position += 1
+        values.append(int(header[start:position]))
+
+    if values[2] != 255:
+        raise ValueError("only .ppm files with 8 bit per channel are supported")
+
+    return (values[0], values[1], position + 1)
+
+
+def get_pixels_from_pos(rf_geo_data, lat, lon):
+    '''
+    vectorized variant of get_pixel_from_pos, returns the pixel coordinates as arrays
+    '''
+    lon_per_pixel = abs((rf_geo_data['bb'][1][1]-rf_geo_data['bb'][0][1])/rf_geo_data['imagesize'][1])
+    lat_per_pixel = abs((rf_geo_data['bb'][1][0]-rf_geo_data['bb'][0][0])/rf_geo_data['imagesize'][0])
+
+    pixel_x = numpy.floor((numpy.asarray(lon)-rf_geo_data['bb'][0][1])/lon_per_pixel).astype(numpy.int64)
+    pixel_y = numpy.floor((rf_geo_data['bb'][0][0]-numpy.asarray(lat))/lat_per_pixel).astype(numpy.int64)
+
+    return (pixel_x, pixel_y)
+
+
+def get_tile_pixel_positions(xtile, ytile, zoom, size=256):
+    '''
+    returns (lat, lon) arrays of shape (size, size) with the center position of every pixel inside a slippy map tile
+    '''
+    n = 2.0 ** zoom
+    offsets = (numpy.arange(size, dtype=numpy.float64) + 0.5) / size
+
+    lon = (xtile + offsets) / n * 360.0 - 180.0
+    lat = numpy.degrees(numpy.arctan(numpy.sinh(numpy.pi * (1 - 2 * (ytile + offsets) / n))))
+
+    return numpy.meshgrid(lat, lon, indexing='ij')
+
+
+def reduce_ranks(ranks, factor):
+    '''
+    reduce the resolution by factor, keeping the strongest signal of every block
+    '''
+    if factor <= 1:
+        return ranks
+
+    height = -(-ranks.shape[0] // factor) * factor
+    width = -(-ranks.shape[1] // factor) * factor
+    padded = numpy.full((height, width), NO_SIGNAL, dtype=ranks.dtype)
+    padded[:ranks.shape[0], :ranks.shape[1]] = ranks
+
+    return padded.reshape(height // factor, factor, width // factor, factor).min(axis=(1, 3))
+
+
+def sample_tile_ranks(raster, xtile, ytile, zoom, signal_levels, size=256):
+    '''
+    nearest neighbour sampling of a slippy map tile from a site raster, pixels outside of the raster are NO_SIGNAL
+
+    When the raster has overviews, the overview closest to the resolution of the tile is used.
+    '''
+    (lat, lon) = get_tile_pixel_positions(xtile, ytile, zoom, size)
+    (pixel_x, pixel_y, inside) = raster.get_pixels_from_pos(lat, lon)
+
+    # number of raster pixels covered by a single pixel of the tile
+    bb = raster.geo_data['bb']
+    scale = (360. / (size * 2 ** zoom)) / (abs(bb[1][1] - bb[0][1]) / raster.width)
+    level = raster.get_overview_level(scale)
+
+    ranks = numpy.full((size, size), NO_SIGNAL, dtype=numpy.uint8)
+    if inside.any():
+        if level == 0:
+            ranks[inside] = raster.read_ranks(pixel_x[inside], pixel_y[inside], signal_levels)
+        else:
+            ranks[inside] = raster.read_ranks(pixel_x[inside] >> level, pixel_y[inside] >> level, signal_levels, level=level)
+    return ranks
+
+
+class SiteRaster(object):
+    '''
+    common functions of all site rasters, the subclasses implement read_ranks and read_window_ranks.
+
+    Every raster has the signal_levels it was colored with. Ranks of different rasters can only be compared when
+    they were read using the same signal levels, otherwise their levels (dBuV/m) have to be compared.
+    '''
+    def get_bounding_box(self):
+        '''
+        (lat_min, lon_min, lat_max, lon_max) of this raster
+        '''
+        bb = self.geo_data['bb']
+        return (min(bb[0][0], bb[1][0]), min(bb[0][1], bb[1][1]), max(bb[0][0], bb[1][0]), max(bb[0][1], bb[1][1]))
+
+    def get_pixels_from_pos(self, lat, lon):
+        '''
+        returns (pixel_x, pixel_y, inside) where inside marks all positions which are covered by this raster
+        '''
+        (pixel_x, pixel_y) = get_pixels_from_pos(self.geo_data, lat, lon)
+        inside = (pixel_x >= 0) & (pixel_x < self.width) & (pixel_y >= 0) & (pixel_y < self.height)
+        return (pixel_x, pixel_y, inside)
+
+    def get_overview_level(self, scale):
+        '''
+        level of the overview which fits best when every sample covers scale pixels (0 = full resolution)
+        '''
+        return 0
+
+    def read_ranks(self, pixel_x, pixel_y, signal_levels):
+        raise NotImplementedError()
+
+    def read_window_ranks(self, x_start, y_start, x_end, y_end, signal_levels):
+        raise NotImplementedError()
+
+
+class PPMSiteRaster(SiteRaster):
+    '''
+    SPLAT map (.ppm and .geo) of a single site, which is memory mapped instead of loaded into RAM
+    '''
+    def __init__(self, ppm_file, geo_file=None, signal_levels=None):
+        self.filename = ppm_file
+        self.name = os.path.splitext(os.path.basename(ppm_file))[0]
+        self.geo_data = parse_geo_file(geo_file or os.path.splitext(ppm_file)[0] + ".geo")
+        self.signal_levels = signal_levels if signal_levels is not None else SignalLevels(default_scf_data)
+
+        with open(ppm_file, "rb") as file:
+            (self.width, self.height, offset) = read_ppm_header(file)
+
+        self.pixels = numpy.memmap(ppm_file, dtype=numpy.uint8, mode='r', offset=offset, shape=(self.height, self.width, 3))
+
+    def read_ranks(self, pixel_x, pixel_y, signal_levels=None):
+        signal_levels = signal_levels if signal_levels is not None else self.signal_levels
+        return signal_levels.colors_to_ranks(self.pixels[pixel_y, pixel_x])
+
+    def read_window_ranks(self, x_start, y_start, x_end, y_end, signal_levels=None):
+        signal_levels = signal_levels if signal_levels is not None else self.signal_levels
+        return signal_levels.colors_to_ranks(self.pixels[y_start:y_end, x_start:x_end])
+
+
+def open_site_raster(filename, signal_levels=None):
+    '''
+    raster archives store their own signal levels, .ppm files use get_site_signal_levels
+    '''
+    if filename.endswith('.psr'):
+        from PySplat.util.raster_archive import ArchiveSiteRaster
+        return ArchiveSiteRaster(filename)
+
+    return PPMSiteRaster(filename, signal_levels=get_site_signal_levels(filename, signal_levels))
@@ -15,10 +15,20 @@ along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/
 (C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
 '''
 
+import logging
+import math
 import os
 import subprocess
 import tempfile
 
+from PySplat.util.instrumentation import metrics
+from PySplat.util.lrp_file import parse_lrp_file
+from PySplat.util.qth_file import parse_qth_file
+from PySplat.util.scf_file import parse_scf_file, default_scf_data
+
+
+logger = logging.getLogger(__name__)
+
 
 class SplatQTH(object):
     def __init__(self, **kwargs):
@@ -27,6 +37,9 @@ class SplatQTH(object):
         self.lrp_file = kwargs.get('lrp_file') # location definition
         self.az_file = kwargs.get('az_file') # antenna azimut pattern
         self.el_file = kwargs.get('el_file') # antenna elevation pattern
+        self.scf_file = kwargs.get('scf_file') # signal color definition
+        self.range = kwargs.get('range', 100.)  # limit range of calculation (km)
+        self.rx_height = kwargs.get('rx_height', 10.)  # we calculate path LOS for this height above ground (m)
 
     def __str__(self):
         files = []
@@ -43,23 +56,96 @@ class SplatQTH(object):
         if self.el_file:
             files.append('el="{0}"'.format(self.el_file))
 
+        if self.scf_file:
+            files.append('scf="{0}"'.format(self.scf_file))
+
+        files.append('range={0:.1f}km'.format(self.range))
+        files.append('rx_height={0:.1f}m'.format(self.rx_height))
+
         return '{name}[{files}]'.format(name=self.name, files=', '.join(files) )
 
 
+def get_radio_horizon(tx_height, rx_height):
+    '''
+    distance (km) of the radio horizon over a smooth earth (4/3 earth radius), heights in meters above ground
+    '''
+    return 4.12 * (math.sqrt(max(tx_height, 0.)) + math.sqrt(max(rx_height, 0.)))
+
+
+def get_hata_path_loss(frequency, tx_height, rx_height):
+    '''
+    median path loss in open areas after Okumura-Hata (COST-231 Hata above 1500 MHz), returns (a, b) so the loss at
+    distance d (km) is a + b * log10(d) in dB.
+
+    frequency in MHz, heights in meters above ground. The inputs are limited to the valid range of the model
+    (150-2000 MHz, 30-200 m, 1-10 m), frequencies outside of it are scaled like in free space.
+    '''
+    model_frequency = min(max(frequency, 150.), 2000.)
+    tx_height = min(max(tx_height, 30.), 200.)
+    rx_height = min(max(rx_height, 1.), 10.)
+
+    log_f = math.log10(model_frequency)
+    rx_correction = (1.1 * log_f - 0.7) * rx_height - (1.56 * log_f - 0.8)
+
+    if model_frequency <= 1500.:
+        a = 69.55 + 26.16 * log_f - 13.82 * math.log10(tx_height) - rx_correction
+    else:
+        a = 46.3 + 33.9 * log_f - 13.82 * math.log10(tx_height) - rx_correction
+
+    a += -4.78 * log_f ** 2 + 18.33 * log_f - 40.94  # open area instead of urban
+    a += 20 * math.log10(frequency / model_frequency)
+    b = 44.9 - 6.55 * math.log10(tx_height)
+
+    return (a, b)
+
+
+def get_path_loss_range(erp, frequency, tx_height, rx_height, field_strength):
+    '''
+    distance (km) where the median field strength (dBuV/m) of a transmitter with erp (W) drops below field_strength
+    '''
+    (a, b) = get_hata_path_loss(frequency, tx_height, rx_height)
+    eirp = 10 * math.log10(erp * 1000.) + 2.15  # dBm
+    max_loss = eirp + 20 * math.log10(frequency) + 77.2 - field_strength
+    return 10 ** ((max_loss - a) / b)
+
+
+def estimate_range(qth_obj, max_range):
+    '''
+    estimate the range (km) where the site still reaches the lowest signal level of its scf definition.
+
+    This is the distance where the median path loss (Okumura-Hata, using the frequency and ERP of the .lrp file)
+    reaches this level, but at most the radio horizon of the antenna height. Neither knows the terrain, so sites
+    which are much higher than their surroundings should get an explicit range. Sites without ERP only use the radio
+    horizon.
+    '''
+    qth_data = parse_qth_file(qth_obj.qth_file)
+    estimated_range = get_radio_horizon(qth_data['height'], qth_obj.rx_height)
+
+    lrp_data = parse_lrp_file(qth_obj.lrp_file) if qth_obj.lrp_file else {'erp': 0.}
+    if lrp_data['erp'] > 0:
+        scf_data = parse_scf_file(qth_obj.scf_file) if qth_obj.scf_file else default_scf_data
+        path_loss_range = get_path_loss_range(lrp_data['erp'], lrp_data['frequency'], qth_data['height'],
+                                              qth_obj.rx_height, min(scf_data.keys()))
+        logger.debug("{0} path loss range: {1:.1f}km, radio horizon: {2:.1f}km".format(qth_obj.name, path_loss_range, estimated_range))
+        estimated_range = min(estimated_range, path_loss_range)
+
+    return max(1., min(math.ceil(estimated_range), max_range))
+
+
 def run_splat(qth_obj, srtm_dir, output_file):
     #print("render splat map: {0} to {1}".format(qth_obj, output_file))
 
     # output path has to exist (otherwise SEGFAULT!)
     output_dir = os.path.dirname(output_file)
     if not os.path.exists(output_dir):
-        print("create directory: {0}".format(output_dir))
+        logger.debug("create directory: {0}".format(output_dir))
         os.makedirs(output_dir)
 
     splat_call = ["splat"]
     splat_call += ["-t", os.path.abspath(qth_obj.qth_file)] # our qth file
-    splat_call += ["-L",  "10.0"]  # we calculate path LOS for 10m above ground (TODO)
+    splat_call += ["-L", "{0:.1f}".format(qth_obj.rx_height)]  # we calculate path LOS for this height above ground
     splat_call += ["-d", os.path.abspath(srtm_dir)]  # path to topographic data
-    splat_call += ["-R", "100"]  # limit range of calculation (TODO)
+    splat_call += ["-R", "{0:g}".format(qth_obj.range)]  # limit range of calculation
     splat_call += ["-ngs"]  # the heightmap only intereference with tile generation
     splat_call += ["-geo"]  # we need a .geo reference file, to create tiles later
     splat_call += ["-metric"]  # we want to use metric everywhere
@@ -68,22 +154,24 @@ def run_splat(qth_obj, srtm_dir, output_file):
     #print("run command: \"{0}\"".format(" ".join(splat_call)))
 
     tmp_dir = tempfile.mkdtemp("_pysplat")
-    print("use tmp dir: {0}".format(tmp_dir))
+    logger.debug("use tmp dir: {0}".format(tmp_dir))
 
     try:
-        with subprocess.Popen(splat_call, cwd=tmp_dir, shell=False) as splat_sp:
+        with metrics.timer('splat'), subprocess.Popen(splat_call, cwd=tmp_dir, shell=False) as splat_sp:
             # TODO: , stdout=subprocess.PIPE
             splat_sp.wait()
             # TODO: get data and parse output
 
-            print("return code: {0}".format(splat_sp.returncode))
+            logger.info("{0} return code: {1}".format(qth_obj.name, splat_sp.returncode))
             if splat_sp.returncode != 0:
-                return
+                return False
 
             site_reporter_file = os.path.join(tmp_dir, "{qth_filename}-site_report.txt".format(qth_filename=qth_obj.name))
             # print("remove file: {0}".format(site_reporter_file))
             os.remove(site_reporter_file)
 
+            return True
+
     finally:
         # we want to delete the tmp folder in all cases
         os.rmdir(tmp_dir)
\ No newline at end of file
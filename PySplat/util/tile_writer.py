@@ -0,0 +1,349 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
+
+from PySplat.util.argparse_helper import check_thread_count
+from PySplat.util.atomic_file import encode_image, get_temp_filename, sync_directory, write_file_atomic
+from PySplat.util.instrumentation import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class TileWriter(object):
+    '''
+    encodes and writes tiles on a dedicated I/O thread pool, so the compute threads do not wait for the filesystem.
+
+    At most max_pending tiles are buffered, after that write blocks until the I/O threads caught up. Every directory
+    is only created once, and can be created before any tile is rendered using prepare_range. Tiles are written
+    atomically (temporary file and rename).
+
+    With dedup, identical tiles are only encoded once, and stored as hardlinks of the first one. Tiles can also be
+    stored inside a MBTilesStore instead of a directory, which deduplicates them inside the database. A file is locked
+    while it is written or linked, so a tile is never linked to a file which is overwritten with another content.
+
+    encoder is called with every image and returns the encoded PNG (default: encode_image).
+    '''
+    def __init__(self, output_dir=None, threads=4, max_pending=None, dedup=False, mbtiles=None, encoder=None):
+        self._output_dir = output_dir
+        self._encoder = encoder or encode_image
+        self._mbtiles = mbtiles
+        self._dedup = dedup or mbtiles is not None
+        self._stored_tiles = {}  # content key -> filename of the first tile with this content
+        self._stored_keys = {}  # filename -> content key, to detect tiles which were overwritten
+        self._stored_tiles_lock = threading.Lock()
+        self._file_locks = [threading.Lock() for _ in range(64)]
+        self._counters = {'written': 0, 'deduplicated': 0, 'uniform': 0}  # of this writer, metrics counts all writers
+        self._counters_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._slots = threading.BoundedSemaphore(max_pending or threads * 4)
+
+        self._created_dirs = set()
+        self._dirs_lock = threading.Lock()
+
+        self._backlog = 0
+        self._backlog_lock = threading.Condition()
+
+    def _count(self, name):
+        metrics.count('tiles_' + name)
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    @contextlib.contextmanager
+    def _lock_files(self, *filenames):
+        '''
+        lock the given files (None is ignored), always in the same order so two threads cannot deadlock
+        '''
+        indices = sorted({hash(filename) % len(self._file_locks) for filename in filenames if filename is not None})
+        with contextlib.ExitStack() as stack:
+            for index in indices:
+                stack.enter_context(self._file_locks[index])
+            yield
+
+    def get_tile_filename(self, zoom, xtile, ytile):
+        return os.path.join(self._output_dir, str(zoom), str(xtile), "{0}.png".format(ytile))
+
+    def _ensure_dir(self, directory):
+        with self._dirs_lock:
+            if directory in self._created_dirs:
+                return
+            self._created_dirs.add(directory)
+
+        if not os.path.isdir(directory):
+            logger.debug("create directory: {0}".format(directory))
+            os.makedirs(directory, exist_ok=True)
+
+    def prepare_range(self, zoom, xtile_start, xtile_end):
+        '''
+        create the directories of all tile columns we are going to write
+        '''
+        if self._mbtiles is not None:
+            return
+
+        for xtile in range(xtile_start, xtile_end + 1):
+            self._ensure_dir(os.path.join(self._output_dir, str(zoom), str(xtile)))
+
+    def _get_content_key(self, image):
+        '''
+        tiles with the same content get the same key. Uniform tiles are detected without hashing them.
+
+        The key of uniform tiles contains all channels, also for fully transparent ones: the written PNG keeps the
+        color of transparent pixels, so (0, 0, 0, 0) and (255, 255, 255, 0) tiles are not identical.
+        '''
+        if isinstance(image, bytes):
+            return hashlib.blake2b(image, digest_size=16).hexdigest()
+
+        mode = image.mode
+        if mode == 'P':
+            # palette images are only identical when they use the same palette
+            palette = bytes(image.getpalette() or []) + str(image.info.get('transparency')).encode('utf-8')
+            mode += '-' + hashlib.blake2b(palette, digest_size=8).hexdigest()
+
+        extrema = image.getextrema()
+        if len(image.getbands()) == 1:
+            extrema = (extrema,)
+        if all(low == high for (low, high) in extrema):
+            self._count('uniform')
+            return 'uniform-{0}-{1}'.format(mode, '-'.join(str(low) for (low, _) in extrema))
+
+        content_hash = hashlib.blake2b(image.tobytes(), digest_size=16)
+        content_hash.update('{0}-{1}x{2}'.format(mode, *image.size).encode('utf-8'))
+        return content_hash.hexdigest()
+
+    def _encode(self, image):
+        return image if isinstance(image, bytes) else self._encoder(image, "PNG")
+
+    def _link(self, source, filename):
+        tmp_filename = get_temp_filename(filename)
+        try:
+            os.link(source, tmp_filename)
+            os.replace(tmp_filename, filename)
+            sync_directory(os.path.dirname(filename))
+            return True
+        except OSError:
+            # e.g. the filesystem does not support hardlinks, or the source was removed
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            return False
+
+    def _store_file(self, filename, image):
+        self._ensure_dir(os.path.dirname(filename))
+
+        if not self._dedup:
+            write_file_atomic(filename, self._encode(image))
+            return
+
+        content_key = self._get_content_key(image)
+        with self._stored_tiles_lock:
+            source = self._stored_tiles.get(content_key)
+
+        # the source cannot be overwritten while we link it, and our file cannot be used as source while we write it
+        with self._lock_files(filename, source):
+            with self._stored_tiles_lock:
+                previous_key = self._stored_keys.get(filename)
+                if previous_key == content_key:
+                    self._count('deduplicated')  # the file already has this content
+                    return
+
+                if previous_key is not None:
+                    # the file gets a new content, so we cannot link to it anymore
+                    del self._stored_keys[filename]
+                    del self._stored_tiles[previous_key]
+
+                if self._stored_keys.get(source) != content_key:
+                    source = None  # the source was overwritten before we locked it
+
+            if source is not None and self._link(source, filename):
+                self._count('deduplicated')
+                return
+
+            write_file_atomic(filename, self._encode(image))
+            with self._stored_tiles_lock:
+                if content_key not in self._stored_tiles:
+                    self._stored_tiles[content_key] = filename
+                    self._stored_keys[filename] = content_key
+
+    def _store_mbtiles(self, tile, image):
+        content_key = self._get_content_key(image)
+        if self._mbtiles.has_image(content_key):
+            self._count('deduplicated')
+            self._mbtiles.put(tile[0], tile[1], tile[2], content_key)
+        else:
+            self._mbtiles.put(tile[0], tile[1], tile[2], content_key, self._encode(image))
+
+    def _write(self, filename, tile, image, submit_time):
+        try:
+            if self._mbtiles is not None:
+                self._store_mbtiles(tile, image)
+            else:
+                self._store_file(filename, image)
+            self._count('written')
+            metrics.add_time('write_latency', time.perf_counter() - submit_time)
+        finally:
+            with self._backlog_lock:
+                self._backlog -= 1
+                self._backlog_lock.notify_all()
+            self._slots.release()
+
+    def _submit(self, filename, tile, image):
+        with metrics.timer('write_wait'):
+            self._slots.acquire()
+
+        with self._backlog_lock:
+            self._backlog += 1
+            metrics.gauge('write_backlog', self._backlog)
+
+        try:
+            return self._executor.submit(self._write, filename, tile, image, time.perf_counter())
+        except BaseException:
+            with self._backlog_lock:
+                self._backlog -= 1
+                self._backlog_lock.notify_all()
+            self._slots.release()
+            raise
+
+    def write_image(self, filename, image):
+        '''
+        write a image (or already encoded PNG data) as filename, returns a future which is done as soon as the file
+        is written
+        '''
+        if self._mbtiles is not None:
+            raise ValueError("tiles inside a MBTiles file can only be written using their zoom, x and y")
+
+        return self._submit(filename, None, image)
+
+    def write(self, zoom, xtile, ytile, image):
+        if self._mbtiles is not None:
+            return self._submit(None, (zoom, xtile, ytile), image)
+
+        return self._submit(self.get_tile_filename(zoom, xtile, ytile), None, image)
+
+    def read(self, zoom, xtile, ytile, flush=True):
+        '''
+        returns a tile which was written before (or None), after all pending writes are finished. Without flush, tiles
+        which are still pending may be returned in their old state (e.g. for tiles which were written by previous runs).
+        '''
+        if flush:
+            self.flush()
+
+        if self._mbtiles is not None:
+            data = self._mbtiles.get(zoom, xtile, ytile)
+            image = Image.open(io.BytesIO(data)) if data is not None else None
+        else:
+            filename = self.get_tile_filename(zoom, xtile, ytile)
+            image = Image.open(filename) if os.path.isfile(filename) else None
+
+        if image is not None:
+            image.load()
+        return image
+
+    def get_backlog(self):
+        with self._backlog_lock:
+            return self._backlog
+
+    def flush(self):
+        '''
+        wait until all submitted tiles are written
+        '''
+        with self._backlog_lock:
+            while self._backlog > 0:
+                self._backlog_lock.wait()
+
+    def get_dedup_ratio(self):
+        '''
+        fraction of the tiles written by this writer which did not require to store their content again
+        '''
+        with self._counters_lock:
+            written = self._counters['written']
+            return self._counters['deduplicated'] / written if written else 0.
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+        if self._dedup:
+            # the report contains the ratio of all writers of this run
+            written = metrics.get_counter('tiles_written')
+            metrics.gauge('dedup_ratio', metrics.get_counter('tiles_deduplicated') / written if written else 0.)
+
+            with self._counters_lock:
+                counters = dict(self._counters)
+            print("deduplicated {0} of {1} tiles ({2:.1%}), {3} of them uniform{4}".format(
+                counters['deduplicated'], counters['written'], self.get_dedup_ratio(), counters['uniform'],
+                ": {0}".format(self._output_dir) if self._output_dir else ""))
+
+        if self._mbtiles is not None:
+            self._mbtiles.close()
+
+
+class JournalBatch(object):
+    '''
+    marks a batch as done inside the job journal, as soon as all of its tasks are finished.
+
+    Tasks are futures. When a task returns a future (e.g. the write of its result), this one is part of the batch too.
+    '''
+    def __init__(self, journal, kind, key):
+        self._journal = journal
+        self._kind = kind
+        self._key = key
+        self._remaining = 1  # closing the batch counts as task, so it cannot finish while tasks are added
+        self._failed = False
+        self._lock = threading.Lock()
+
+        self._journal.mark_running(self._kind, self._key)
+
+    def add(self, future):
+        with self._lock:
+            self._remaining += 1
+        future.add_done_callback(self._task_done)
+
+    def close(self):
+        self._task_done(None)
+
+    def _task_done(self, future):
+        if future is not None:
+            if future.exception() is not None:
+                logger.error("{0} {1} failed: {2}".format(self._kind, self._key, future.exception()))
+                with self._lock:
+                    self._failed = True
+            elif isinstance(future.result(), Future):
+                self.add(future.result())
+
+        with self._lock:
+            self._remaining -= 1
+            finished = self._remaining == 0
+
+        if finished and self._failed:
+            self._journal.mark_failed(self._kind, self._key)
+        elif finished:
+            self._journal.mark_done(self._kind, self._key)
+
+
+def add_tile_writer_arguments(parser, mbtiles=False):
+    parser.add_argument('--io-threads', dest='iothreads', type=check_thread_count, default=4, help='number of threads which encode and write tiles (default 4)')
+    parser.add_argument('--dedup', help='store identical tiles only once (as hardlinks)', action='store_true')
+    if mbtiles:
+        parser.add_argument('--mbtiles', dest='mbtilesfile', help='store the tiles inside this MBTiles file instead of the output directory')
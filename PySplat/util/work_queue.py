@@ -0,0 +1,208 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import json
+import logging
+import os
+import socket
+import time
+
+from PySplat.util.atomic_file import write_file_atomic
+
+
+logger = logging.getLogger(__name__)
+
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _get_item_id(filename):
+    # leased items are called <item_id>@<worker_id>.json
+    return filename[:-len('.json')].split('@')[0]
+
+
+def get_worker_id():
+    return "{0}-{1}".format(socket.gethostname(), os.getpid())
+
+
+class WorkLease(object):
+    def __init__(self, item_id, filename, item):
+        self.item_id = item_id
+        self.filename = filename
+        self.item = item
+
+
+class WorkQueue(object):
+    '''
+    work queue inside a shared directory (e.g. NFS), which can be used by any number of workers on different hosts.
+
+    Every work item is a json file, and its state is the directory it is stored in. Workers claim an item by renaming
+    it from pending/ to leased/, which is atomic even on NFS, so every item is only leased by a single worker. While
+    working, the worker updates the mtime of its lease (heartbeat). Leases which were not updated for lease_timeout
+    seconds belong to dead workers, and are put back into pending/ by requeue_expired.
+
+    The clocks of all hosts have to be synchronized (e.g. using NTP), because the mtime is compared to the local time.
+    '''
+    def __init__(self, queue_dir, lease_timeout=120., max_attempts=3):
+        self.queue_dir = queue_dir
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+
+        for state in (PENDING, LEASED, DONE, FAILED):
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def _get_path(self, state, filename):
+        return os.path.join(self.queue_dir, state, filename)
+
+    def _list(self, state):
+        return sorted(filename for filename in os.listdir(os.path.join(self.queue_dir, state)) if filename.endswith('.json'))
+
+    def _get_known_items(self):
+        return set(_get_item_id(filename) for state in (PENDING, LEASED, DONE, FAILED) for filename in self._list(state))
+
+    def put(self, item_id, item):
+        return self.put_all([(item_id, item)]) == 1
+
+    def put_all(self, items):
+        '''
+        add (item_id, item) pairs, items which are already known (e.g. done by a previous run) are skipped.
+        Returns the number of added items.
+        '''
+        known_items = self._get_known_items()
+
+        added = 0
+        for (item_id, item) in items:
+            if item_id in known_items:
+                continue
+
+            item = dict(item, attempts=0)
+            write_file_atomic(self._get_path(PENDING, item_id + '.json'), json.dumps(item).encode('utf-8'))
+            added += 1
+
+        return added
+
+    def lease(self, worker_id):
+        '''
+        claim the next pending item, returns None if there is none
+        '''
+        for filename in self._list(PENDING):
+            item_id = filename[:-len('.json')]
+            pending_file = self._get_path(PENDING, filename)
+            leased_file = self._get_path(LEASED, "{0}@{1}.json".format(item_id, worker_id))
+
+            try:
+                # renaming keeps the mtime, so the lease would look expired without refreshing it first
+                os.utime(pending_file, None)
+                os.rename(pending_file, leased_file)
+            except FileNotFoundError:
+                continue  # another worker was faster
+
+            with open(leased_file, "r") as file:
+                item = json.load(file)
+
+            logger.debug("{0} leased {1}".format(worker_id, item_id))
+            return WorkLease(item_id, leased_file, item)
+
+        return None
+
+    def heartbeat(self, lease):
+        '''
+        extend the lease, returns False if it was lost (because it was expired and put back into the queue)
+        '''
+        try:
+            os.utime(lease.filename, None)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, lease):
+        try:
+            os.rename(lease.filename, self._get_path(DONE, lease.item_id + '.json'))
+        except FileNotFoundError:
+            logger.warning("lease of {0} was lost, but the work is done anyway".format(lease.item_id))
+
+    def _requeue(self, item_id, leased_file, item):
+        item['attempts'] = item.get('attempts', 0) + 1
+        state = PENDING if item['attempts'] < self.max_attempts else FAILED
+
+        write_file_atomic(self._get_path(state, item_id + '.json'), json.dumps(item).encode('utf-8'))
+        try:
+            os.remove(leased_file)
+        except FileNotFoundError:
+            pass
+
+        return state
+
+    def fail(self, lease):
+        '''
+        put a failed item back into the queue, unless the lease was already lost (and the item requeued by someone else)
+        '''
+        try:
+            # claim our own lease first, so an item which expired meanwhile is not requeued twice
+            failed_file = lease.filename + '.failed'
+            os.rename(lease.filename, failed_file)
+        except FileNotFoundError:
+            logger.warning("lease of {0} was lost, the failure is not recorded".format(lease.item_id))
+            return None
+
+        state = self._requeue(lease.item_id, failed_file, lease.item)
+        logger.warning("{0} failed (attempt {1}), moved to {2}".format(lease.item_id, lease.item['attempts'], state))
+        return state
+
+    def requeue_expired(self):
+        '''
+        put items of dead workers back into the queue, returns the number of requeued items
+        '''
+        requeued = 0
+        now = time.time()
+
+        for filename in self._list(LEASED):
+            leased_file = self._get_path(LEASED, filename)
+            item_id = _get_item_id(filename)
+
+            try:
+                if now - os.path.getmtime(leased_file) < self.lease_timeout:
+                    continue
+
+                # claim the expired lease first, so it is only requeued once
+                expired_file = leased_file + '.expired'
+                os.rename(leased_file, expired_file)
+            except FileNotFoundError:
+                continue
+
+            with open(expired_file, "r") as file:
+                item = json.load(file)
+
+            state = self._requeue(item_id, expired_file, item)
+            logger.warning("lease of {0} expired, moved to {1}".format(filename[:-len('.json')], state))
+            requeued += 1
+
+        return requeued
+
+    def get_counts(self):
+        return {state: len(self._list(state)) for state in (PENDING, LEASED, DONE, FAILED)}
+
+    def is_empty(self):
+        counts = self.get_counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def get_failed(self):
+        return [filename[:-len('.json')] for filename in self._list(FAILED)]
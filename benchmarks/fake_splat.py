@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+# stand-in for the splat executable, which writes a synthetic coverage map instead of doing real RF calculations.
+#
+# Put it in front of PATH (named "splat") to run PySplat without SRTM data and a SPLAT install. The environment
+# variables PYSPLAT_FAKE_SPLAT_SHAPE and PYSPLAT_FAKE_SPLAT_DELAY (seconds) can be used to change the generated
+# coverage shape and to simulate the calculation time of SPLAT.
+
+import sys, os
+import math
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../")) # enable package import from parent directory
+
+from benchmarks.synthetic import generate_coverage_map
+
+
+def get_option(argv, name, default=None):
+    if name in argv and argv.index(name) + 1 < len(argv):
+        return argv[argv.index(name) + 1]
+    return default
+
+
+def parse_qth_file(qth_file):
+    with open(qth_file, "r") as file:
+        lines = [line.strip() for line in file.readlines()]
+
+    # SPLAT stores the longitude in degrees west
+    return (lines[0], float(lines[1]), -float(lines[2]))
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+
+    qth_file = get_option(argv, '-t')
+    output_file = get_option(argv, '-o')
+
+    if qth_file is None or output_file is None:
+        print("usage: splat -t txsite.qth -o output.ppm [-R range] [-hd] ...")
+        sys.exit(1)
+
+    (name, lat, lon) = parse_qth_file(qth_file)
+    range_km = float(get_option(argv, '-R', 100))
+
+    # SPLAT always renders whole degrees
+    degrees = 2 * math.ceil(range_km / 111.)
+    size = int(degrees * (3600 if '-hd' in argv else 1200))
+
+    time.sleep(float(os.environ.get('PYSPLAT_FAKE_SPLAT_DELAY', 0)))
+
+    if not output_file.endswith('.ppm'):
+        output_file += '.ppm'
+
+    generate_coverage_map(output_file, size, os.environ.get('PYSPLAT_FAKE_SPLAT_SHAPE', 'circle'),
+                          round(lat), round(lon), degrees)
+
+    # SPLAT writes a site report into the working directory
+    qth_filename = os.path.splitext(os.path.basename(qth_file))[0]
+    with open("{0}-site_report.txt".format(qth_filename), "w") as file:
+        file.write("site report of {0} (generated by fake splat)\n".format(name))
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import argparse, sys, os
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from benchmarks.synthetic import generate_coverage_map, SHAPES
+
+
+_benchmarks = {}
+
+
+def benchmark(name):
+    def register(function):
+        _benchmarks[name] = function
+        return function
+    return register
+
+
+def load_site(work_dir, name, params, lon_offset=0.):
+    '''
+    generate a synthetic site, returns the loaded map and its geo data
+    '''
+    from PIL import Image
+    from PySplat.util.geo_file import parse_geo_file
+
+    (ppm_file, geo_file) = generate_coverage_map(os.path.join(work_dir, name + ".ppm"), params.size, params.shape,
+                                                 lon=14.5 + lon_offset)
+    rf_img = Image.open(ppm_file)
+    rf_img.load()
+    return (rf_img, parse_geo_file(geo_file))
+
+
+def split_loaded_site(rf_img, geo_data, tile_dir, zoom_levels):
+    from PySplat.pysplat_split import create_tile, get_tile_range
+
+    for zoom in zoom_levels:
+        (xtile_start, ytile_start, xtile_end, ytile_end) = get_tile_range(geo_data, zoom)
+        for xtile in range(xtile_start, xtile_end + 1):
+            for ytile in range(ytile_start, ytile_end + 1):
+                create_tile(xtile, ytile, tile_dir, zoom, rf_img, geo_data)
+
+
+def split_site(work_dir, name, params, zoom_levels, lon_offset=0.):
+    '''
+    generate a synthetic site and split it into tiles (used as setup by other benchmarks)
+    '''
+    (rf_img, geo_data) = load_site(work_dir, name, params, lon_offset)
+    tile_dir = os.path.join(work_dir, name)
+    split_loaded_site(rf_img, geo_data, tile_dir, zoom_levels)
+    return (tile_dir, count_files(tile_dir))
+
+
+def count_files(directory, extension='.png'):
+    return sum(len([f for f in files if f.endswith(extension)]) for (_, _, files) in os.walk(directory))
+
+
+@benchmark('create_tile')
+def benchmark_create_tile(work_dir, params):
+    # only splitting is measured, and only tiles which were written are counted (blank ones are skipped)
+    (rf_img, geo_data) = load_site(work_dir, 'site', params)
+    tile_dir = os.path.join(work_dir, 'site')
+
+    start = time.perf_counter()
+    split_loaded_site(rf_img, geo_data, tile_dir, range(params.zoom - 2, params.zoom + 1))
+    seconds = time.perf_counter() - start
+
+    return {'items': count_files(tile_dir), 'unit': 'tiles', 'seconds': seconds}
+
+
+def _benchmark_merge(work_dir, params, tile_merger):
+    from PySplat.pysplat_merge import merge_maps
+
+    # overlapping sites, so most tiles really have to be merged
+    tile_dirs = [split_site(work_dir, 'site{0}'.format(i), params, [params.zoom], lon_offset=i * 0.25)[0]
+                 for i in range(params.sites)]
+    output_dir = os.path.join(work_dir, 'merged')
+    os.makedirs(output_dir)
+
+    start = time.perf_counter()
+    merge_maps(tile_dirs, output_dir, tile_merger)
+    tile_merger.wait_until_empty()
+    tile_merger.shutdown()
+    return {'items': count_files(output_dir), 'unit': 'tiles', 'seconds': time.perf_counter() - start}
+
+
+def _benchmark_merge_backend(work_dir, params, backend):
+    from PySplat.util.backends import is_backend_available, load_backend
+    from PySplat.util.scf_file import default_scf_data, get_sorted_pixel_order
+
+    if not is_backend_available('merge', backend):
+        return None  # not available on this machine
+
+    tile_merger = load_backend('merge', backend)(get_sorted_pixel_order(default_scf_data), params.threads)
+    return _benchmark_merge(work_dir, params, tile_merger)
+
+
+@benchmark('merge')
+def benchmark_merge(work_dir, params):
+    return _benchmark_merge_backend(work_dir, params, 'python')
+
+
+@benchmark('merge_numpy')
+def benchmark_merge_numpy(work_dir, params):
+    return _benchmark_merge_backend(work_dir, params, 'numpy')
+
+
+@benchmark('merge_opencl')
+def benchmark_merge_opencl(work_dir, params):
+    return _benchmark_merge_backend(work_dir, params, 'opencl')
+
+
+@benchmark('downsample')
+def benchmark_downsample(work_dir, params):
+    from PySplat.pysplat_downsample import start_downsampling
+
+    (tile_dir, _) = split_site(work_dir, 'site', params, [params.zoom])
+    zoom_levels = list(range(params.zoom - 4, params.zoom))
+
+    start = time.perf_counter()
+    start_downsampling(tile_dir, params.zoom, zoom_levels)
+    return {'items': count_files(tile_dir) - count_files(os.path.join(tile_dir, str(params.zoom))),
+            'unit': 'tiles', 'seconds': time.perf_counter() - start}
+
+
+@benchmark('run_splat')
+def benchmark_run_splat(work_dir, params):
+    from PySplat.pysplat import get_qth_files, render_site
+    from PySplat.util.job_journal import JobJournal
+
+    # put our fake splat in front of PATH
+    bin_dir = os.path.join(work_dir, 'bin')
+    os.makedirs(bin_dir)
+    os.symlink(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fake_splat.py'), os.path.join(bin_dir, 'splat'))
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    os.environ['PYSPLAT_FAKE_SPLAT_SHAPE'] = params.shape
+
+    qth_files = []
+    for i in range(params.sites):
+        qth_file = os.path.join(work_dir, 'SITE{0}.qth'.format(i))
+        with open(qth_file, "w") as file:
+            file.write("SITE{0}\n48.5\n-{1}\n10m\n".format(i, 14.5 + i * 0.25))
+        qth_files.append(qth_file)
+
+    output_dir = os.path.join(work_dir, 'rendered')
+    journal = JobJournal(output_dir)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=params.threads) as executor:
+        futures = [executor.submit(render_site, qth, './srtm', output_dir, journal) for qth in get_qth_files(qth_files)]
+    for future in futures:
+        future.result()
+    seconds = time.perf_counter() - start
+
+    # render_site does not raise when SPLAT fails, so check that every site was rendered
+    rendered = count_files(output_dir, '.ppm')
+    if rendered != len(qth_files):
+        raise RuntimeError("only {0} of {1} sites were rendered".format(rendered, len(qth_files)))
+    return {'items': rendered, 'unit': 'sites', 'seconds': seconds}
+
+
+def run_single_benchmark(name, params):
+    from PySplat.util.instrumentation import get_peak_rss
+
+    work_dir = tempfile.mkdtemp("_pysplat_benchmark")
+    try:
+        result = _benchmarks[name](work_dir, params)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if result is not None:
+        result['items_per_second'] = result['items'] / result['seconds'] if result['seconds'] else None
+        result['peak_rss'] = get_peak_rss()
+    return result
+
+
+def run_benchmark(name, params):
+    '''
+    run every benchmark in a fresh process, so the peak memory usage is measured for this benchmark only
+    '''
+    results = []
+    for _ in range(params.repeat):
+        with tempfile.NamedTemporaryFile(suffix=".json") as result_file:
+            call = [sys.executable, os.path.realpath(__file__), '--single', name, '--output', result_file.name,
+                    '--size', str(params.size), '--shape', params.shape, '--zoom', str(params.zoom),
+                    '--sites', str(params.sites), '-y', str(params.threads)]
+            subprocess.check_call(call)
+            with open(result_file.name, "r") as file:
+                result = json.load(file)
+
+        if result is None:
+            return None
+        results.append(result)
+
+    # the fastest run is the one with the least noise
+    best = min(results, key=lambda r: r['seconds'])
+    best['runs'] = [r['seconds'] for r in results]
+    return best
+
+
+def get_version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.realpath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(old_results, new_results):
+    print("{0:<15} {1:>14} {2:>14} {3:>8} {4:>12} {5:>12}".format('benchmark', 'old items/s', 'new items/s', 'ratio',
+                                                                    'old rss MB', 'new rss MB'))
+    for name, new in sorted(new_results['benchmarks'].items()):
+        old = old_results['benchmarks'].get(name)
+        if not old or not new:
+            continue
+        print("{0:<15} {1:>14.2f} {2:>14.2f} {3:>8.2f} {4:>12.1f} {5:>12.1f}".format(
+            name, old['items_per_second'], new['items_per_second'], new['items_per_second'] / old['items_per_second'],
+            (old['peak_rss'] or 0) / 2**20, (new['peak_rss'] or 0) / 2**20))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('benchmarks', nargs='*', help='benchmarks to run (default: all of {0})'.format(', '.join(sorted(_benchmarks))))
+    parser.add_argument('--output', default='benchmark_results.json', help='file where the results are stored as JSON')
+    parser.add_argument('--compare', help='results of a previous run which should be compared to this run')
+    parser.add_argument('--size', type=int, default=1200, help='size of the synthetic coverage maps (default 1200)')
+    parser.add_argument('--shape', choices=SHAPES, default='circle', help='shape of the synthetic coverage maps')
+    parser.add_argument('--zoom', type=int, default=10, help='zoom level the benchmarks are working on (default 10)')
+    parser.add_argument('--sites', type=int, default=3, help='number of sites used by merge and run_splat')
+    parser.add_argument('--repeat', type=int, default=1, help='number of runs per benchmark (the fastest one is reported)')
+    parser.add_argument('-y', dest='threads', type=int, default=1, help='number of threads')
+    parser.add_argument('--single', help=argparse.SUPPRESS)  # used internally to run a benchmark in a child process
+
+    args = parser.parse_args()
+
+    if args.single:
+        with open(args.output, "w") as file:
+            json.dump(run_single_benchmark(args.single, args), file)
+        sys.exit(0)
+
+    names = args.benchmarks or sorted(_benchmarks)
+    for name in names:
+        if name not in _benchmarks:
+            print("unknown benchmark: {0}".format(name))
+            sys.exit(1)
+
+    results = {'version': get_version(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'parameters': {'size': args.size, 'shape': args.shape, 'zoom': args.zoom, 'sites': args.sites,
+                              'threads': args.threads},
+               'benchmarks': {}}
+
+    for name in names:
+        print("run benchmark: {0}".format(name))
+        result = run_benchmark(name, args)
+        results['benchmarks'][name] = result
+
+        if result is None:
+            print("  not available on this system")
+        else:
+            print("  {0} {1} in {2:.3f}s ({3:.2f} {1}/s, peak rss {4:.1f} MB)".format(
+                result['items'], result['unit'], result['seconds'], result['items_per_second'],
+                (result['peak_rss'] or 0) / 2**20))
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+    print("results written to: {0}".format(args.output))
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare_results(json.load(file), results)
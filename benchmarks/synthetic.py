@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+
+import argparse, sys, os
+import math
+import numpy
+
+sys.path.append(os.path.join(sys.path[0], "../")) # enable package import from parent directory
+
+from PySplat.util.scf_file import default_scf_data
+
+
+SHAPES = ('circle', 'sector', 'noise', 'blank')
+
+
+def get_signal_levels(size, shape, seed=0):
+    '''
+    returns a float array with the normalized signal level (1 = strongest, 0 = no coverage) of every pixel
+    '''
+    y, x = numpy.mgrid[0:size, 0:size].astype(numpy.float32)
+    center = (size - 1) / 2.
+    distance = numpy.hypot(x - center, y - center) / (size / 2.)
+
+    if shape == 'blank':
+        return numpy.zeros((size, size), dtype=numpy.float32)
+
+    level = 1. - distance
+
+    if shape == 'sector':
+        # directional antenna, pointing to the north east
+        angle = numpy.arctan2(center - y, x - center)
+        level -= 0.6 * (1. - numpy.cos(angle - math.pi / 4)) / 2.
+    elif shape == 'noise':
+        # terrain shadows, which results in many small areas
+        random = numpy.random.RandomState(seed)
+        noise = random.uniform(-0.15, 0.15, size=(size // 16 + 1, size // 16 + 1)).astype(numpy.float32)
+        level += numpy.kron(noise, numpy.ones((16, 16), dtype=numpy.float32))[:size, :size]
+
+    return level
+
+
+def generate_coverage_image(size, shape, scf_data=default_scf_data, seed=0):
+    '''
+    create a RGB array like SPLAT would render it: white where no coverage was calculated, and the SCF colors inside
+    '''
+    level = get_signal_levels(size, shape, seed)
+
+    image = numpy.full((size, size, 3), 255, dtype=numpy.uint8)
+
+    levels = sorted(scf_data.items())  # weakest first, stronger levels overwrite weaker ones
+    for i, (dbuv, color) in enumerate(levels):
+        threshold = float(i + 1) / (len(levels) + 1)
+        image[level >= threshold] = [int(c) for c in color]
+
+    return image
+
+
+def write_ppm(filename, image):
+    with open(filename, "wb") as file:
+        file.write("P6\n{0} {1}\n255\n".format(image.shape[1], image.shape[0]).encode('ascii'))
+        file.write(numpy.ascontiguousarray(image).tobytes())
+
+
+def write_geo(filename, ppm_filename, lat_start, lon_start, lat_end, lon_end, size):
+    with open(filename, "w") as file:
+        file.write("FILENAME\t{0}\n".format(os.path.basename(ppm_filename)))
+        file.write("#\t\tX\tY\tLong\t\tLat\n")
+        file.write("TIEPOINT\t0\t0\t{0:.3f}\t\t{1:.3f}\n".format(lon_start, lat_start))
+        file.write("TIEPOINT\t{0}\t{0}\t{1:.3f}\t\t{2:.3f}\n".format(size - 1, lon_end, lat_end))
+        file.write("IMAGESIZE\t{0}\t{0}\n".format(size))
+        file.write("#\n# Auto Generated by PySplat benchmarks\n#\n")
+
+
+def generate_coverage_map(ppm_filename, size, shape='circle', lat=48.5, lon=14.5, degrees=1., **kwargs):
+    '''
+    write a synthetic SPLAT output (.ppm and .geo) centered at lat/lon which covers degrees x degrees
+    '''
+    image = generate_coverage_image(size, shape, kwargs.get('scf_data', default_scf_data), kwargs.get('seed', 0))
+    write_ppm(ppm_filename, image)
+
+    geo_filename = os.path.splitext(ppm_filename)[0] + ".geo"
+    write_geo(geo_filename, ppm_filename,
+              lat + degrees / 2., lon - degrees / 2., lat - degrees / 2., lon + degrees / 2., size)
+
+    return (ppm_filename, geo_filename)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('outputfile', help='.ppm file to generate (the .geo file is stored next to it)')
+    parser.add_argument('--size', type=int, default=1200, help='width and height of the image in pixel (default 1200)')
+    parser.add_argument('--shape', choices=SHAPES, default='circle', help='shape of the coverage area')
+    parser.add_argument('--lat', type=float, default=48.5, help='latitude of the image center')
+    parser.add_argument('--lon', type=float, default=14.5, help='longitude of the image center')
+    parser.add_argument('--degrees', type=float, default=1., help='width and height of the covered area in degrees')
+    parser.add_argument('--seed', type=int, default=0, help='seed used for the noise shape')
+
+    args = parser.parse_args()
+
+    generate_coverage_map(args.outputfile, args.size, args.shape, args.lat, args.lon, args.degrees, seed=args.seed)
@@ -0,0 +1,139 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+# compares the tiles merged by OpenCL with the ones of the python implementation, pixel by pixel. PoCL is used when it
+# is installed (pip install pyopencl[pocl]), so this also runs on hosts without GPU.
+
+import os
+import random
+from types import SimpleNamespace
+
+import pytest
+
+cl = pytest.importorskip('pyopencl')
+
+from PIL import Image
+
+from benchmarks.run_benchmarks import split_site
+from PySplat.pysplat_merge import merge_maps
+from PySplat.util.backends import load_backend
+from PySplat.util.scf_file import default_scf_data, get_sorted_pixel_order
+
+
+IMAGE_ORDER = get_sorted_pixel_order(default_scf_data)
+
+
+def _get_platform_index():
+    try:
+        platforms = cl.get_platforms()
+    except cl.Error:
+        return None  # no OpenCL implementation (ICD) installed
+
+    with_devices = [index for (index, platform) in enumerate(platforms) if platform.get_devices()]
+    for index in with_devices:
+        if 'Portable Computing Language' in platforms[index].name:
+            return index
+    return with_devices[0] if with_devices else None
+
+
+@pytest.fixture
+def merger_classes(monkeypatch):
+    index = _get_platform_index()
+    if index is None:
+        pytest.skip('no OpenCL device available')
+    monkeypatch.setenv('PYOPENCL_CTX', str(index))
+
+    return (load_backend('merge', 'python'), load_backend('merge', 'opencl'))
+
+
+def get_random_tiles(count, size, seed):
+    '''
+    tiles with random pixels: SCF colors, transparent, white, black and colors which are not part of the SCF
+    '''
+    generator = random.Random(seed)
+    palette = list(IMAGE_ORDER) + [(255, 255, 255, 0), (255, 255, 255, 255), (0, 0, 0, 255), (1, 2, 3, 255), (10, 20, 30, 0)]
+
+    tiles = []
+    for _ in range(count):
+        tile = Image.new('RGBA', (size, size))
+        tile.putdata([generator.choice(palette) for _ in range(size * size)])
+        tiles.append(tile)
+    return tiles
+
+
+@pytest.mark.parametrize('source_count', [1, 2, 3, 5, 8])
+@pytest.mark.parametrize('size', [16, 256])
+def test_random_tiles(merger_classes, source_count, size):
+    (reference_class, merger_class) = merger_classes
+    reference = reference_class(IMAGE_ORDER, 1)
+    tile_merger = merger_class(IMAGE_ORDER, 1)
+
+    try:
+        tiles = get_random_tiles(source_count, size, source_count * size)
+        expected = reference.merge_loaded_images([tile.copy() for tile in tiles])
+        assert tile_merger.merge_loaded_images(tiles).tobytes() == expected.tobytes()
+    finally:
+        reference.shutdown()
+        tile_merger.shutdown()
+
+
+def test_rgb_sources(merger_classes):
+    (reference_class, merger_class) = merger_classes
+    reference = reference_class(IMAGE_ORDER, 1)
+    tile_merger = merger_class(IMAGE_ORDER, 1)
+
+    try:
+        # the mode of the sources should not matter
+        tiles = [tile.convert('RGB') for tile in get_random_tiles(3, 64, 0)]
+        expected = reference.merge_loaded_images([tile.convert('RGBA') for tile in tiles])
+        assert tile_merger.merge_loaded_images(tiles).tobytes() == expected.tobytes()
+    finally:
+        reference.shutdown()
+        tile_merger.shutdown()
+
+
+def test_merge_maps(merger_classes, tmp_path):
+    '''
+    merge overlapping synthetic sites using the batched path (submit_merge_images), and compare every tile
+    '''
+    (reference_class, merger_class) = merger_classes
+    params = SimpleNamespace(size=600, shape='noise', zoom=9)
+
+    tile_dirs = [split_site(str(tmp_path), 'site{0}'.format(i), params, [params.zoom], lon_offset=i * 0.25)[0]
+                 for i in range(3)]
+
+    # a small batch size, so multiple batches are merged
+    output_dirs = {}
+    for name, tile_merger in (('reference', reference_class(IMAGE_ORDER, 2)),
+                              ('opencl', merger_class(IMAGE_ORDER, 2, batch_size=4))):
+        output_dirs[name] = str(tmp_path / name)
+        os.makedirs(output_dirs[name])
+        merge_maps(tile_dirs, output_dirs[name], tile_merger)
+        tile_merger.wait_until_empty()
+        tile_merger.shutdown()
+
+    def get_tiles(directory):
+        return sorted(os.path.relpath(os.path.join(path, filename), directory)
+                      for (path, _, filenames) in os.walk(directory) for filename in filenames if filename.endswith('.png'))
+
+    tiles = get_tiles(output_dirs['reference'])
+    assert tiles and tiles == get_tiles(output_dirs['opencl'])
+
+    for tile in tiles:
+        expected = Image.open(os.path.join(output_dirs['reference'], tile)).convert('RGBA')
+        result = Image.open(os.path.join(output_dirs['opencl'], tile)).convert('RGBA')
+        assert result.tobytes() == expected.tobytes(), tile
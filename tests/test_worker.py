@@ -0,0 +1,89 @@
+'''
+pysplat is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+pysplat is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with kicad-footprint-generator. If not, see < http://www.gnu.org/licenses/ >.
+
+(C) 2016 by Thomas Pointhuber, <thomas.pointhuber@gmx.at>
+'''
+
+# runs the coordinator with local workers against the fake splat (benchmarks/fake_splat.py), and kills a worker while
+# it renders a site. Its work item has to be given to the other worker, and the coordinator has to finish anyway.
+
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SITES = ('OE5XGL', 'OE1XKU')
+
+
+def _wait_for_lease(leased_dir, coordinator, timeout=60.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        assert coordinator.poll() is None, 'coordinator exited before a worker leased any work'
+        leases = [filename for filename in os.listdir(leased_dir) if filename.endswith('.json')] if os.path.isdir(leased_dir) else []
+        if leases:
+            return leases[0]
+        time.sleep(0.05)
+    raise AssertionError('no work item was leased within {0} seconds'.format(timeout))
+
+
+def test_coordinator_survives_killed_worker(tmp_path):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    os.symlink(os.path.join(ROOT_DIR, 'benchmarks', 'fake_splat.py'), str(bin_dir / 'splat'))
+
+    qth_dir = tmp_path / 'qth'
+    qth_dir.mkdir()
+    for site in SITES:
+        for extension in ('.qth', '.lrp'):
+            shutil.copy(os.path.join(ROOT_DIR, 'example', 'qth', site + extension), str(qth_dir))
+
+    queue_dir = tmp_path / 'queue'
+    output_dir = tmp_path / 'out'
+
+    env = dict(os.environ, PATH=str(bin_dir) + os.pathsep + os.environ.get('PATH', ''), PYSPLAT_FAKE_SPLAT_DELAY='2')
+    coordinator = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT_DIR, 'PySplat', 'pysplat_worker.py'), 'coordinator', str(queue_dir)] +
+        [str(qth_dir / (site + '.qth')) for site in SITES] +
+        [str(output_dir), '--srtm', str(tmp_path), '-R', '20', '-z', '7', '--downsample', '6', '--local-workers', '2',
+         '--lease-timeout', '2', '--poll-interval', '0.2'],
+        cwd=str(tmp_path), env=env)
+
+    try:
+        # leases are called <item_id>@<hostname>-<pid>.json
+        lease = _wait_for_lease(str(queue_dir / 'leased'), coordinator)
+        killed_item = lease.split('@')[0]
+        os.kill(int(lease[:-len('.json')].rsplit('-', 1)[1]), signal.SIGKILL)
+
+        assert coordinator.wait(timeout=120) == 0
+    finally:
+        if coordinator.poll() is None:
+            coordinator.kill()
+            coordinator.wait()
+
+    with open(str(queue_dir / 'finished'), "r") as file:
+        assert json.load(file) == {'success': True}
+
+    # the item of the killed worker was requeued once, and then done by the other worker
+    with open(str(queue_dir / 'done' / (killed_item + '.json')), "r") as file:
+        assert json.load(file)['attempts'] == 1
+    assert not os.listdir(str(queue_dir / 'failed'))
+
+    for zoom in (6, 7):
+        tiles = [filename for (_, _, filenames) in os.walk(str(output_dir / str(zoom))) for filename in filenames]
+        assert tiles and all(filename.endswith('.png') for filename in tiles)